@@ -0,0 +1,46 @@
+from fractions import Fraction
+
+
+class YieldAccumulator:
+    '''
+    YieldAccumulator class.
+
+    Running sum of float yields kept exactly as an integer count of 2^-1074 units (smallest float step),
+    so adding & subtracting values in any order never drifts and rounding is done on the exact sum.
+    '''
+
+    __slots__ = ('units',)
+
+    # every finite float is an integer multiple of 2^-1074.
+    SCALE_BITS = 1074
+
+    def __init__(self):
+        self.units = 0
+
+    def add(self, value):
+        '''
+        add value to the running sum in O(1).
+
+        :param value: float, value to add, negative to take a value out.
+        '''
+        numerator, denominator = value.as_integer_ratio()
+        self.units += numerator << (self.SCALE_BITS - denominator.bit_length() + 1)
+
+    def subtract(self, value):
+        '''
+        take value back out of the running sum in O(1).
+
+        :param value: float, value previously added.
+        '''
+        self.add(-value)
+
+    def get_value(self):
+        ''' :return: float, exact sum correctly rounded to float. '''
+        return self.units / (1 << self.SCALE_BITS)
+
+    def get_rounded(self):
+        ''' :return: int, exact sum rounded half to even like round(). '''
+        return round(Fraction(self.units, 1 << self.SCALE_BITS))
+
+    def __repr__(self):
+        return f'YieldAccumulator [value:{self.get_value()}]'
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from fund import assign_objects, get_files, write
+from generate import BookGenerator
+from profiler import Profiler, phase
+
+PHASES = ['load', 'covenants', 'assign', 'write']
+
+
+def peak_rss():
+    ''' :return: float, peak resident set size of this process in MB, None where unavailable. '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere.
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+
+def run_phases(file_dir):
+    '''
+    run fund.py's object engine over file_dir timing its phases, outputs go to a temporary directory.
+
+    :param file_dir: str, input directory.
+    :return: dict, seconds per phase, loan count, unassigned loan count & peak RSS in MB.
+    '''
+    # phase timing only, hot path counters would slow down the code being measured.
+    profiler = Profiler()
+    profiler.install(namespace=None)
+    try:
+        assignments, yields = assign_objects(file_dict=get_files(input_dir=file_dir))
+        with tempfile.TemporaryDirectory() as output_dir, phase('write'):
+            write(file_dir=output_dir, file_name='assignments.csv', header='loan_id,facility_id',
+                  data_list=assignments)
+            write(file_dir=output_dir, file_name='yields.csv', header='facility_id,expected_yield',
+                  data_list=yields)
+    finally:
+        profiler.uninstall()
+
+    return {'seconds': {name: profiler.seconds[name] for name in PHASES},
+            'loans': len(assignments),
+            'unassigned': sum(1 for _, facility_id in assignments if not facility_id),
+            'peak_rss_mb': peak_rss()}
+
+
+def benchmark(generator, repeat=3):
+    '''
+    generate a book & time every phase, each repetition in a fresh process so peak RSS is its own.
+
+    :param generator: BookGenerator, book shape.
+    :param repeat: int, number of repetitions, fastest time per phase is kept.
+    :return: dict, history record.
+    '''
+    with tempfile.TemporaryDirectory() as file_dir:
+        generator.write(file_dir=file_dir)
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                runs.append(executor.submit(run_phases, file_dir).result())
+
+    phases = {}
+    for name in PHASES:
+        seconds = min(run['seconds'][name] for run in runs)
+        phases[name] = {'seconds': seconds,
+                        'loans_per_second': runs[0]['loans'] / seconds if seconds > 0 else None}
+
+    rss = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb'] is not None]
+    return {'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'config': {'loans': generator.loan_count,
+                       'facilities': generator.facility_count,
+                       'banks': generator.bank_count,
+                       'covenant_density': generator.covenant_density,
+                       'skew': generator.skew,
+                       'capacity_ratio': generator.capacity_ratio,
+                       'seed': generator.seed},
+            'phases': phases,
+            'total_seconds': sum(timing['seconds'] for timing in phases.values()),
+            'unassigned': runs[0]['unassigned'],
+            'peak_rss_mb': max(rss) if rss else None}
+
+
+def regressions(record, history, max_regression):
+    '''
+    :param record: dict, new history record.
+    :param history: list of earlier history records.
+    :param max_regression: float, tolerated throughput drop as a fraction of the previous record.
+    :return: list of str, phases slower than the latest record with the same config, python & machine.
+    '''
+    same = ['config', 'python', 'machine']
+    previous = next((earlier for earlier in reversed(history)
+                     if all(earlier[key] == record[key] for key in same)), None)
+    if previous is None:
+        return []
+
+    slower = []
+    for name in PHASES:
+        before = previous['phases'][name]['loans_per_second']
+        after = record['phases'][name]['loans_per_second']
+        if before and after and after < before * (1 - max_regression):
+            slower.append(f'{name} {before:.0f} -> {after:.0f} loans/s')
+    return slower
+
+
+def load_history(file):
+    if not os.path.exists(file):
+        return []
+    with open(file, mode='r') as fh:
+        return json.load(fh)
+
+
+def save_history(file, history):
+    with open(file + '.tmp', mode='w') as fh:
+        json.dump(history, fh, indent=1)
+    os.replace(file + '.tmp', file)
+
+
+def prompt():
+    '''
+    Prompt to take book sizes, shape & history file.
+    :return: list of BookGenerator, repeat count, history file path, max regression.
+    '''
+    parser = argparse.ArgumentParser(description='Loan Assignment Benchmark')
+    parser.add_argument('-l', '--loans', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Book sizes to benchmark (default: 10000 100000 1000000)')
+    parser.add_argument('-f', '--facilities', type=int, default=100, help='Number of facilities (default: 100)')
+    parser.add_argument('--covenant_density', type=float, default=2.0,
+                        help='Average covenants per facility (default: 2)')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='Skew of state, default likelihood & amount, 0 for uniform (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Repetitions per size, fastest kept (default: 3)')
+    parser.add_argument('-o', '--history', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                'benchmark_history.json'),
+                        help='JSON history file results get appended to (default: benchmark_history.json)')
+    parser.add_argument('--max_regression', type=float, default=0.2,
+                        help='Fail when a phase throughput drops more than this fraction (default: 0.2)')
+    args = parser.parse_args()
+
+    # minor input validation.
+    if any(loans < 1 for loans in args.loans) or args.facilities < 1 or args.repeat < 1:
+        raise ValueError('Invalid benchmark size {} loans, {} facilities, {} repeats'.format(
+            args.loans, args.facilities, args.repeat))
+
+    generators = [BookGenerator(loan_count=loans, facility_count=args.facilities,
+                                covenant_density=args.covenant_density, skew=args.skew, seed=args.seed)
+                  for loans in args.loans]
+    return generators, args.repeat, args.history, args.max_regression
+
+
+if __name__ == '__main__':
+
+    generators, repeat, history_file, max_regression = prompt()
+    history = load_history(history_file)
+
+    failed = []
+    for generator in generators:
+        record = benchmark(generator=generator, repeat=repeat)
+        print(f'{generator.loan_count} loans, {generator.facility_count} facilities: '
+              + ', '.join(f'{name} {record["phases"][name]["seconds"]:.3f}s' for name in PHASES)
+              + ('' if record['peak_rss_mb'] is None else f', peak RSS {record["peak_rss_mb"]:.1f} MB'))
+        failed += [f'{generator.loan_count} loans: {slower}'
+                   for slower in regressions(record, history, max_regression)]
+        history.append(record)
+
+    save_history(history_file, history)
+    print(f'Wrote: {history_file}')
+
+    if failed:
+        sys.exit('Regressions:\n' + '\n'.join(failed))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import gc
+import os
+import sys
+import tracemalloc
+
+from facility import Facility
+from loan import Loan
+from loan_book import LoanBook
+
+
+class DictLoan:
+    ''' Loan as it was before __slots__: per object __dict__, uninterned strings. '''
+
+    def __init__(self, id, interest_rate, default_likelihood, amount, state):
+        self.id = id
+        self.interest_rate = interest_rate
+        self.default_likelihood = default_likelihood
+        self.amount = amount
+        self.state = state
+        self.facility_id = None
+
+
+class DictFacility:
+    ''' Facility as it was before __slots__: per object __dict__ & list of assigned loans. '''
+
+    def __init__(self, id, bank_id, interest_rate, amount):
+        self.id = id
+        self.bank_id = bank_id
+        self.interest_rate = interest_rate
+        self.amount = amount
+        self.covenant = None
+        self.loans = []
+
+
+def scaled_rows(file, scale):
+    '''
+    repeat csv rows scale times, shifting ids so every row stays unique.
+
+    :param file: path to csv file with numeric id column.
+    :param scale: int, number of copies.
+    '''
+    with open(file, mode='r') as fh:
+        rows = list(csv.DictReader(fh))
+    step = max(int(row['id']) for row in rows) if rows else 0
+    for copy in range(scale):
+        for row in rows:
+            # fresh strings per row, like csv.DictReader would produce on a really large file.
+            copied = {key: ''.join(list(value)) for key, value in row.items()}
+            copied['id'] = str(copy * step + int(row['id']))
+            yield copied
+
+
+def measure(build):
+    '''
+    :param build: function returning the object graph to measure.
+    :return: int, bytes still allocated by the object graph.
+    '''
+    gc.collect()
+    tracemalloc.start()
+    retained = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retained
+    return size
+
+
+def build_loans(loan_class, file, scale):
+    return [loan_class(id=row['id'],
+                       amount=int(row['amount']),
+                       interest_rate=float(row['interest_rate']),
+                       default_likelihood=float(row['default_likelihood']),
+                       state=sys.intern(row['state']) if loan_class is Loan else row['state'])
+            for row in scaled_rows(file, scale)]
+
+
+def build_loan_book(file, scale):
+    book = LoanBook()
+    for row in scaled_rows(file, scale):
+        book.append(id=row['id'],
+                    amount=int(row['amount']),
+                    interest_rate=float(row['interest_rate']),
+                    default_likelihood=float(row['default_likelihood']),
+                    state=row['state'])
+    return book
+
+
+def build_facilities(facility_class, file, scale):
+    return [facility_class(id=row['id'],
+                           bank_id=sys.intern(row['bank_id']) if facility_class is Facility else row['bank_id'],
+                           interest_rate=float(row['interest_rate']),
+                           amount=float(row['amount']))
+            for row in scaled_rows(file, scale)]
+
+
+def prompt():
+    '''
+    Prompt to take input files dir & scale factor.
+    :return: input dir path, scale factor.
+    '''
+    parser = argparse.ArgumentParser(description='Loan/Facility Memory Benchmark')
+    parser.add_argument('-d', '--file_dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'large'),
+                        help='Input file directory (default: large)')
+    parser.add_argument('-s', '--scale', type=int, default=1000, help='Number of copies of the input rows')
+    args = parser.parse_args()
+    return args.file_dir, args.scale
+
+
+if __name__ == '__main__':
+
+    file_dir, scale = prompt()
+    loans_file = os.path.join(file_dir, 'loans.csv')
+    facilities_file = os.path.join(file_dir, 'facilities.csv')
+
+    results = [
+        ('loans: dict objects', lambda: build_loans(DictLoan, loans_file, scale)),
+        ('loans: Loan __slots__', lambda: build_loans(Loan, loans_file, scale)),
+        ('loans: LoanBook arrays', lambda: build_loan_book(loans_file, scale)),
+        ('facilities: dict objects', lambda: build_facilities(DictFacility, facilities_file, scale)),
+        ('facilities: Facility __slots__', lambda: build_facilities(Facility, facilities_file, scale)),
+    ]
+
+    print(f'Memory of {file_dir} scaled {scale}x')
+    for name, build in results:
+        size = measure(build)
+        print(f'{name:<32}{size / (1 << 20):>10.1f} MB')
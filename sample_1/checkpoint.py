@@ -0,0 +1,200 @@
+import csv
+import json
+import os
+import sys
+
+from loan import Loan
+from snapshot import hash_file
+
+
+def read_loans(file, offset=None):
+    '''
+    Lazily yield Loan objects from loans.csv together with their byte range, starting at offset.
+
+    :param file: path to loans.csv
+    :param offset: int, byte offset of the first row to read, None to start right after the header.
+    :return: generator of (row start offset, row end offset, Loan object).
+    '''
+    with open(file, mode='rb') as fh:
+        header = next(csv.reader([fh.readline().decode('utf-8')]))
+        if offset is not None:
+            fh.seek(offset)
+        while True:
+            start = fh.tell()
+            line = fh.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            row = dict(zip(header, next(csv.reader([line.decode('utf-8')]))))
+            yield start, fh.tell(), Loan(id=row['id'],
+                                         amount=int(row['amount']),
+                                         interest_rate=float(row['interest_rate']),
+                                         default_likelihood=float(row['default_likelihood']),
+                                         state=sys.intern(row['state']))
+
+
+class Checkpoint:
+    '''
+    Checkpoint class.
+
+    Facility state after an assignment run, so a later run only has to assign loans appended to loans.csv since:
+        - remaining amount, exact yield accumulator & exhausted flag per facility.
+        - byte offset right after the last processed loan row, start offset & id of that row.
+        - content hash of facilities.csv & covenants.csv, the state is only valid against the same inputs.
+        - fingerprint of the processed loans.csv prefix & of assignments.csv as written with this state:
+          size, mtime & hash of the WINDOW bytes before the end, so checking costs O(1) instead of O(book).
+          Rewrites within the window, shrinking files & same size rewrites are detected, edits further back only
+          with verify (full sha256 kept in the fingerprint). Rows a run appended to assignments.csv before it
+          could save its checkpoint get cut off again on resume.
+    '''
+
+    VERSION = 3
+    WINDOW = 64 << 10
+
+    def __init__(self, inputs, loans, facilities, output):
+        '''
+        :param inputs: dict, input file name -> sha256 hex digest.
+        :param loans: dict, offset/last_offset/last_id/max_id/count/prefix (fingerprint) of processed loan rows.
+        :param facilities: dict, facility id -> [remaining amount, yield accumulator units, exhausted flag].
+        :param output: dict, fingerprint of assignments.csv.
+        '''
+        self.inputs = inputs
+        self.loans = loans
+        self.facilities = facilities
+        self.output = output
+
+    @staticmethod
+    def hash_inputs(file_dict):
+        return {name: hash_file(file_dict[name]) for name in ['facilities.csv', 'covenants.csv']}
+
+    @staticmethod
+    def fingerprint(file, end, verify=False):
+        '''
+        :param file: path to file.
+        :param end: int, byte offset the checked content ends at.
+        :param verify: bool, also hash the whole content up to end (O(file)).
+        :return: dict, size & mtime of file, end, sha256 of the window before end & of everything before end.
+        '''
+        info = os.stat(file)
+        return {'size': info.st_size, 'mtime': info.st_mtime_ns, 'end': end,
+                'window': hash_file(file, start=max(end - Checkpoint.WINDOW, 0), end=end),
+                'sha256': hash_file(file, end=end) if verify else None}
+
+    @staticmethod
+    def unchanged(fingerprint, file, verify=False) -> bool:
+        '''
+        :param fingerprint: dict, see fingerprint.
+        :param file: path to file.
+        :param verify: bool, compare the full sha256 too when the fingerprint has it.
+        :return: bool, True if content up to the fingerprint end looks untouched (appending is fine).
+        '''
+        info = os.stat(file)
+        if info.st_size < fingerprint['end']:
+            return False
+        if info.st_size == fingerprint['size'] and info.st_mtime_ns != fingerprint['mtime']:
+            # rewritten in place, nothing appended.
+            return False
+        end = fingerprint['end']
+        if hash_file(file, start=max(end - Checkpoint.WINDOW, 0), end=end) != fingerprint['window']:
+            return False
+        return not verify or fingerprint['sha256'] is None or hash_file(file, end=end) == fingerprint['sha256']
+
+    @staticmethod
+    def capture(file_dict, facility_index, loans, output_file, verify=False):
+        '''
+        :param file_dict: dict, filename -> file path.
+        :param facility_index: FacilityIndex after the run.
+        :param loans: dict, processed loan rows (see __init__, prefix gets computed).
+        :param output_file: str, assignments.csv path, written.
+        :param verify: bool, keep full sha256 of loans.csv prefix & assignments.csv for verified resumes.
+        :return: Checkpoint of current facility state.
+        '''
+        facilities = {}
+        for position, facility in enumerate(facility_index.facilities):
+            exhausted = facility_index.tree[facility_index.size + position] == facility_index.EXHAUSTED
+            facilities[facility.id] = [facility.amount, facility.expected_yield.units, exhausted]
+        loans = dict(loans, prefix=None if loans['offset'] is None else
+                     Checkpoint.fingerprint(file_dict['loans.csv'], end=loans['offset'], verify=verify))
+        output = Checkpoint.fingerprint(output_file, end=os.path.getsize(output_file), verify=verify)
+        return Checkpoint(inputs=Checkpoint.hash_inputs(file_dict), loans=loans, facilities=facilities, output=output)
+
+    def check(self, file_dict, verify=False):
+        '''
+        :param file_dict: dict, filename -> file path.
+        :param verify: bool, compare full sha256 of the processed loans.csv prefix too (O(book)).
+        :return: str, reason the checkpoint can't be continued from, None if it can.
+        '''
+        if self.inputs != Checkpoint.hash_inputs(file_dict):
+            return 'facilities.csv or covenants.csv changed'
+
+        loans_file = file_dict['loans.csv']
+        if self.loans['offset'] is not None and os.path.getsize(loans_file) < self.loans['offset']:
+            return 'loans.csv shrank'
+        if self.loans['prefix'] is not None and not Checkpoint.unchanged(self.loans['prefix'], loans_file, verify):
+            return 'loans.csv rows before the checkpoint changed'
+        return None
+
+    def recover_output(self, output_file, verify=False):
+        '''
+        check assignments.csv is the one written with this state, cut off rows appended after it.
+
+        :param output_file: str, assignments.csv path.
+        :param verify: bool, compare full sha256 of assignments.csv too (O(book)).
+        :return: str, reason the checkpoint can't be continued from, None if it can.
+        '''
+        if not os.path.exists(output_file):
+            return 'assignments.csv missing'
+        if not Checkpoint.unchanged(self.output, output_file, verify):
+            return 'assignments.csv changed'
+        if os.path.getsize(output_file) > self.output['end']:
+            # a run stopped between writing assignments & saving its checkpoint.
+            with open(output_file, mode='r+b') as fh:
+                fh.truncate(self.output['end'])
+        return None
+
+    def restore(self, facility_index, portfolio):
+        '''
+        put checkpointed facility state back into freshly indexed facilities.
+
+        :param facility_index: FacilityIndex over the same facilities, no loan assigned yet.
+        :param portfolio: empty Portfolio.
+        '''
+        if set(self.facilities) != {facility.id for facility in facility_index.facilities}:
+            raise ValueError('Checkpoint facilities do not match facilities.csv')
+
+        for position, facility in enumerate(facility_index.facilities):
+            amount, units, exhausted = self.facilities[facility.id]
+            facility.amount = amount
+            facility.expected_yield.units = units
+            portfolio.bank_yields[facility.bank_id].units += units
+            portfolio.total_yield.units += units
+            # facility used up stays out of the index, untouched non positive facility keeps its initial leaf.
+            if exhausted or amount > 0:
+                facility_index.update(position)
+
+    def save(self, file):
+        '''
+        :param file: path to checkpoint file, replaced atomically.
+        '''
+        with open(file + '.tmp', mode='w') as fh:
+            json.dump({'version': self.VERSION, 'inputs': self.inputs, 'loans': self.loans,
+                       'facilities': self.facilities, 'output': self.output}, fh)
+        os.replace(file + '.tmp', file)
+
+    @staticmethod
+    def load(file):
+        '''
+        Load Checkpoint from file.
+
+        :param file: path to checkpoint file.
+        :return: Checkpoint, None if file is missing or written by another version.
+        '''
+        if not os.path.exists(file):
+            return None
+        with open(file, mode='r') as fh:
+            data = json.load(fh)
+        if data.get('version') != Checkpoint.VERSION:
+            return None
+        return Checkpoint(inputs=data['inputs'], loans=data['loans'], facilities=data['facilities'],
+                          output=data['output'])
@@ -0,0 +1,214 @@
+import csv
+import warnings
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from accumulator import YieldAccumulator
+from eligibility import Eligibility
+from facility import Facility
+
+
+def load_columns(file, columns):
+    '''
+    Load selected csv columns into a NumPy structured array through NumPy's C csv parser.
+    Fixed width string columns are sized from the data: the parser cuts longer values silently, so a column
+    with a value filling its whole width gets loaded again at twice the width.
+
+    :param file: path to csv file.
+    :param columns: dict, column name -> NumPy dtype, strings as 'U{initial width}'.
+    :return: NumPy structured array, one field per column.
+    '''
+    if np is None:
+        raise ImportError('numpy is required for the columnar engine')
+
+    columns = dict(columns)
+    while True:
+        with open(file, mode='r', newline='') as fh:
+            header = next(csv.reader(fh))
+            with warnings.catch_warnings():
+                # header only file is a valid empty input.
+                warnings.simplefilter('ignore', UserWarning)
+                array = np.loadtxt(fh, delimiter=',', quotechar='"', comments=None, ndmin=1,
+                                   usecols=[header.index(column) for column in columns],
+                                   dtype=list(columns.items()))
+
+        # string columns with a value as long as the width may have been cut.
+        cut = [column for column, dtype in columns.items() if np.dtype(dtype).kind == 'U' and len(array) and
+               np.char.str_len(array[column]).max() >= np.dtype(dtype).itemsize // 4]
+        if not cut:
+            return array
+        for column in cut:
+            columns[column] = f'U{np.dtype(columns[column]).itemsize // 4 * 2}'
+
+
+class ColumnarEngine:
+    '''
+    ColumnarEngine class.
+
+    Loads loans & facilities into NumPy arrays and assigns loans in blocks:
+    covenant eligibility of a block of loans against every facility is computed in vectorized form,
+    only the capacity commit of each loan stays sequential.
+    Produces the same assignments & yields as the object path in fund.py.
+    '''
+
+    def __init__(self, facility_ids, facility_rates, facility_amounts, eligibility,
+                 loan_ids, loan_rates, loan_likelihoods, loan_amounts, loan_states):
+        '''
+        :param facility_ids: array of str, facility ids ordered by interest rate & id.
+        :param facility_rates: array of float, facility interest rates.
+        :param facility_amounts: array of float, facility amounts.
+        :param eligibility: Eligibility compiled against the same facility ordering.
+        :param loan_ids: array of str, loan ids.
+        :param loan_rates: array of float, loan interest rates.
+        :param loan_likelihoods: array of float, loan default likelihoods.
+        :param loan_amounts: array of int, loan amounts.
+        :param loan_states: array of str, loan state codes.
+        '''
+        if np is None:
+            raise ImportError('numpy is required for the columnar engine')
+
+        self.facility_ids = facility_ids
+        self.facility_rates = facility_rates
+        self.facility_amounts = facility_amounts
+        self.loan_ids = loan_ids
+        self.loan_rates = loan_rates
+        self.loan_likelihoods = loan_likelihoods
+        self.loan_amounts = loan_amounts
+
+        # covenants as arrays: max default likelihood per facility & state code x facility banned matrix.
+        # last state code stands for every state no covenant bans.
+        self.limits = np.array(eligibility.limits, dtype=np.float64)
+        self.banned = np.zeros((len(eligibility.states) + 1, len(facility_ids)), dtype=bool)
+        for position, banned_states in enumerate(eligibility.banned):
+            for bit in range(len(eligibility.states)):
+                self.banned[bit, position] = banned_states >> bit & 1
+
+        states, inverse = np.unique(loan_states, return_inverse=True)
+        codes = np.array([eligibility.states.get(state, len(eligibility.states)) for state in states.tolist()],
+                         dtype=np.intp)
+        self.loan_states = codes[inverse] if len(states) else np.zeros(0, dtype=np.intp)
+
+        # facility position per loan, -1 if unassigned.
+        self.assigned = np.full(len(loan_ids), -1, dtype=np.intp)
+        # remaining capacity, -inf once a facility is used up.
+        self.capacity = facility_amounts.astype(np.float64)
+
+    def eligible(self, start, stop):
+        '''
+        covenant eligibility of a block of loans.
+
+        :param start: int, first loan of the block.
+        :param stop: int, end of the block.
+        :return: bool matrix, loan x facility position.
+        '''
+        likelihoods = self.loan_likelihoods[start:stop, None]
+        return ~(likelihoods > self.limits[None, :]) & ~self.banned[self.loan_states[start:stop]]
+
+    def assign(self, block_cells=1 << 24, commit_size=64):
+        '''
+        assign every loan to the cheapest eligible facility that can handle its amount.
+
+        :param block_cells: int, upper bound of loan x facility cells per eligibility block.
+        :param commit_size: int, number of loans sharing one capacity snapshot during sequential commit.
+        '''
+        block_size = max(1, block_cells // max(1, len(self.facility_ids)))
+        # sequential commit works on plain floats, cheaper than NumPy scalars; array copy is kept for snapshots.
+        capacity = self.capacity.tolist()
+        assigned = self.assigned
+        amounts = self.loan_amounts.astype(np.float64)
+
+        for start in range(0, len(self.loan_ids), block_size):
+            stop = min(start + block_size, len(self.loan_ids))
+            eligible = self.eligible(start, stop)
+
+            for commit_start in range(start, stop, commit_size):
+                commit_stop = min(commit_start + commit_size, stop)
+                commit_amounts = amounts[commit_start:commit_stop]
+
+                # capacity only shrinks, so facilities too small at snapshot stay too small until next one.
+                fits = (eligible[commit_start - start:commit_stop - start] &
+                        (self.capacity[None, :] >= commit_amounts[:, None]))
+                firsts = fits.argmax(axis=1)
+                found = fits[np.arange(commit_stop - commit_start), firsts].tolist()
+
+                # sequential capacity commit.
+                for row, (amount, position) in enumerate(zip(commit_amounts.tolist(), firsts.tolist())):
+                    if not found[row]:
+                        continue
+                    if capacity[position] < amount:
+                        # first fit got used up since snapshot, scan remaining candidates.
+                        offset = position + 1
+                        position = next((offset + candidate
+                                         for candidate in np.flatnonzero(fits[row, offset:]).tolist()
+                                         if capacity[offset + candidate] >= amount), None)
+                        if position is None:
+                            continue
+                    assigned[commit_start + row] = position
+                    capacity[position] -= amount
+                    if capacity[position] <= 0:
+                        capacity[position] = -np.inf
+                    self.capacity[position] = capacity[position]
+
+    def assignments(self):
+        ''' :return: list of [loan id, facility id] ordered by loan id. '''
+        facility_ids = np.append(self.facility_ids, '').astype(str)
+        order = np.argsort(self.loan_ids.astype(np.int64), kind='stable')
+        return [[loan_id, facility_id] for loan_id, facility_id in
+                zip(self.loan_ids[order].tolist(), facility_ids[self.assigned[order]].tolist())]
+
+    def yields(self):
+        ''' :return: list of (facility id, expected yield) of facilities still available, ordered by facility id. '''
+        mask = self.assigned >= 0
+        positions = self.assigned[mask]
+        likelihoods = self.loan_likelihoods[mask]
+        amounts = self.loan_amounts[mask].astype(np.float64)
+
+        # same term order as Facility.loan_yield, summed exactly per facility like Facility.get_yield.
+        terms = ((1 - likelihoods) * self.loan_rates[mask] * amounts -
+                 (likelihoods * amounts) -
+                 self.facility_rates[positions] * amounts)
+        totals = [YieldAccumulator() for _ in range(len(self.facility_ids))]
+        for position, term in zip(positions.tolist(), terms.tolist()):
+            totals[position].add(term)
+
+        live = np.flatnonzero(self.capacity != -np.inf)
+        live = live[np.argsort(self.facility_ids[live].astype(np.int64), kind='stable')]
+        facility_ids = self.facility_ids.tolist()
+        return [(facility_ids[position], str(totals[position].get_rounded())) for position in live.tolist()]
+
+    @staticmethod
+    def load(file_dict, covenant_map):
+        '''
+        Load columnar arrays from the input files.
+
+        :param file_dict: dict, filename -> file path.
+        :param covenant_map: map of (bank id, facility id) -> [covenant ... ]
+        '''
+        # np.float64 etc. below need numpy before the check in __init__ runs.
+        if np is None:
+            raise ImportError('numpy is required for the columnar engine')
+
+        # facilities are few, reuse plain objects to get FacilityIndex ordering.
+        facilities = sorted(Facility.load(file=file_dict['facilities.csv']))
+        eligibility = Eligibility.compile(facilities=facilities, covenant_map=covenant_map)
+
+        loans = load_columns(file_dict['loans.csv'], {'id': 'U32',
+                                                      'interest_rate': np.float64,
+                                                      'default_likelihood': np.float64,
+                                                      'amount': np.int64,
+                                                      'state': 'U8'})
+
+        return ColumnarEngine(facility_ids=np.array([facility.id for facility in facilities], dtype=str),
+                              facility_rates=np.array([facility.interest_rate for facility in facilities],
+                                                      dtype=np.float64),
+                              facility_amounts=np.array([facility.amount for facility in facilities],
+                                                        dtype=np.float64),
+                              eligibility=eligibility,
+                              loan_ids=loans['id'],
+                              loan_rates=loans['interest_rate'],
+                              loan_likelihoods=loans['default_likelihood'],
+                              loan_amounts=loans['amount'],
+                              loan_states=loans['state'])
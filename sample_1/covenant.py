@@ -6,6 +6,8 @@ class Covenant:
     Covenant class.
     '''
 
+    __slots__ = ('bank_id', 'facility_id', 'maximum_default_likelihood', 'banned_state')
+
     def __init__(self, bank_id, facility_id=None, maximum_default_likelihood=0.0, banned_state=None):
         '''
         bank_id: str, bank id
@@ -48,13 +50,12 @@ class Covenant:
 
         :param file: path to covenants.csv
         '''
-        covenant_dict = csv.DictReader(open(file, mode='r'))
-
         covenants = []
-        for line in covenant_dict:
-            covenants.append(Covenant(bank_id=line['bank_id'],
-                                      facility_id=line['facility_id'],
-                                      maximum_default_likelihood=float(line['max_default_likelihood'] or 0),
-                                      banned_state=line['banned_state']))
+        with open(file, mode='r') as fh:
+            for line in csv.DictReader(fh):
+                covenants.append(Covenant(bank_id=line['bank_id'],
+                                          facility_id=line['facility_id'],
+                                          maximum_default_likelihood=float(line['max_default_likelihood'] or 0),
+                                          banned_state=line['banned_state']))
 
         return covenants
@@ -0,0 +1,104 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+
+class Eligibility:
+    '''
+    Eligibility class.
+
+    Bank-level & facility-level covenants folded into one predicate per facility:
+    lowest maximum default likelihood plus banned states bitmask over interned state codes.
+    Facilities are addressed by position, matching FacilityIndex ordering.
+    '''
+
+    NO_LIMIT = float('inf')
+
+    def __init__(self, limits, banned, states):
+        '''
+        :param limits: list of float, maximum default likelihood per facility position (NO_LIMIT if none).
+        :param banned: list of int, banned states bitmask per facility position.
+        :param states: dict, state code -> bit number.
+        '''
+        self.limits = limits
+        self.banned = banned
+        self.states = states
+
+        # every facility is eligible for a state nobody bans.
+        self.all_mask = (1 << len(limits)) - 1
+
+        # state code -> bitmask of facility positions not banning the state.
+        bits = {bit: state for state, bit in states.items()}
+        self.state_masks = {state: self.all_mask for state in states}
+        for position, banned_states in enumerate(banned):
+            while banned_states:
+                bit = (banned_states & -banned_states).bit_length() - 1
+                self.state_masks[bits[bit]] &= ~(1 << position)
+                banned_states &= banned_states - 1
+
+        # ascending distinct limits & bitmask of facility positions allowing each of them.
+        positions = defaultdict(int)
+        for position, limit in enumerate(limits):
+            positions[limit] |= 1 << position
+        self.thresholds = sorted(positions)
+        self.likelihood_masks = [0] * (len(self.thresholds) + 1)
+        for k in range(len(self.thresholds) - 1, -1, -1):
+            self.likelihood_masks[k] = self.likelihood_masks[k + 1] | positions[self.thresholds[k]]
+
+    def check(self, position, default_likelihood, state):
+        '''
+        loan criteria check under all covenants of the facility.
+
+        :param position: int, facility position.
+        :param default_likelihood: float,
+        :param state: str, state code
+
+        :return: bool, pass / fail
+        '''
+        if default_likelihood > self.limits[position]:
+            return False
+        bit = self.states.get(state)
+        return bit is None or not self.banned[position] >> bit & 1
+
+    def mask(self, default_likelihood, state):
+        '''
+        bitmask of facility positions the loan passes covenants for.
+
+        :param default_likelihood: float,
+        :param state: str, state code
+
+        :return: int, bit set per eligible facility position.
+        '''
+        likelihood_mask = self.likelihood_masks[bisect_left(self.thresholds, default_likelihood)]
+        return likelihood_mask & self.state_masks.get(state, self.all_mask)
+
+    @staticmethod
+    def compile(facilities, covenant_map):
+        '''
+        fold bank-level & bank+facility level covenants of each facility into Eligibility.
+
+        :param facilities: list of Facility objects, in FacilityIndex order.
+        :param covenant_map: map of (bank id, facility id) -> [covenant ... ]
+        '''
+        states = {}
+        limits = []
+        banned = []
+
+        for facility in facilities:
+            # bank-level covenants have no facility id (see process_covenants).
+            covenants = covenant_map.get((facility.bank_id, ''), []) + \
+                        covenant_map.get((facility.bank_id, facility.id), [])
+
+            limit = Eligibility.NO_LIMIT
+            banned_states = 0
+            for covenant in covenants:
+                # zero/empty maximum default likelihood puts no limit on the loan.
+                if covenant.maximum_default_likelihood:
+                    limit = min(limit, covenant.maximum_default_likelihood)
+                if covenant.banned_state is not None:
+                    bit = states.setdefault(covenant.banned_state, len(states))
+                    banned_states |= 1 << bit
+
+            limits.append(limit)
+            banned.append(banned_states)
+
+        return Eligibility(limits=limits, banned=banned, states=states)
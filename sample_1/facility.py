@@ -1,4 +1,7 @@
 import csv
+import sys
+
+from accumulator import YieldAccumulator
 
 
 class Facility:
@@ -6,6 +9,8 @@ class Facility:
     Facility class.
     '''
 
+    __slots__ = ('id', 'bank_id', 'interest_rate', 'amount', 'covenant', 'expected_yield')
+
     def __init__(self, id, bank_id, interest_rate, amount):
         '''
         :param id: str, facility id
@@ -18,16 +23,43 @@ class Facility:
         self.interest_rate = interest_rate
         self.amount = amount
         self.covenant = None
-        self.loans = []
+        # running expected yield of assigned loans.
+        self.expected_yield = YieldAccumulator()
 
     def get_yield(self):
-        ''' calculate yield across all assigned loans. '''
-        combined_yield = 0
-        for loan in self.loans:
-            combined_yield += ((1 - loan.default_likelihood) * loan.interest_rate * loan.amount -
-                               (loan.default_likelihood * loan.amount) -
-                               self.interest_rate * loan.amount)
-        return round(combined_yield)
+        ''' expected yield across all assigned loans, kept up to date on every assign/unassign. '''
+        return self.expected_yield.get_rounded()
+
+    def assign(self, loan):
+        '''
+        assign loan to this facility & add its expected yield in O(1).
+        remaining amount is managed by the caller (see FacilityIndex).
+
+        :param loan: Loan object.
+        :return: float, expected yield of the loan.
+        '''
+        loan_yield = self.loan_yield(loan)
+        self.expected_yield.add(loan_yield)
+        loan.facility_id = self.id
+        return loan_yield
+
+    def unassign(self, loan):
+        '''
+        unassign loan from this facility & take its expected yield back out in O(1).
+
+        :param loan: Loan object previously assigned.
+        :return: float, expected yield of the loan.
+        '''
+        loan_yield = self.loan_yield(loan)
+        self.expected_yield.subtract(loan_yield)
+        loan.facility_id = None
+        return loan_yield
+
+    def loan_yield(self, loan):
+        ''' calculate expected yield of a single loan under this facility. '''
+        return ((1 - loan.default_likelihood) * loan.interest_rate * loan.amount -
+                (loan.default_likelihood * loan.amount) -
+                self.interest_rate * loan.amount)
 
     def __repr__(self):
         return (
@@ -37,7 +69,7 @@ class Facility:
             f'interest_rate:{self.interest_rate}, '
             f'amount: {self.amount}, '
             f'covenant: {self.covenant}, '
-            f'loan: {self.loans}]'
+            f'expected_yield: {self.get_yield()}]'
         )
 
     def __lt__(self, other):
@@ -63,12 +95,11 @@ class Facility:
         :param file: path to facilities.csv
         '''
 
-        facility_dict = csv.DictReader(open(file, mode='r'))
-
         facilities = []
-        for line in facility_dict:
-            facilities.append(Facility(id=line['id'],
-                                       bank_id=line['bank_id'],
-                                       interest_rate=float(line['interest_rate']),
-                                       amount=float(line['amount'])))
+        with open(file, mode='r') as fh:
+            for line in csv.DictReader(fh):
+                facilities.append(Facility(id=line['id'],
+                                           bank_id=sys.intern(line['bank_id']),
+                                           interest_rate=float(line['interest_rate']),
+                                           amount=float(line['amount'])))
         return facilities
@@ -0,0 +1,89 @@
+class FacilityIndex:
+    '''
+    FacilityIndex class.
+
+    Facilities ordered by interest_rate & id (lowest first) and stored as leaves of a segment tree
+    where every node keeps maximum remaining amount of its subtree.
+    Lets loan matching jump directly to the cheapest facility with enough capacity instead of
+    popping & re-pushing every facility that is too small.
+    '''
+
+    # leaf value of exhausted facilities, never matches any loan amount.
+    EXHAUSTED = float('-inf')
+
+    def __init__(self, facilities):
+        '''
+        :param facilities: list of Facility objects.
+        '''
+        # position -> facility, ordered by Facility.__lt__ (same order heap would pop them in).
+        self.facilities = sorted(facilities)
+
+        self.size = 1
+        while self.size < len(self.facilities):
+            self.size <<= 1
+
+        # tree[1] is root, tree[size + position] is leaf of facility at position.
+        self.tree = [self.EXHAUSTED] * (2 * self.size)
+        for position, facility in enumerate(self.facilities):
+            self.tree[self.size + position] = facility.amount
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def __len__(self):
+        ''' number of facilities still available for assignment. '''
+        return sum(1 for _ in self)
+
+    def __iter__(self):
+        ''' iterate facilities still available for assignment, cheapest first. '''
+        for position, facility in enumerate(self.facilities):
+            if self.tree[self.size + position] != self.EXHAUSTED:
+                yield facility
+
+    def find(self, amount, start=0):
+        '''
+        find the cheapest facility at or after start position that can handle the amount.
+
+        :param amount: int/float, required remaining amount.
+        :param start: int, first position to consider.
+        :return: int, position of the facility or None if no such facility.
+        '''
+        tree = self.tree
+        size = self.size
+
+        if start >= len(self.facilities) or tree[1] < amount:
+            return None
+
+        node = size + start
+        while True:
+            if tree[node] >= amount:
+                # descend to leftmost leaf holding enough amount.
+                while node < size:
+                    node <<= 1
+                    if tree[node] < amount:
+                        node += 1
+                return node - size
+            # climb while right child, then step over to the right sibling subtree.
+            while node & 1:
+                node >>= 1
+            if not node:
+                return None
+            node += 1
+
+    def update(self, position):
+        '''
+        refresh the capacity of facility at position after its amount changed.
+        facility gets removed from the index once its amount is used up.
+
+        :param position: int, position of the facility.
+        '''
+        facility = self.facilities[position]
+        node = self.size + position
+        self.tree[node] = facility.amount if facility.amount > 0 else self.EXHAUSTED
+
+        node >>= 1
+        while node:
+            amount = max(self.tree[2 * node], self.tree[2 * node + 1])
+            if self.tree[node] == amount:
+                break
+            self.tree[node] = amount
+            node >>= 1
@@ -1,14 +1,25 @@
 #!/usr/bin/env python
 
 import argparse
+import heapq
 import os
 import sys
-import heapq
+import tempfile
 from collections import defaultdict
+from itertools import islice
 
 from facility import Facility
+from facility_index import FacilityIndex
+from eligibility import Eligibility
 from covenant import Covenant
 from loan import Loan
+from loan_book import LoanBook
+from portfolio import Portfolio
+from columnar import ColumnarEngine
+from snapshot import SnapshotCache
+from optimizer import LocalSearch
+from checkpoint import Checkpoint, read_loans
+from profiler import Profiler, phase
 
 
 def write(file_dir, file_name, header, data_list):
@@ -30,57 +41,129 @@ def write(file_dir, file_name, header, data_list):
     print(f'Wrote: {path}')
 
 
-def find_facility(loan, facilities, covenant_map):
+def merge_runs(runs, path, key, header=None):
+    '''
+    k-way merge of sorted run files into path, earlier runs first on equal keys.
+
+    :param runs: list of (run file path, bool whether run starts with a header line).
+    :param path: str, merged output path.
+    :param key: function, list -> sort key.
+    :param header: str, csv header of merged output, if any.
+    '''
+    handles = [open(run, 'r') for run, _ in runs]
+    try:
+        for handle, (_, has_header) in zip(handles, runs):
+            if has_header:
+                handle.readline()
+        with open(path, 'w') as fh:
+            if header is not None:
+                fh.write(header + '\n')
+            fh.writelines(heapq.merge(*handles, key=lambda line: key(line.rstrip('\n').split(','))))
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def write_sorted(file_dir, file_name, header, data_iter, key, chunk_size=1 << 20, max_runs=256):
+    '''
+    streaming output file write routine, ordered by key.
+    rows arriving in key order go straight to the file. once an out of order row shows up,
+    the written prefix and sorted chunks of the remaining rows become temporary runs merged at the end (external sort).
+
+    :param file_dir: str,
+    :param file_name: str,
+    :param header: str, csv
+    :param data_iter: iterable of list.
+    :param key: function, list -> sort key.
+    :param chunk_size: int, max number of rows held in memory at once.
+    :param max_runs: int, max number of runs open at once, runs get merged together once reached.
+    '''
+
+    path = os.path.join(file_dir, file_name)
+    data_iter = iter(data_iter)
+    chunk = []
+
+    with open(path, 'w') as fh:
+        # header
+        fh.write(header + '\n')
+        last_key = None
+        for data in data_iter:
+            data_key = key(data)
+            if last_key is not None and data_key < last_key:
+                chunk.append(data)
+                break
+            fh.write('{}\n'.format(','.join(data)))
+            last_key = data_key
+
+    if chunk:
+        with tempfile.TemporaryDirectory(dir=file_dir) as run_dir:
+            # written prefix is already the first sorted run.
+            runs = [(os.path.join(run_dir, 'run-0'), True)]
+            os.replace(path, runs[0][0])
+            run_count = 1
+
+            # spill sorted chunks as further runs.
+            while chunk:
+                chunk.extend(islice(data_iter, chunk_size - len(chunk)))
+                chunk.sort(key=key)
+                run = os.path.join(run_dir, f'run-{run_count}')
+                run_count += 1
+                with open(run, 'w') as fh:
+                    for data in chunk:
+                        fh.write('{}\n'.format(','.join(data)))
+                runs.append((run, False))
+                chunk = list(islice(data_iter, 1))
+
+                # keep number of open run files bounded.
+                if len(runs) >= max_runs and chunk:
+                    run = os.path.join(run_dir, f'run-{run_count}')
+                    run_count += 1
+                    merge_runs(runs=runs, path=run, key=key)
+                    for merged, _ in runs:
+                        os.remove(merged)
+                    runs = [(run, False)]
+
+            merge_runs(runs=runs, path=path, key=key, header=header)
+
+    print(f'Wrote: {path}')
+
+
+def find_facility(loan, facility_index, eligibility):
     '''
     find the facility this loan can be assigned to.
     facility with lowest interest rate is prioritized during matching process
     as far as loan complies under covenant.
 
     :param loan: Loan object to assign.
-    :param facilities: available facilities list sorted by interest rate(lowest first) and id(lowest first).
-    :param covenant_map: map of (bank id, facility id) -> [covenant ... ]
+    :param facility_index: FacilityIndex of available facilities ordered by interest rate(lowest first) and id(lowest first).
+    :param eligibility: Eligibility compiled from covenants, addressed by facility_index positions.
     :return assignable Facility object.
     '''
 
-    backlogs = []
-    assigned_facility = None
-
-    # find candidate facility(with lowest interest rate remaining) to assign.
-    while facilities:
+    # facilities this loan passes covenants for.
+    candidates = eligibility.mask(loan.default_likelihood, loan.state)
+    if not candidates:
+        return None
 
-        cheapest_facility = heapq.heappop(facilities)
+    # jump to the cheapest eligible facility that can handle loan amount.
+    position = facility_index.find(loan.amount, start=(candidates & -candidates).bit_length() - 1)
 
-        # first check whether cheapest facility can handle loan amount.
-        if loan.amount > cheapest_facility.amount:
-            # can't handle, add to back log and process next.
-            backlogs.append(cheapest_facility)
-            continue
-
-        # get bank-level & bank+facility level covenants list.
-        covenants = covenant_map.get((cheapest_facility.bank_id,), []) + \
-                    covenant_map.get((cheapest_facility.bank_id, cheapest_facility.id), [])
-
-        # check against all covenant conditions.
-        passes_covenants = all([cv.check(loan.default_likelihood, loan.state) for cv in covenants])
+    while position is not None:
         # assignable?
-        if passes_covenants:
-            # we found facility to assign loan to.
-            assigned_facility = cheapest_facility
-            # subtract loan amount
+        if candidates >> position & 1:
+            cheapest_facility = facility_index.facilities[position]
+            # subtract loan amount, facility drops out of index once nothing is left.
             cheapest_facility.amount -= loan.amount
-            # push back if facility has any amount left.
-            if cheapest_facility.amount > 0:
-                backlogs.append(cheapest_facility)
-            break
-        else:
-            # can't assign, keep the popped facility.
-            backlogs.append(cheapest_facility)
+            facility_index.update(position)
+            return cheapest_facility
 
-    # add back failed to match facilities back.
-    for backlog in backlogs:
-        heapq.heappush(facilities, backlog)
+        # can't assign, skip over ineligible facilities to the next one that can handle loan amount.
+        remaining = candidates >> (position + 1)
+        if not remaining:
+            return None
+        position = facility_index.find(loan.amount, start=position + (remaining & -remaining).bit_length())
 
-    return assigned_facility
+    return None
 
 
 def process_covenants(covenants):
@@ -101,6 +184,291 @@ def process_covenants(covenants):
     return covenant_map
 
 
+def index_facilities(facilities, covenants):
+    '''
+    build FacilityIndex & Eligibility over facilities & covenants.
+
+    :param facilities: list of Facility objects.
+    :param covenants: list of Covenant objects.
+    :return: FacilityIndex, Eligibility, empty Portfolio.
+    '''
+
+    # process covenants
+    covenant_map = process_covenants(covenants=covenants)
+
+    # index the facilities by interest rate & remaining amount.
+    facility_index = FacilityIndex(facilities)
+
+    # compile covenants into per facility eligibility.
+    eligibility = Eligibility.compile(facilities=facility_index.facilities, covenant_map=covenant_map)
+
+    return facility_index, eligibility, Portfolio()
+
+
+def build_index(file_dict, cache=None):
+    '''
+    load facilities & covenants into FacilityIndex & Eligibility.
+
+    :param file_dict: dict, filename -> file path.
+    :param cache: SnapshotCache to load inputs through, None to parse csv.
+    :return: FacilityIndex, Eligibility, empty Portfolio.
+    '''
+
+    with phase('load'):
+        # load facilities
+        facilities = Facility.load(file=file_dict['facilities.csv']) if cache is None else \
+            cache.load_facilities(file=file_dict['facilities.csv'])
+
+        # load covenants
+        covenants = Covenant.load(file=file_dict['covenants.csv']) if cache is None else \
+            cache.load_covenants(file=file_dict['covenants.csv'])
+
+    with phase('covenants'):
+        return index_facilities(facilities=facilities, covenants=covenants)
+
+
+def assign_objects(file_dict, cache=None):
+    '''
+    object engine: assign loans one by one through FacilityIndex & Eligibility.
+
+    :param file_dict: dict, filename -> file path.
+    :param cache: SnapshotCache to load inputs through, None to parse csv.
+    :return: assignments list & yields list, both ordered by id.
+    '''
+
+    facility_index, eligibility, portfolio = build_index(file_dict=file_dict, cache=cache)
+
+    # load loans into compact LoanBook.
+    with phase('load'):
+        loans = LoanBook.load(file=file_dict['loans.csv']) if cache is None else \
+            cache.load_loans(file=file_dict['loans.csv'])
+
+    with phase('assign'):
+        assignments = []
+
+        # process each loans.
+        for loan in loans:
+            facility = find_facility(loan=loan, facility_index=facility_index, eligibility=eligibility)
+            if facility is not None:
+                assignments.append([loan.id, facility.id])
+                portfolio.assign(facility=facility, loan=loan)
+            else:
+                assignments.append([loan.id, ''])
+
+        yields = [(facility.id, str(facility.get_yield())) for facility in facility_index]
+
+        return sorted(assignments, key=lambda x: int(x[0])), sorted(yields, key=lambda x: int(x[0]))
+
+
+def assign_streaming(file_dict, file_dir, chunk_size=1 << 20):
+    '''
+    streaming mode of object engine: loans are read lazily & assignments written as they are decided.
+    nothing but running yields is kept per facility, memory is bounded by facilities & chunk_size.
+
+    :param file_dict: dict, filename -> file path.
+    :param file_dir: str, output directory.
+    :param chunk_size: int, max number of assignments held in memory when input is not in id order.
+    :return: yields list ordered by id.
+    '''
+
+    facility_index, eligibility, portfolio = build_index(file_dict=file_dict)
+
+    def decide():
+        for loan in Loan.stream(file=file_dict['loans.csv']):
+            facility = find_facility(loan=loan, facility_index=facility_index, eligibility=eligibility)
+            if facility is not None:
+                portfolio.assign(facility=facility, loan=loan)
+                yield [loan.id, facility.id]
+            else:
+                yield [loan.id, '']
+
+    # loans are read, assigned & written in one go.
+    with phase('assign'):
+        write_sorted(file_dir=file_dir, file_name='assignments.csv',
+                     header='loan_id,facility_id',
+                     data_iter=decide(), key=lambda x: int(x[0]), chunk_size=chunk_size)
+
+    yields = [(facility.id, str(facility.get_yield())) for facility in facility_index]
+
+    return sorted(yields, key=lambda x: int(x[0]))
+
+
+def assign_columnar(file_dict, cache=None):
+    '''
+    columnar engine: assign loans in vectorized eligibility blocks through ColumnarEngine (requires numpy).
+
+    :param file_dict: dict, filename -> file path.
+    :param cache: unused, columnar engine parses csv through numpy directly.
+    :return: assignments list & yields list, both ordered by id.
+    '''
+
+    # process covenants
+    with phase('covenants'):
+        covenant_map = process_covenants(covenants=Covenant.load(file=file_dict['covenants.csv']))
+
+    # load facilities & loans into arrays.
+    with phase('load'):
+        engine = ColumnarEngine.load(file_dict=file_dict, covenant_map=covenant_map)
+
+    # process loans block by block.
+    with phase('assign'):
+        engine.assign()
+
+        return engine.assignments(), engine.yields()
+
+
+def assign_optimized(file_dict, cache=None, budget=10.0):
+    '''
+    optimize engine: greedy object engine pass, then LocalSearch moves raising total yield within a time budget.
+
+    :param file_dict: dict, filename -> file path.
+    :param cache: SnapshotCache to load inputs through, None to parse csv.
+    :param budget: float, wall clock seconds for the local search.
+    :return: assignments list & yields list, both ordered by id.
+    '''
+
+    facility_index, eligibility, portfolio = build_index(file_dict=file_dict, cache=cache)
+    positions = {facility.id: position for position, facility in enumerate(facility_index.facilities)}
+
+    # load loans into compact LoanBook.
+    with phase('load'):
+        loans = LoanBook.load(file=file_dict['loans.csv']) if cache is None else \
+            cache.load_loans(file=file_dict['loans.csv'])
+
+    # greedy pass, facility position per loan.
+    with phase('assign'):
+        assigned = []
+        for loan in loans:
+            facility = find_facility(loan=loan, facility_index=facility_index, eligibility=eligibility)
+            if facility is not None:
+                portfolio.assign(facility=facility, loan=loan)
+                assigned.append(positions[facility.id])
+            else:
+                assigned.append(-1)
+
+    with phase('optimize'):
+        local_search = LocalSearch(loans=loans, assigned=assigned, facility_index=facility_index,
+                                   eligibility=eligibility, portfolio=portfolio)
+        report = local_search.run(budget=budget)
+    print(f'Optimized yield {report["initial_yield"]:.0f} -> {report["final_yield"]:.0f} '
+          f'with {report["moves"]} moves in {report["seconds"]:.3f}s '
+          f'({report["yield_per_second"]:.0f} yield/s)')
+
+    facilities = facility_index.facilities
+    assignments = [[loan.id, facilities[position].id if position >= 0 else '']
+                   for loan, position in zip(loans, assigned)]
+    # facilities still in the index after the search (like a plain run lists), plus used up ones holding loans.
+    listed = {facility.id for facility in facility_index}
+    yields = [(facility.id, str(facility.get_yield())) for facility, members in zip(facilities, local_search.members)
+              if facility.id in listed or members]
+
+    return sorted(assignments, key=lambda x: int(x[0])), sorted(yields, key=lambda x: int(x[0]))
+
+
+def assign_incremental(file_dict, file_dir, checkpoint_file, verify=False):
+    '''
+    checkpointed object engine: restore facility state saved by the previous run and assign only loans
+    appended to loans.csv since, their assignments get appended to assignments.csv.
+    falls back to a full run when the checkpoint is missing or doesn't match the inputs.
+    checkpoint is refreshed once assignments are written.
+    O(delta) when new ids follow the existing ones, new ids lower than existing ones rewrite assignments.csv (O(book)).
+
+    :param file_dict: dict, filename -> file path.
+    :param file_dir: str, output directory.
+    :param checkpoint_file: str, checkpoint path.
+    :param verify: bool, check & record full sha256 of loans.csv prefix & assignments.csv (O(book)).
+    :return: yields list ordered by id.
+    '''
+
+    facility_index, eligibility, portfolio = build_index(file_dict=file_dict)
+    path = os.path.join(file_dir, 'assignments.csv')
+    header = 'loan_id,facility_id'
+
+    checkpoint = Checkpoint.load(file=checkpoint_file)
+    reason = 'no checkpoint' if checkpoint is None else checkpoint.check(file_dict=file_dict, verify=verify)
+    if reason is None:
+        reason = checkpoint.recover_output(output_file=path, verify=verify)
+
+    if reason is None:
+        checkpoint.restore(facility_index=facility_index, portfolio=portfolio)
+        loans = dict(checkpoint.loans)
+        print(f'Continuing from checkpoint after loan {loans["last_id"]} ({loans["count"]} loans)')
+    else:
+        print(f'Full run, {reason}')
+        loans = {'offset': None, 'last_offset': None, 'last_id': None, 'max_id': None, 'count': 0}
+
+    # process only loans after the checkpoint.
+    with phase('assign'):
+        assignments = []
+        for start, end, loan in read_loans(file=file_dict['loans.csv'], offset=loans['offset']):
+            facility = find_facility(loan=loan, facility_index=facility_index, eligibility=eligibility)
+            if facility is not None:
+                assignments.append([loan.id, facility.id])
+                portfolio.assign(facility=facility, loan=loan)
+            else:
+                assignments.append([loan.id, ''])
+            loans['last_offset'], loans['offset'], loans['last_id'] = start, end, loan.id
+
+    with phase('write'):
+        assignments.sort(key=lambda x: int(x[0]))
+        if reason is not None:
+            write(file_dir=file_dir, file_name='assignments.csv', header=header, data_list=assignments)
+        elif assignments and (loans['max_id'] is None or int(assignments[0][0]) > loans['max_id']):
+            # new ids follow the existing ones, plain append.
+            with open(path, 'a') as fh:
+                for data in assignments:
+                    fh.write('{}\n'.format(','.join(data)))
+            print(f'Appended {len(assignments)} assignments: {path}')
+        elif assignments:
+            # new ids interleave with existing ones, merge them in: rewrites the whole file, O(book) fallback.
+            with tempfile.TemporaryDirectory(dir=file_dir) as run_dir:
+                run = os.path.join(run_dir, 'run-new')
+                write(file_dir=run_dir, file_name='run-new', header=header, data_list=assignments)
+                merge_runs(runs=[(path, True), (run, True)], path=os.path.join(run_dir, 'merged'),
+                           key=lambda x: int(x[0]), header=header)
+                os.replace(os.path.join(run_dir, 'merged'), path)
+            print(f'Merged {len(assignments)} assignments: {path}')
+
+        if assignments and (loans['max_id'] is None or int(assignments[-1][0]) > loans['max_id']):
+            loans['max_id'] = int(assignments[-1][0])
+        loans['count'] += len(assignments)
+        Checkpoint.capture(file_dict=file_dict, facility_index=facility_index, loans=loans,
+                           output_file=path, verify=verify).save(file=checkpoint_file)
+        print(f'Wrote: {checkpoint_file}')
+
+    yields = [(facility.id, str(facility.get_yield())) for facility in facility_index]
+
+    return sorted(yields, key=lambda x: int(x[0]))
+
+
+def verify(file_dict, file_dir):
+    '''
+    recompute every assignment from scratch & compare with the output files.
+
+    :param file_dict: dict, filename -> file path.
+    :param file_dir: str, output directory.
+    :return: list of output file names that differ from the full recompute.
+    '''
+
+    assignments, yields = assign_objects(file_dict=file_dict)
+    expected = {'assignments.csv': ['loan_id,facility_id'] + [','.join(data) for data in assignments],
+                'yields.csv': ['facility_id,expected_yield'] + [','.join(data) for data in yields]}
+
+    mismatches = []
+    for file_name, lines in expected.items():
+        with open(os.path.join(file_dir, file_name), 'r') as fh:
+            if fh.read().splitlines() != lines:
+                mismatches.append(file_name)
+    return mismatches
+
+
+ENGINES = {
+    'object': assign_objects,
+    'columnar': assign_columnar,
+    'optimize': assign_optimized,
+}
+
+
 def get_files(input_dir):
     '''
     Basic input file list gatherer.
@@ -111,64 +479,93 @@ def get_files(input_dir):
 
 def prompt():
     '''
-    Prompt to take input files dir.
-    :return: input dir path, output file path (e.g. large/small).
+    Prompt to take input files dir & assignment engine.
+    :return: input dir path (e.g. large/small), engine name, streaming flag, snapshot cache dir, time budget,
+             checkpoint path, verify flag, profile flag, cProfile dump path.
     '''
 
     parser = argparse.ArgumentParser(description='Loan Assignment Program')
     required_arguments = parser.add_argument_group('required arguments')
     required_arguments.add_argument('-d', '--file_dir', help='Input/Output file directory')
+    parser.add_argument('-e', '--engine', choices=sorted(ENGINES), default='object',
+                        help='Assignment engine, columnar requires numpy (default: object)')
+    parser.add_argument('-t', '--time_budget', type=float, default=10.0,
+                        help='Seconds the optimize engine may spend improving yield (default: 10)')
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='Stream loans & assignments with bounded memory (object engine only)')
+    parser.add_argument('-c', '--cache_dir', default=None,
+                        help='Load inputs through binary snapshots kept in this directory (object engine only)')
+    parser.add_argument('-k', '--checkpoint', default=None,
+                        help='Assign only loans added since this checkpoint & refresh it (object engine only)')
+    parser.add_argument('--verify', action='store_true',
+                        help='Check checkpointed inputs & outputs by full hash and against a full recompute')
+    parser.add_argument('-p', '--profile', action='store_true',
+                        help='Report wall time per phase & hot path counters')
+    parser.add_argument('--profile_dump', default=None,
+                        help='Also write cProfile stats of the run to this file (implies --profile)')
     args = parser.parse_args(args=None if sys.argv[1:] else ['-h'])
     file_dir = args.file_dir
 
     # minor input validation.
     if not os.path.exists(file_dir) :
         raise ValueError('Invalid dir {}'.format(file_dir))
+    if args.stream and args.engine != 'object':
+        raise ValueError('Streaming mode supports object engine only')
+    if args.cache_dir is not None and (args.stream or args.engine == 'columnar'):
+        raise ValueError('Snapshot cache supports non streaming object/optimize engines only')
+    if args.checkpoint is not None and (args.stream or args.cache_dir is not None or args.engine != 'object'):
+        raise ValueError('Checkpoint supports non streaming, non cached object engine only')
+    if args.verify and args.checkpoint is None:
+        raise ValueError('Verify requires checkpoint')
 
-    return file_dir
+    return file_dir, args.engine, args.stream, args.cache_dir, args.time_budget, args.checkpoint, args.verify, \
+        args.profile or args.profile_dump is not None, args.profile_dump
 
 
 if __name__ == '__main__':
 
-    file_dir = prompt()
-    print(f'Reading files from {file_dir}')
+    file_dir, engine, stream, cache_dir, time_budget, checkpoint_file, verify_outputs, profile, profile_dump = prompt()
+    print(f'Reading files from {file_dir}, engine {engine}' + (', streaming' if stream else ''))
+
+    # instrumentation is only wired in when asked for.
+    profiler = Profiler(dump=profile_dump) if profile else None
+    if profiler is not None:
+        profiler.install(namespace=globals())
 
     # Collect input files.
     file_dict = get_files(input_dir=file_dir)
 
-    # load facilities
-    facilities = Facility.load(file=file_dict['facilities.csv'])
-
-    # load covenants
-    covenants = Covenant.load(file=file_dict['covenants.csv'])
-
-    # load loans
-    loans = Loan.load(file=file_dict['loans.csv'])
-
-    # process covenants
-    covenant_map = process_covenants(covenants=covenants)
-
-    # sort the facilities first.
-    heapq.heapify(facilities)
-
-    assignments = []
-
-    # process each loans.
-    for loan in loans:
-        facility = find_facility(loan=loan, facilities=facilities, covenant_map=covenant_map)
-        if facility is not None:
-            assignments.append([loan.id, facility.id])
-            facility.loans.append(loan)
-        else:
-            assignments.append([loan.id, ''])
-
-    # write result
-    write(file_dir=file_dir, file_name='assignments.csv',
-          header='loan_id,facility_id',
-          data_list=sorted(assignments, key=lambda x: int(x[0])))
+    if checkpoint_file is not None:
+        # assign loans added since checkpoint, assignments get appended.
+        yields = assign_incremental(file_dict=file_dict, file_dir=file_dir, checkpoint_file=checkpoint_file,
+                                    verify=verify_outputs)
+    elif stream:
+        # assign loans to facilities, assignments get written on the go.
+        yields = assign_streaming(file_dict=file_dict, file_dir=file_dir)
+    else:
+        # assign loans to facilities.
+        cache = None if cache_dir is None else SnapshotCache(cache_dir=cache_dir)
+        options = {'budget': time_budget} if engine == 'optimize' else {}
+        assignments, yields = ENGINES[engine](file_dict=file_dict, cache=cache, **options)
+
+        # write result
+        with phase('write'):
+            write(file_dir=file_dir, file_name='assignments.csv',
+                  header='loan_id,facility_id',
+                  data_list=assignments)
 
     # write yields
-    yields = [(facility.id, str(facility.get_yield())) for facility in facilities]
-    write(file_dir=file_dir, file_name='yields.csv',
-          header='facility_id,expected_yield',
-          data_list=sorted(yields, key=lambda x: int(x[0])))
+    with phase('write'):
+        write(file_dir=file_dir, file_name='yields.csv',
+              header='facility_id,expected_yield',
+              data_list=yields)
+
+    if profiler is not None:
+        profiler.uninstall()
+        print('\n'.join(profiler.report()))
+
+    if verify_outputs:
+        mismatches = verify(file_dict=file_dict, file_dir=file_dir)
+        if mismatches:
+            sys.exit(f'Verify failed, {", ".join(mismatches)} differ from full recompute')
+        print('Verified: outputs match full recompute')
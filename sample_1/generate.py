@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+import argparse
+import math
+import os
+import random
+import sys
+from itertools import accumulate
+
+STATES = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS',
+          'KY', 'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC',
+          'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
+LOAN_INTEREST_RATES = [0.15, 0.25, 0.35]
+FACILITY_INTEREST_RATES = [rate / 100 for rate in range(1, 11)]
+DEFAULT_LIKELIHOODS = [likelihood / 100 for likelihood in range(0, 16)]
+BANK_NAMES = ['American Trust', 'Bank of Fun', 'Chase Bank', 'Johnsons First', 'National Union',
+              'First Savings', 'Pacific Credit', 'Union Mutual']
+
+
+def zipf_weights(count, skew):
+    '''
+    :param count: int, number of ranks.
+    :param skew: float, zipf exponent, 0 for uniform.
+    :return: list of cumulative weights, rank 1 heaviest.
+    '''
+    return list(accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+class BookGenerator:
+    '''
+    BookGenerator class.
+
+    Synthetic loan book shaped like the sample inputs, at any size:
+        - state: zipf skewed over a shuffled state ranking, so a few states dominate.
+        - default likelihood: geometric-like, most loans low risk with a long tail up to 0.15.
+        - interest rate: riskier loans tend to pay higher rates.
+        - amount: log-normal around 50000.
+        - facilities: total amount is capacity_ratio of total loan amount, split with pareto skew across facilities.
+        - covenants: density per facility, banned states drawn with the same state skew (popular states get banned more).
+    '''
+
+    def __init__(self, loan_count, facility_count=100, bank_count=5, covenant_density=2.0, skew=1.0,
+                 capacity_ratio=0.8, seed=0):
+        '''
+        :param loan_count: int, number of loans.
+        :param facility_count: int, number of facilities.
+        :param bank_count: int, number of banks.
+        :param covenant_density: float, average number of covenants per facility.
+        :param skew: float, skew of state, default likelihood & amount distributions, 0 for uniform.
+        :param capacity_ratio: float, total facility amount over total loan amount.
+        :param seed: int, random seed, same seed & parameters give identical files.
+        '''
+        self.loan_count = loan_count
+        self.facility_count = facility_count
+        self.bank_count = bank_count
+        self.covenant_density = covenant_density
+        self.skew = skew
+        self.capacity_ratio = capacity_ratio
+        self.seed = seed
+
+        rng = random.Random(seed)
+        self.states = rng.sample(STATES, len(STATES))
+        self.state_weights = zipf_weights(len(self.states), skew)
+        self.likelihood_weights = list(accumulate(math.exp(-skew * index / 4)
+                                                  for index in range(len(DEFAULT_LIKELIHOODS))))
+
+    def loans(self, rng):
+        ''' :return: generator of loans.csv rows. '''
+        states = rng.choices(self.states, cum_weights=self.state_weights, k=self.loan_count)
+        likelihoods = rng.choices(range(len(DEFAULT_LIKELIHOODS)), cum_weights=self.likelihood_weights,
+                                  k=self.loan_count)
+        sigma = 0.2 + 0.4 * self.skew
+        for id, (state, likelihood) in enumerate(zip(states, likelihoods), 1):
+            # rate bucket leans towards higher rates as default likelihood grows.
+            rate = LOAN_INTEREST_RATES[min(2, int(rng.random() + 3 * likelihood / len(DEFAULT_LIKELIHOODS)))]
+            amount = min(1000000, max(1000, int(rng.lognormvariate(math.log(50000), sigma))))
+            yield f'{rate},{amount},{id},{DEFAULT_LIKELIHOODS[likelihood]},{state}\n'
+
+    def facilities(self, rng, total_amount):
+        ''' :return: list of facilities.csv rows (amount, interest_rate, id, bank_id). '''
+        weights = [rng.paretovariate(1 + 2 / max(self.skew, 0.1)) for _ in range(self.facility_count)]
+        scale = total_amount * self.capacity_ratio / sum(weights)
+        return [(round(weight * scale, 1), rng.choice(FACILITY_INTEREST_RATES), id, rng.randint(1, self.bank_count))
+                for id, weight in enumerate(weights, 1)]
+
+    def covenants(self, rng, facilities):
+        ''' :return: list of covenants.csv rows (facility_id, max_default_likelihood, bank_id, banned_state). '''
+        covenants = []
+        for _, _, id, bank_id in facilities:
+            # binomial count averaging covenant_density.
+            count = sum(1 for _ in range(int(2 * self.covenant_density)) if rng.random() < 0.5)
+            for _ in range(count):
+                likelihood = rng.choice(['', '', str(rng.choice(DEFAULT_LIKELIHOODS[5:]))])
+                state = rng.choices(self.states, cum_weights=self.state_weights)[0]
+                covenants.append((id, likelihood, bank_id, state))
+        return covenants
+
+    def write(self, file_dir):
+        '''
+        write banks.csv, facilities.csv, covenants.csv & loans.csv into file_dir.
+
+        :param file_dir: str, output directory, created if missing.
+        '''
+        os.makedirs(file_dir, exist_ok=True)
+        rng = random.Random(self.seed)
+
+        total_amount = 0
+        with open(os.path.join(file_dir, 'loans.csv'), 'w') as fh:
+            fh.write('interest_rate,amount,id,default_likelihood,state\n')
+            for row in self.loans(rng):
+                total_amount += int(row.split(',', 2)[1])
+                fh.write(row)
+
+        facilities = self.facilities(rng, total_amount)
+        with open(os.path.join(file_dir, 'facilities.csv'), 'w') as fh:
+            fh.write('amount,interest_rate,id,bank_id\n')
+            for facility in facilities:
+                fh.write('{},{},{},{}\n'.format(*facility))
+
+        with open(os.path.join(file_dir, 'covenants.csv'), 'w') as fh:
+            fh.write('facility_id,max_default_likelihood,bank_id,banned_state\n')
+            for covenant in self.covenants(rng, facilities):
+                fh.write('{},{},{},{}\n'.format(*covenant))
+
+        with open(os.path.join(file_dir, 'banks.csv'), 'w') as fh:
+            fh.write('id,name\n')
+            for id in range(1, self.bank_count + 1):
+                fh.write(f'{id},{BANK_NAMES[(id - 1) % len(BANK_NAMES)]}\n')
+
+
+def prompt():
+    '''
+    Prompt to take output dir & book shape.
+    :return: output dir path, BookGenerator.
+    '''
+    parser = argparse.ArgumentParser(description='Synthetic Loan Book Generator')
+    required_arguments = parser.add_argument_group('required arguments')
+    required_arguments.add_argument('-o', '--output_dir', help='Output file directory')
+    parser.add_argument('-l', '--loans', type=int, default=100000, help='Number of loans (default: 100000)')
+    parser.add_argument('-f', '--facilities', type=int, default=100, help='Number of facilities (default: 100)')
+    parser.add_argument('-b', '--banks', type=int, default=5, help='Number of banks (default: 5)')
+    parser.add_argument('--covenant_density', type=float, default=2.0,
+                        help='Average covenants per facility (default: 2)')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='Skew of state, default likelihood & amount, 0 for uniform (default: 1)')
+    parser.add_argument('--capacity_ratio', type=float, default=0.8,
+                        help='Total facility amount over total loan amount (default: 0.8)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    args = parser.parse_args(args=None if sys.argv[1:] else ['-h'])
+
+    # minor input validation.
+    if args.output_dir is None:
+        raise ValueError('Missing output dir')
+    if args.loans < 0 or args.facilities < 1 or args.banks < 1:
+        raise ValueError('Invalid book size {} loans, {} facilities, {} banks'.format(
+            args.loans, args.facilities, args.banks))
+
+    return args.output_dir, BookGenerator(loan_count=args.loans, facility_count=args.facilities,
+                                          bank_count=args.banks, covenant_density=args.covenant_density,
+                                          skew=args.skew, capacity_ratio=args.capacity_ratio, seed=args.seed)
+
+
+if __name__ == '__main__':
+
+    output_dir, generator = prompt()
+    generator.write(file_dir=output_dir)
+    print(f'Generated {generator.loan_count} loans, {generator.facility_count} facilities in {output_dir}')
@@ -1,4 +1,5 @@
 import csv
+import sys
 
 
 class Loan:
@@ -6,6 +7,9 @@ class Loan:
     Loan class.
     '''
 
+    # no per instance __dict__, loan books run into millions of objects.
+    __slots__ = ('id', 'interest_rate', 'default_likelihood', 'amount', 'state', 'facility_id')
+
     def __init__(self, id, interest_rate, default_likelihood, amount, state):
         '''
         :param id: str, loan id
@@ -38,15 +42,19 @@ class Loan:
 
         :param file: path to loans.csv
         '''
-        loan_dict = csv.DictReader(open(file, mode='r'))
-        loans = []
-
-        for line in loan_dict:
-            loan = Loan(id=line['id'],
-                        amount=int(line['amount']),
-                        interest_rate=float(line['interest_rate']),
-                        default_likelihood=float(line['default_likelihood']),
-                        state=line['state'])
-            loans.append(loan)
-
-        return loans
+        return list(Loan.stream(file))
+
+    @staticmethod
+    def stream(file):
+        '''
+        Lazily yield plain Loan objects from the input file, one line at a time.
+
+        :param file: path to loans.csv
+        '''
+        with open(file, mode='r') as fh:
+            for line in csv.DictReader(fh):
+                yield Loan(id=line['id'],
+                           amount=int(line['amount']),
+                           interest_rate=float(line['interest_rate']),
+                           default_likelihood=float(line['default_likelihood']),
+                           state=sys.intern(line['state']))
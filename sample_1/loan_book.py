@@ -0,0 +1,205 @@
+import csv
+from array import array
+from multiprocessing.shared_memory import SharedMemory
+
+
+class LoanView:
+    '''
+    LoanView class.
+
+    Lightweight Loan compatible view of a single LoanBook row, holds only book reference & row index.
+    '''
+
+    __slots__ = ('book', 'index')
+
+    def __init__(self, book, index):
+        '''
+        :param book: LoanBook, owning book.
+        :param index: int, row index within the book.
+        '''
+        self.book = book
+        self.index = index
+
+    @property
+    def id(self):
+        book = self.book
+        return str(book.id_data[book.id_offsets[self.index]:book.id_offsets[self.index + 1]], 'utf-8')
+
+    @property
+    def interest_rate(self):
+        return self.book.interest_rates[self.index]
+
+    @property
+    def default_likelihood(self):
+        return self.book.default_likelihoods[self.index]
+
+    @property
+    def amount(self):
+        return self.book.amounts[self.index]
+
+    @property
+    def state(self):
+        return self.book.states[self.book.state_codes[self.index]]
+
+    @property
+    def facility_id(self):
+        code = self.book.facility_codes[self.index]
+        return None if code < 0 else self.book.facility_ids[code]
+
+    @facility_id.setter
+    def facility_id(self, facility_id):
+        book = self.book
+        book.facility_codes[self.index] = -1 if facility_id is None else \
+            book.intern(book.facility_ids, book.facility_codes_map, facility_id)
+
+    def __repr__(self):
+        return (
+                f'Loan [id:{self.id}, '
+                f'interest_rate:{self.interest_rate}, '
+                f'default_likelihood:{self.default_likelihood}, '
+                f'amount:{self.amount}, '
+                f'state:{self.state}]'
+        )
+
+
+class LoanBook:
+    '''
+    LoanBook class.
+
+    Struct of arrays loan storage: one typed array per Loan field, ids packed into a single byte buffer
+    & state/facility ids interned into small integer codes. Hands out LoanView objects on access.
+    Can be copied into shared memory once & attached read-only from other processes.
+    '''
+
+    # fields copied into shared memory/snapshots, facility assignments stay private to each process.
+    SHARED_FIELDS = ('id_data', 'id_offsets', 'interest_rates', 'default_likelihoods', 'amounts', 'state_codes')
+
+    def __init__(self):
+        # id of row i is id_data[id_offsets[i]:id_offsets[i + 1]].
+        self.id_data = bytearray()
+        self.id_offsets = array('Q', [0])
+        self.interest_rates = array('d')
+        self.default_likelihoods = array('d')
+        self.amounts = array('q')
+        # state code per row, code -> state.
+        self.state_codes = array('H')
+        self.states = []
+        self.state_codes_map = {}
+        # assigned facility code per row (-1 if unassigned), code -> facility id.
+        self.facility_codes = array('i')
+        self.facility_ids = []
+        self.facility_codes_map = {}
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError('LoanBook index out of range')
+        return LoanView(book=self, index=index % len(self))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield LoanView(book=self, index=index)
+
+    @staticmethod
+    def intern(values, codes_map, value):
+        ''' :return: int, code of value, newly assigned when seen first. '''
+        code = codes_map.get(value)
+        if code is None:
+            code = codes_map[value] = len(values)
+            values.append(value)
+        return code
+
+    def append(self, id, interest_rate, default_likelihood, amount, state):
+        '''
+        append a loan row.
+
+        :param id: str, loan id
+        :param interest_rate: float, interest rate
+        :param default_likelihood: float, default likelihood
+        :param amount: int, amount
+        :param state: str, state code
+        :return: LoanView of the new row.
+        '''
+        self.id_data += id.encode()
+        self.id_offsets.append(len(self.id_data))
+        self.interest_rates.append(interest_rate)
+        self.default_likelihoods.append(default_likelihood)
+        self.amounts.append(amount)
+        self.state_codes.append(self.intern(self.states, self.state_codes_map, state))
+        self.facility_codes.append(-1)
+        return LoanView(book=self, index=len(self) - 1)
+
+    def share(self):
+        '''
+        copy loan rows into shared memory blocks.
+
+        :return: list of SharedMemory blocks (caller closes & unlinks them),
+                 picklable descriptor to pass to LoanBook.attach.
+        '''
+        blocks = []
+        fields = {}
+        try:
+            for name in self.SHARED_FIELDS:
+                data = getattr(self, name)
+                buffer = memoryview(data).cast('B')
+                block = SharedMemory(create=True, size=max(1, len(buffer)))
+                blocks.append(block)
+                block.buf[:len(buffer)] = buffer
+                fields[name] = (block.name, data.typecode if isinstance(data, array) else 'B', len(buffer))
+        except Exception:
+            for block in blocks:
+                block.close()
+                block.unlink()
+            raise
+        return blocks, {'fields': fields, 'states': list(self.states)}
+
+    @staticmethod
+    def attach(descriptor):
+        '''
+        attach a read-only LoanBook to shared memory blocks created by LoanBook.share, without copying rows.
+
+        :param descriptor: dict, descriptor returned by LoanBook.share.
+        :return: LoanBook, list of attached SharedMemory blocks to keep alive while the book is used.
+        '''
+        blocks = []
+        buffers = {}
+        for name, (block_name, typecode, size) in descriptor['fields'].items():
+            block = SharedMemory(name=block_name)
+            blocks.append(block)
+            buffers[name] = block.buf[:size].cast(typecode)
+        return LoanBook.from_buffers(buffers=buffers, states=descriptor['states']), blocks
+
+    @staticmethod
+    def from_buffers(buffers, states):
+        '''
+        read-only LoanBook over existing typed buffers (shared memory, mmap ...), rows are not copied.
+
+        :param buffers: dict, SHARED_FIELDS name -> memoryview cast to the field typecode.
+        :param states: list of str, state code -> state.
+        '''
+        book = LoanBook()
+        for name in LoanBook.SHARED_FIELDS:
+            setattr(book, name, buffers[name])
+        for state in states:
+            book.intern(book.states, book.state_codes_map, state)
+        book.facility_codes = array('i', [-1]) * len(book.amounts)
+        return book
+
+    @staticmethod
+    def load(file):
+        '''
+        Load loans from the input file into a LoanBook.
+
+        :param file: path to loans.csv
+        '''
+        book = LoanBook()
+        with open(file, mode='r') as fh:
+            for line in csv.DictReader(fh):
+                book.append(id=line['id'],
+                            amount=int(line['amount']),
+                            interest_rate=float(line['interest_rate']),
+                            default_likelihood=float(line['default_likelihood']),
+                            state=line['state'])
+        return book
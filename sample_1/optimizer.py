@@ -0,0 +1,177 @@
+import time
+from bisect import bisect_left, insort
+
+
+class LocalSearch:
+    '''
+    LocalSearch class.
+
+    Improves total expected yield of a greedy assignment within a wall clock budget,
+    keeping every covenant & capacity constraint and every loan the greedy pass assigned:
+        - relocate: move an assigned loan to a cheaper eligible facility with room.
+        - swap: exchange two loans so the larger one sits in the cheaper facility.
+        - insert: assign a still unassigned loan into a facility with room when its yield is positive.
+    Passes repeat until no move improves or the budget is spent.
+    '''
+
+    def __init__(self, loans, assigned, facility_index, eligibility, portfolio):
+        '''
+        :param loans: LoanBook or list of Loan objects, indexed by loan index.
+        :param assigned: list of int, facility position per loan index, -1 if unassigned.
+        :param facility_index: FacilityIndex holding remaining amounts after the greedy pass.
+        :param eligibility: Eligibility compiled against facility_index positions.
+        :param portfolio: Portfolio holding the greedy assignment yields.
+        '''
+        self.loans = loans
+        self.assigned = assigned
+        self.facility_index = facility_index
+        self.eligibility = eligibility
+        self.portfolio = portfolio
+
+        # facility position -> sorted [(amount, loan index) ...] of its loans.
+        self.members = [[] for _ in facility_index.facilities]
+        for index, position in enumerate(assigned):
+            if position >= 0:
+                self.members[position].append((loans[index].amount, index))
+        for members in self.members:
+            members.sort()
+
+        self.moves = 0
+        # wall clock deadline of the current run, swap checks it while scanning candidates.
+        self.deadline = float('inf')
+
+    def eligible(self, position, loan):
+        return self.eligibility.check(position, loan.default_likelihood, loan.state)
+
+    def move(self, index, position):
+        '''
+        reassign loan to facility at position (-1 to leave it unassigned) & keep amounts/yields/index in sync.
+
+        :param index: int, loan index.
+        :param position: int, target facility position.
+        '''
+        loan = self.loans[index]
+        facilities = self.facility_index.facilities
+
+        source = self.assigned[index]
+        if source >= 0:
+            self.portfolio.unassign(facility=facilities[source], loan=loan)
+            facilities[source].amount += loan.amount
+            self.facility_index.update(source)
+            members = self.members[source]
+            del members[bisect_left(members, (loan.amount, index))]
+
+        if position >= 0:
+            self.portfolio.assign(facility=facilities[position], loan=loan)
+            facilities[position].amount -= loan.amount
+            self.facility_index.update(position)
+            insort(self.members[position], (loan.amount, index))
+
+        self.assigned[index] = position
+        self.moves += 1
+
+    def cheaper_position(self, index, stop):
+        '''
+        :param index: int, loan index.
+        :param stop: int, only facilities before this position are considered.
+        :return: int, cheapest eligible facility position with room for the loan, None if none.
+        '''
+        loan = self.loans[index]
+        candidates = self.eligibility.mask(loan.default_likelihood, loan.state) & ((1 << stop) - 1)
+        if not candidates:
+            return None
+        position = self.facility_index.find(loan.amount, start=(candidates & -candidates).bit_length() - 1)
+        while position is not None and position < stop:
+            if candidates >> position & 1:
+                return position
+            remaining = candidates >> (position + 1)
+            if not remaining:
+                return None
+            position = self.facility_index.find(loan.amount, start=position + (remaining & -remaining).bit_length())
+        return None
+
+    def relocate(self, index):
+        ''' move loan to a cheaper facility with room, :return: bool, whether yield improved. '''
+        source = self.assigned[index]
+        target = self.cheaper_position(index, stop=source)
+        if target is None:
+            return False
+        facilities = self.facility_index.facilities
+        loan = self.loans[index]
+        if facilities[target].loan_yield(loan) <= facilities[source].loan_yield(loan):
+            return False
+        self.move(index, target)
+        return True
+
+    def swap(self, index):
+        ''' swap loan with a smaller loan of a cheaper facility, :return: bool, whether yield improved. '''
+        loan = self.loans[index]
+        source = self.assigned[index]
+        facilities = self.facility_index.facilities
+        mask = self.eligibility.mask(loan.default_likelihood, loan.state)
+
+        for target in range(source):
+            if not mask >> target & 1:
+                continue
+            room = max(facilities[target].amount, 0)
+            members = self.members[target]
+            # smallest loan of target that frees enough room, yet smaller than the loan itself.
+            for member in range(bisect_left(members, (loan.amount - room, -1)), len(members)):
+                # scanning candidates of one loan can take long, don't overshoot the budget.
+                if time.monotonic() >= self.deadline:
+                    return False
+                amount, other = members[member]
+                if amount >= loan.amount:
+                    break
+                other_loan = self.loans[other]
+                if facilities[target].amount + amount < loan.amount or not self.eligible(source, other_loan):
+                    continue
+                gain = (facilities[target].loan_yield(loan) + facilities[source].loan_yield(other_loan) -
+                        facilities[source].loan_yield(loan) - facilities[target].loan_yield(other_loan))
+                if gain <= 0:
+                    break
+                # take the larger loan out first so the cheaper facility never goes over its amount.
+                self.move(other, -1)
+                self.move(index, target)
+                self.move(other, source)
+                self.moves -= 2
+                return True
+        return False
+
+    def insert(self, index):
+        ''' assign unassigned loan when some facility has room, :return: bool, whether yield improved. '''
+        position = self.cheaper_position(index, stop=len(self.facility_index.facilities))
+        if position is None or self.facility_index.facilities[position].loan_yield(self.loans[index]) <= 0:
+            return False
+        self.move(index, position)
+        return True
+
+    def run(self, budget):
+        '''
+        improve assignment until no move helps or budget runs out.
+
+        :param budget: float, wall clock seconds.
+        :return: dict, yield before/after, seconds spent, moves made & yield gained per second.
+        '''
+        start = time.monotonic()
+        deadline = self.deadline = start + budget
+        initial_yield = self.portfolio.total_yield.get_value()
+
+        improved = True
+        while improved and time.monotonic() < deadline:
+            improved = False
+            for index in range(len(self.assigned)):
+                if index % 256 == 0 and time.monotonic() >= deadline:
+                    break
+                if self.assigned[index] < 0:
+                    improved |= self.insert(index)
+                elif self.assigned[index] > 0:
+                    improved |= self.relocate(index) or self.swap(index)
+
+        elapsed = time.monotonic() - start
+        gained = self.portfolio.total_yield.get_value() - initial_yield
+        return {'initial_yield': initial_yield,
+                'final_yield': initial_yield + gained,
+                'seconds': elapsed,
+                'moves': self.moves,
+                'yield_per_second': gained / elapsed if elapsed > 0 else 0.0}
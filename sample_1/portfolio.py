@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+from accumulator import YieldAccumulator
+
+
+class Portfolio:
+    '''
+    Portfolio class.
+
+    Running expected yield per bank & across all facilities,
+    updated in O(1) together with the facility on every loan assign/unassign.
+    '''
+
+    def __init__(self):
+        self.bank_yields = defaultdict(YieldAccumulator)
+        self.total_yield = YieldAccumulator()
+
+    def assign(self, facility, loan):
+        '''
+        assign loan to facility & account its expected yield.
+
+        :param facility: Facility object.
+        :param loan: Loan object.
+        '''
+        loan_yield = facility.assign(loan)
+        self.bank_yields[facility.bank_id].add(loan_yield)
+        self.total_yield.add(loan_yield)
+
+    def unassign(self, facility, loan):
+        '''
+        unassign loan from facility & take its expected yield back out.
+
+        :param facility: Facility object the loan is assigned to.
+        :param loan: Loan object.
+        '''
+        loan_yield = facility.unassign(loan)
+        self.bank_yields[facility.bank_id].subtract(loan_yield)
+        self.total_yield.subtract(loan_yield)
+
+    def get_bank_yield(self, bank_id):
+        ''' :return: int, expected yield across all facilities of the bank. '''
+        return self.bank_yields[bank_id].get_rounded() if bank_id in self.bank_yields else 0
+
+    def get_yield(self):
+        ''' :return: int, expected yield across all facilities. '''
+        return self.total_yield.get_rounded()
@@ -0,0 +1,182 @@
+import cProfile
+import time
+from collections import defaultdict
+
+from eligibility import Eligibility
+from facility_index import FacilityIndex
+
+
+class NoPhase:
+    ''' phase context doing nothing, handed out while no profiler is active. '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_PHASE = NoPhase()
+
+# Profiler of the current run, None unless instrumentation was asked for.
+active = None
+
+
+def phase(name):
+    '''
+    :param name: str, phase name, time of repeated phases adds up.
+    :return: context manager timing the phase on the active profiler, shared no-op one otherwise.
+    '''
+    return NO_PHASE if active is None else active.phase(name)
+
+
+class Phase:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.seconds[self.name] += time.perf_counter() - self.start
+        return False
+
+
+class Profiler:
+    '''
+    Profiler class.
+
+    Opt-in instrumentation of a fund.py run:
+        - wall time per phase (load, covenants, assign, optimize, write).
+        - hot path counters of find_facility: loans, segment tree finds & updates, eligibility mask evaluations,
+          ineligible facilities visited before a match (total & worst loan) and unassigned loans.
+        - optional cProfile dump (pstats file, e.g. snakeviz/flameprof/gprof2dot turn it into a flame graph).
+    Counters come from wrappers installed over FacilityIndex/Eligibility methods & find_facility for the run only,
+    so a run without profiler executes the original code paths.
+    '''
+
+    def __init__(self, dump=None):
+        '''
+        :param dump: str, path to write cProfile stats to, None to skip cProfile.
+        '''
+        self.seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.dump = dump
+        self.profile = None
+        self.restore = []
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def patch(self, owner, name, wrap):
+        '''
+        :param owner: class or dict namespace holding the attribute.
+        :param name: str, attribute name.
+        :param wrap: function, original -> wrapper.
+        '''
+        if isinstance(owner, dict):
+            original = owner[name]
+            owner[name] = wrap(original)
+            self.restore.append(lambda: owner.__setitem__(name, original))
+        else:
+            original = getattr(owner, name)
+            setattr(owner, name, wrap(original))
+            self.restore.append(lambda: setattr(owner, name, original))
+
+    def install(self, namespace):
+        '''
+        activate profiler: wrap hot path & start cProfile if asked for.
+
+        :param namespace: dict, module globals whose find_facility the engines call, None to time phases only.
+        '''
+        global active
+        if namespace is None:
+            active = self
+            return
+        counters = self.counters
+
+        def count_find(find):
+            def wrapper(facility_index, amount, start=0):
+                counters['finds'] += 1
+                position = find(facility_index, amount, start)
+                if position is not None:
+                    counters['visited'] += 1
+                return position
+            return wrapper
+
+        def count_update(update):
+            def wrapper(facility_index, position):
+                counters['updates'] += 1
+                return update(facility_index, position)
+            return wrapper
+
+        def count_mask(mask):
+            def wrapper(eligibility, default_likelihood, state):
+                counters['masks'] += 1
+                return mask(eligibility, default_likelihood, state)
+            return wrapper
+
+        def count_loan(find_facility):
+            def wrapper(loan, facility_index, eligibility):
+                finds, updates, masks, visited = (counters['finds'], counters['updates'], counters['masks'],
+                                                  counters['visited'])
+                facility = find_facility(loan=loan, facility_index=facility_index, eligibility=eligibility)
+                counters['loans'] += 1
+                if facility is None:
+                    counters['unassigned'] += 1
+                # per loan figures leave out calls made outside find_facility (e.g. optimizer moves).
+                counters['loan_finds'] += counters['finds'] - finds
+                counters['loan_updates'] += counters['updates'] - updates
+                counters['loan_masks'] += counters['masks'] - masks
+                # every visited facility but the matched one failed covenants.
+                jumps = counters['visited'] - visited - (facility is not None)
+                counters['jumps'] += jumps
+                counters['max_jumps'] = max(counters['max_jumps'], jumps)
+                return facility
+            return wrapper
+
+        self.patch(FacilityIndex, 'find', count_find)
+        self.patch(FacilityIndex, 'update', count_update)
+        self.patch(Eligibility, 'mask', count_mask)
+        self.patch(namespace, 'find_facility', count_loan)
+
+        if self.dump is not None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        active = self
+
+    def uninstall(self):
+        ''' deactivate profiler, put original methods back & write cProfile stats. '''
+        global active
+        active = None
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.dump)
+        while self.restore:
+            self.restore.pop()()
+
+    def report(self):
+        ''' :return: list of str, report lines of phase times & counters. '''
+        lines = ['Phase times:']
+        total = sum(self.seconds.values())
+        for name, seconds in self.seconds.items():
+            lines.append(f'  {name:<12}{seconds:>10.3f}s {100 * seconds / total if total else 0:>6.1f}%')
+
+        counters = self.counters
+        loans = counters['loans']
+        lines.append('Hot path counters:')
+        lines.append(f'  loans matched through find_facility: {loans}, unassigned: {counters["unassigned"]}')
+        if loans:
+            lines.append(f'  segment tree finds/loan: {counters["loan_finds"] / loans:.2f}, '
+                         f'updates/loan: {counters["loan_updates"] / loans:.2f}')
+            lines.append(f'  eligibility mask evaluations/loan: {counters["loan_masks"] / loans:.2f}')
+            lines.append(f'  ineligible facilities visited/loan: {counters["jumps"] / loans:.2f}, '
+                         f'worst loan: {counters["max_jumps"]}')
+        lines.append(f'  run totals: {counters["finds"]} segment tree finds, {counters["updates"]} updates, '
+                     f'{counters["masks"]} eligibility mask evaluations')
+        if self.dump is not None:
+            lines.append(f'cProfile stats: {self.dump}')
+        return lines
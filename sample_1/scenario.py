@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from covenant import Covenant
+from facility import Facility
+from fund import find_facility, get_files, index_facilities, write
+from loan_book import LoanBook
+
+# LoanBook attached to shared memory, one per worker process.
+shared_book = None
+shared_blocks = None
+
+
+def attach_book(descriptor):
+    '''
+    worker initializer: attach the shared loan book once per process.
+
+    :param descriptor: dict, descriptor returned by LoanBook.share.
+    '''
+    global shared_book, shared_blocks
+    shared_book, shared_blocks = LoanBook.attach(descriptor)
+
+
+def apply_scenario(facilities, covenants, scenario):
+    '''
+    perturbed copies of facilities & covenants for a what-if scenario.
+
+    scenario keys (all optional):
+        name: str, scenario name.
+        interest_rate_shift: float, added to every facility interest rate.
+        amount_scale: float, every facility amount is multiplied by it.
+        facilities: {facility id: {interest_rate: float, amount: float}}, per facility overrides.
+        replace_covenants: bool, drop input covenants before adding scenario covenants.
+        covenants: [{bank_id, facility_id, max_default_likelihood, banned_state}], extra covenants.
+
+    :param facilities: list of Facility objects (left untouched).
+    :param covenants: list of Covenant objects (left untouched).
+    :param scenario: dict, scenario definition.
+    :return: list of Facility objects, list of Covenant objects.
+    '''
+    overrides = scenario.get('facilities', {})
+    for facility_id in overrides:
+        if facility_id not in {facility.id for facility in facilities}:
+            raise ValueError(f'Scenario {scenario.get("name")} overrides unknown facility {facility_id}')
+
+    scenario_facilities = []
+    for facility in facilities:
+        override = overrides.get(facility.id, {})
+        scenario_facilities.append(Facility(
+            id=facility.id,
+            bank_id=facility.bank_id,
+            interest_rate=float(override.get('interest_rate',
+                                             facility.interest_rate + scenario.get('interest_rate_shift', 0))),
+            amount=float(override.get('amount', facility.amount * scenario.get('amount_scale', 1)))))
+
+    scenario_covenants = [] if scenario.get('replace_covenants') else list(covenants)
+    for covenant in scenario.get('covenants', []):
+        scenario_covenants.append(Covenant(bank_id=str(covenant['bank_id']),
+                                           facility_id=str(covenant.get('facility_id') or ''),
+                                           maximum_default_likelihood=float(covenant.get('max_default_likelihood') or 0),
+                                           banned_state=covenant.get('banned_state') or ''))
+
+    return scenario_facilities, scenario_covenants
+
+
+def run_scenario(facilities, covenants, scenario):
+    '''
+    assign the whole shared loan book under a scenario.
+
+    :param facilities: list of Facility objects.
+    :param covenants: list of Covenant objects.
+    :param scenario: dict, scenario definition (see apply_scenario).
+    :return: dict, name, expected yield per facility id, total expected yield & number of assigned loans.
+    '''
+    scenario_facilities, scenario_covenants = apply_scenario(facilities, covenants, scenario)
+    facility_index, eligibility, portfolio = index_facilities(facilities=scenario_facilities,
+                                                              covenants=scenario_covenants)
+
+    assigned = 0
+    for loan in shared_book:
+        facility = find_facility(loan=loan, facility_index=facility_index, eligibility=eligibility)
+        if facility is not None:
+            portfolio.assign(facility=facility, loan=loan)
+            assigned += 1
+
+    return {'name': scenario['name'],
+            'yields': {facility.id: facility.get_yield() for facility in scenario_facilities},
+            'total': portfolio.get_yield(),
+            'assigned': assigned}
+
+
+def run_scenarios(file_dict, scenarios, workers=None):
+    '''
+    load loans once into shared memory & run every scenario in a process pool.
+
+    :param file_dict: dict, filename -> file path.
+    :param scenarios: list of dict, scenario definitions.
+    :param workers: int, number of worker processes (default: cpu count).
+    :return: list of scenario results in scenarios order.
+    '''
+    names = [scenario.get('name') for scenario in scenarios]
+    if None in names or len(set(names)) != len(names):
+        raise ValueError('Every scenario needs a unique name')
+
+    facilities = Facility.load(file=file_dict['facilities.csv'])
+    covenants = Covenant.load(file=file_dict['covenants.csv'])
+    blocks, descriptor = LoanBook.load(file=file_dict['loans.csv']).share()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_book, initargs=(descriptor,)) as executor:
+            return list(executor.map(run_scenario,
+                                     [facilities] * len(scenarios),
+                                     [covenants] * len(scenarios),
+                                     scenarios))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def comparison_table(results):
+    '''
+    :param results: list of scenario results.
+    :return: header str, list of rows: expected yield per facility & totals, one column per scenario.
+    '''
+    facility_ids = sorted({facility_id for result in results for facility_id in result['yields']}, key=int)
+
+    rows = []
+    for facility_id in facility_ids:
+        rows.append([facility_id] + [str(result['yields'].get(facility_id, '')) for result in results])
+    rows.append(['total'] + [str(result['total']) for result in results])
+    rows.append(['assigned_loans'] + [str(result['assigned']) for result in results])
+
+    return ','.join(['facility_id'] + [result['name'] for result in results]), rows
+
+
+def prompt():
+    '''
+    Prompt to take input files dir, scenarios file & worker count.
+    :return: input dir path, scenarios file path, workers.
+    '''
+    parser = argparse.ArgumentParser(description='Loan Assignment What-If Scenario Runner')
+    required_arguments = parser.add_argument_group('required arguments')
+    required_arguments.add_argument('-d', '--file_dir', help='Input/Output file directory')
+    required_arguments.add_argument('-s', '--scenarios', help='JSON file with list of scenarios')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Worker processes (default: cpu count)')
+    args = parser.parse_args(args=None if sys.argv[1:] else ['-h'])
+
+    # minor input validation.
+    if not os.path.exists(args.file_dir):
+        raise ValueError('Invalid dir {}'.format(args.file_dir))
+    if not os.path.exists(args.scenarios):
+        raise ValueError('Invalid scenarios file {}'.format(args.scenarios))
+
+    return args.file_dir, args.scenarios, args.workers
+
+
+if __name__ == '__main__':
+
+    file_dir, scenarios_file, workers = prompt()
+    with open(scenarios_file, mode='r') as fh:
+        scenarios = json.load(fh)
+
+    # unperturbed run first, as the baseline column.
+    scenarios = [{'name': 'base'}] + scenarios
+    print(f'Running {len(scenarios)} scenarios over {file_dir}')
+
+    header, rows = comparison_table(run_scenarios(file_dict=get_files(input_dir=file_dir),
+                                                  scenarios=scenarios, workers=workers))
+
+    print(header)
+    for row in rows:
+        print(','.join(row))
+    write(file_dir=file_dir, file_name='scenario_yields.csv', header=header, data_list=rows)
@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from covenant import Covenant
+from eligibility import Eligibility
+from facility import Facility
+from facility_index import FacilityIndex
+from fund import find_facility, get_files, process_covenants
+from loan import Loan
+from portfolio import Portfolio
+
+
+class AssignmentService:
+    '''
+    AssignmentService class.
+
+    Resident loan assignment state: facilities & covenants are loaded once and FacilityIndex/Eligibility
+    are kept warm between requests, so each incoming loan is assigned in O(lgF).
+    Facility amount changes, loan (re)assignments & unassignments update the index in place; facility creation,
+    interest rate changes & new covenants re-index facilities only (O(F)), assigned loans & yields are kept.
+    All public methods are serialized by a single (reentrant) lock.
+    '''
+
+    def __init__(self, facilities, covenants):
+        '''
+        :param facilities: list of Facility objects.
+        :param covenants: list of Covenant objects.
+        '''
+        self.lock = threading.RLock()
+        self.facilities = {facility.id: facility for facility in facilities}
+        self.covenants = list(covenants)
+        self.loans = {}
+        self.portfolio = Portfolio()
+        self.reindex()
+
+    def reindex(self):
+        ''' rebuild FacilityIndex & Eligibility over current facilities & covenants. '''
+        # facilities used up through FacilityIndex.update stay out, untouched ones keep their initial leaf
+        # like in the batch index (a 0 amount facility from facilities.csv still takes 0 amount loans).
+        exhausted = set()
+        if hasattr(self, 'facility_index'):
+            exhausted = {facility.id for facility in self.facility_index.facilities} - \
+                        {facility.id for facility in self.facility_index}
+        self.facility_index = FacilityIndex(list(self.facilities.values()))
+        self.positions = {facility.id: position for position, facility in enumerate(self.facility_index.facilities)}
+        self.eligibility = Eligibility.compile(facilities=self.facility_index.facilities,
+                                               covenant_map=process_covenants(covenants=self.covenants))
+        for position, facility in enumerate(self.facility_index.facilities):
+            if facility.id in exhausted:
+                self.facility_index.update(position)
+
+    def get_facility(self, facility_id):
+        ''' :return: Facility, raises KeyError if unknown. '''
+        if facility_id not in self.facilities:
+            raise KeyError(f'Unknown facility {facility_id}')
+        return self.facilities[facility_id]
+
+    def get_loan(self, loan_id):
+        ''' :return: Loan, raises KeyError if unknown. '''
+        if loan_id not in self.loans:
+            raise KeyError(f'Unknown loan {loan_id}')
+        return self.loans[loan_id]
+
+    def assign_loan(self, loan):
+        '''
+        register loan & assign it to the cheapest eligible facility.
+
+        :param loan: Loan object.
+        :return: assigned Facility object, None if no facility can take the loan.
+        '''
+        with self.lock:
+            if loan.id in self.loans:
+                raise ValueError(f'Duplicate loan {loan.id}')
+            self.loans[loan.id] = loan
+            facility = find_facility(loan=loan, facility_index=self.facility_index, eligibility=self.eligibility)
+            if facility is not None:
+                self.portfolio.assign(facility=facility, loan=loan)
+            return facility
+
+    def unassign_loan(self, facility_id, loan_id):
+        '''
+        unassign loan from facility, giving its amount back to the facility.
+
+        :param facility_id: str, facility id.
+        :param loan_id: str, loan id.
+        '''
+        with self.lock:
+            facility = self.get_facility(facility_id)
+            loan = self.get_loan(loan_id)
+            if loan.facility_id != facility_id:
+                raise ValueError(f'Loan {loan_id} is not assigned to facility {facility_id}')
+            self.portfolio.unassign(facility=facility, loan=loan)
+            facility.amount += loan.amount
+            self.facility_index.update(self.positions[facility_id])
+
+    def assign_loan_to(self, facility_id, loan_id):
+        '''
+        assign loan to a given facility, moving it off the facility it is assigned to, if any.
+
+        :param facility_id: str, facility id.
+        :param loan_id: str, loan id.
+        :return: assigned Facility object.
+        '''
+        with self.lock:
+            facility = self.get_facility(facility_id)
+            loan = self.get_loan(loan_id)
+            if loan.facility_id == facility_id:
+                return facility
+            position = self.positions[facility_id]
+            if not self.eligibility.check(position, loan.default_likelihood, loan.state):
+                raise ValueError(f'Loan {loan_id} fails covenants of facility {facility_id}')
+            if facility.amount < loan.amount:
+                raise ValueError(f'Facility {facility_id} has {facility.amount} left, '
+                                 f'loan {loan_id} needs {loan.amount}')
+            if loan.facility_id is not None:
+                self.unassign_loan(facility_id=loan.facility_id, loan_id=loan_id)
+            self.portfolio.assign(facility=facility, loan=loan)
+            facility.amount -= loan.amount
+            self.facility_index.update(position)
+            return facility
+
+    def update_loan(self, loan_id, interest_rate=None, default_likelihood=None, amount=None, state=None):
+        '''
+        update loan attributes & re-assign it to the cheapest eligible facility under the new ones.
+
+        :param loan_id: str, loan id.
+        :param interest_rate: float, new interest rate, None to keep.
+        :param default_likelihood: float, new default likelihood, None to keep.
+        :param amount: int, new amount, None to keep.
+        :param state: str, new state code, None to keep.
+        :return: assigned Facility object, None if no facility can take the loan.
+        '''
+        with self.lock:
+            loan = self.get_loan(loan_id)
+            if loan.facility_id is not None:
+                self.unassign_loan(facility_id=loan.facility_id, loan_id=loan_id)
+            if interest_rate is not None:
+                loan.interest_rate = interest_rate
+            if default_likelihood is not None:
+                loan.default_likelihood = default_likelihood
+            if amount is not None:
+                loan.amount = amount
+            if state is not None:
+                loan.state = state
+            facility = find_facility(loan=loan, facility_index=self.facility_index, eligibility=self.eligibility)
+            if facility is not None:
+                self.portfolio.assign(facility=facility, loan=loan)
+            return facility
+
+    def create_facility(self, facility):
+        '''
+        add a new facility.
+
+        :param facility: Facility object.
+        '''
+        with self.lock:
+            if facility.id in self.facilities:
+                raise ValueError(f'Duplicate facility {facility.id}')
+            self.facilities[facility.id] = facility
+            self.reindex()
+
+    def update_facility(self, facility_id, interest_rate=None, amount=None):
+        '''
+        update remaining amount and/or interest rate of a facility.
+
+        :param facility_id: str, facility id.
+        :param interest_rate: float, new interest rate, None to keep.
+        :param amount: float, new remaining amount, None to keep.
+        :return: updated Facility object.
+        '''
+        with self.lock:
+            facility = self.get_facility(facility_id)
+            if amount is not None:
+                facility.amount = amount
+                self.facility_index.update(self.positions[facility_id])
+            if interest_rate is not None and interest_rate != facility.interest_rate:
+                facility.interest_rate = interest_rate
+                self.reindex()
+            return facility
+
+    def add_covenant(self, covenant):
+        '''
+        add a covenant, applies to loans assigned from now on.
+
+        :param covenant: Covenant object.
+        '''
+        with self.lock:
+            self.covenants.append(covenant)
+            self.reindex()
+
+    @staticmethod
+    def load(file_dict):
+        '''
+        Load AssignmentService from facilities.csv & covenants.csv.
+
+        :param file_dict: dict, filename -> file path.
+        '''
+        return AssignmentService(facilities=Facility.load(file=file_dict['facilities.csv']),
+                                 covenants=Covenant.load(file=file_dict['covenants.csv']))
+
+
+def facility_json(facility):
+    return {'id': facility.id,
+            'bank_id': facility.bank_id,
+            'interest_rate': facility.interest_rate,
+            'amount': facility.amount,
+            'expected_yield': facility.get_yield()}
+
+
+def loan_json(loan):
+    return {'id': loan.id,
+            'interest_rate': loan.interest_rate,
+            'default_likelihood': loan.default_likelihood,
+            'amount': loan.amount,
+            'state': loan.state,
+            'facility_id': loan.facility_id}
+
+
+def covenant_json(covenant):
+    return {'bank_id': covenant.bank_id,
+            'facility_id': covenant.facility_id,
+            'max_default_likelihood': covenant.maximum_default_likelihood,
+            'banned_state': covenant.banned_state}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    '''
+    ServiceHandler class.
+
+    JSON REST routes over AssignmentService (see README):
+        POST   /loan                                : create & assign loan.
+        GET    /loans, /loan/{loan_id}              : all or specific loan.
+        PUT    /loan/{loan_id}                      : update loan & re-assign it to the cheapest eligible facility.
+        POST   /facility                            : create facility.
+        PUT    /facility/{facility_id}              : update facility amount and/or interest rate.
+        GET    /facilities, /facility/{facility_id} : all or specific facility.
+        PUT    /facility/{facility_id}/loan/{loan_id} : assign loan to facility.
+        DELETE /facility/{facility_id}/loan/{loan_id} : unassign loan from facility.
+        POST   /covenant, GET /covenants            : add covenant, all covenants.
+        GET    /banks, /bank/{bank_id}              : portfolio & per bank expected yield.
+    '''
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        try:
+            # body is read before taking the lock, a slow client doesn't hold up other requests.
+            payload = self.read_json() if method in ('POST', 'PUT') else {}
+            # reads iterate service state, so they take the lock too.
+            with self.server.service.lock:
+                status, body = self.route(method, parts, payload)
+        except KeyError as e:
+            status, body = 404, {'error': str(e.args[0] if e.args else e)}
+        except (ValueError, TypeError) as e:
+            status, body = 400, {'error': str(e)}
+        except Exception as e:
+            # e.g. OverflowError of a huge number, the client still gets an answer.
+            status, body = 500, {'error': f'{type(e).__name__}: {e}'}
+        self.respond(status, body)
+
+    def route(self, method, parts, payload):
+        service = self.server.service
+
+        if method == 'POST' and parts == ['loan']:
+            loan = Loan(id=str(self.required(payload, 'id')),
+                        interest_rate=float(self.required(payload, 'interest_rate')),
+                        default_likelihood=float(self.required(payload, 'default_likelihood')),
+                        amount=int(self.required(payload, 'amount')),
+                        state=str(self.required(payload, 'state')))
+            service.assign_loan(loan)
+            return 201, loan_json(loan)
+        if method == 'GET' and parts == ['loans']:
+            return 200, [loan_json(loan) for loan in service.loans.values()]
+        if method == 'GET' and len(parts) == 2 and parts[0] == 'loan':
+            return 200, loan_json(service.get_loan(parts[1]))
+        if method == 'PUT' and len(parts) == 2 and parts[0] == 'loan':
+            service.update_loan(
+                loan_id=parts[1],
+                interest_rate=None if payload.get('interest_rate') is None else float(payload['interest_rate']),
+                default_likelihood=None if payload.get('default_likelihood') is None else
+                float(payload['default_likelihood']),
+                amount=None if payload.get('amount') is None else int(payload['amount']),
+                state=None if payload.get('state') is None else str(payload['state']))
+            return 200, loan_json(service.get_loan(parts[1]))
+
+        if method == 'POST' and parts == ['facility']:
+            facility = Facility(id=str(self.required(payload, 'id')),
+                                bank_id=str(self.required(payload, 'bank_id')),
+                                interest_rate=float(self.required(payload, 'interest_rate')),
+                                amount=float(self.required(payload, 'amount')))
+            service.create_facility(facility)
+            return 201, facility_json(facility)
+        if method == 'PUT' and len(parts) == 2 and parts[0] == 'facility':
+            facility = service.update_facility(
+                facility_id=parts[1],
+                interest_rate=None if payload.get('interest_rate') is None else float(payload['interest_rate']),
+                amount=None if payload.get('amount') is None else float(payload['amount']))
+            return 200, facility_json(facility)
+        if method == 'GET' and parts == ['facilities']:
+            return 200, [facility_json(facility) for facility in service.facilities.values()]
+        if method == 'GET' and len(parts) == 2 and parts[0] == 'facility':
+            return 200, facility_json(service.get_facility(parts[1]))
+        if method == 'PUT' and len(parts) == 4 and parts[0] == 'facility' and parts[2] == 'loan':
+            service.assign_loan_to(facility_id=parts[1], loan_id=parts[3])
+            return 200, loan_json(service.get_loan(parts[3]))
+        if method == 'DELETE' and len(parts) == 4 and parts[0] == 'facility' and parts[2] == 'loan':
+            service.unassign_loan(facility_id=parts[1], loan_id=parts[3])
+            return 200, loan_json(service.get_loan(parts[3]))
+
+        if method == 'POST' and parts == ['covenant']:
+            banned_state = payload.get('banned_state') or ''
+            if not isinstance(banned_state, str):
+                raise ValueError(f'Invalid banned_state {banned_state!r}, expected a state code string')
+            covenant = Covenant(bank_id=str(self.required(payload, 'bank_id')),
+                                facility_id=str(payload.get('facility_id') or ''),
+                                maximum_default_likelihood=float(payload.get('max_default_likelihood') or 0),
+                                banned_state=banned_state)
+            service.add_covenant(covenant)
+            return 201, covenant_json(covenant)
+        if method == 'GET' and parts == ['covenants']:
+            return 200, [covenant_json(covenant) for covenant in service.covenants]
+
+        if method == 'GET' and parts == ['banks']:
+            return 200, {'expected_yield': service.portfolio.get_yield(),
+                         'banks': {bank_id: service.portfolio.get_bank_yield(bank_id)
+                                   for bank_id in sorted({facility.bank_id
+                                                          for facility in service.facilities.values()})}}
+        if method == 'GET' and len(parts) == 2 and parts[0] == 'bank':
+            return 200, {'id': parts[1], 'expected_yield': service.portfolio.get_bank_yield(parts[1])}
+
+        raise KeyError(f'No route {method} {self.path}')
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Invalid JSON body: {e}')
+        if not isinstance(payload, dict):
+            raise ValueError('JSON body must be an object')
+        return payload
+
+    @staticmethod
+    def required(payload, name):
+        if payload.get(name) is None:
+            raise ValueError(f'Missing field {name}')
+        return payload[name]
+
+    def respond(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # keep request path quiet, latency matters more than access logs here.
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    ''' HTTPServer handling each request in its own thread. '''
+    daemon_threads = True
+
+
+def make_server(service, host='127.0.0.1', port=8000):
+    '''
+    :param service: AssignmentService to expose.
+    :return: ThreadingHTTPServer serving the REST routes, not started yet.
+    '''
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.service = service
+    return server
+
+
+def prompt():
+    '''
+    Prompt to take input files dir & listening address.
+    :return: input dir path, host, port.
+    '''
+    parser = argparse.ArgumentParser(description='Loan Assignment Service')
+    required_arguments = parser.add_argument_group('required arguments')
+    required_arguments.add_argument('-d', '--file_dir', help='Input directory with facilities.csv & covenants.csv')
+    parser.add_argument('--host', default='127.0.0.1', help='Listening host (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='Listening port (default: 8000)')
+    args = parser.parse_args(args=None if sys.argv[1:] else ['-h'])
+
+    # minor input validation.
+    if not os.path.exists(args.file_dir):
+        raise ValueError('Invalid dir {}'.format(args.file_dir))
+
+    return args.file_dir, args.host, args.port
+
+
+if __name__ == '__main__':
+
+    file_dir, host, port = prompt()
+    print(f'Loading facilities & covenants from {file_dir}')
+    server = make_server(service=AssignmentService.load(file_dict=get_files(input_dir=file_dir)), host=host, port=port)
+    print(f'Serving on http://{host}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
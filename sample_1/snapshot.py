@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import sys
+
+from covenant import Covenant
+from facility import Facility
+from loan_book import LoanBook
+
+
+def hash_file(file, block_size=1 << 20, start=0, end=None):
+    '''
+    :param file: path to file.
+    :param start: int, byte offset to start hashing at.
+    :param end: int, byte offset to stop hashing at, None for the file end.
+    :return: str, sha256 hex digest of file content.
+    '''
+    digest = hashlib.sha256()
+    remaining = float('inf') if end is None else end - start
+    with open(file, mode='rb') as fh:
+        fh.seek(start)
+        while remaining > 0:
+            block = fh.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SnapshotCache:
+    '''
+    SnapshotCache class.
+
+    Parses each input csv once into a binary snapshot under cache_dir and serves later loads from it:
+        - loans.csv: LoanBook arrays laid out in one file & memory-mapped back, rows are never re-parsed.
+        - facilities.csv, covenants.csv: pickled object lists.
+    Snapshots are keyed by input path and validated by file size & mtime, falling back to a content hash
+    when mtime changed, so a touched but identical input still hits.
+    '''
+
+    VERSION = 1
+
+    def __init__(self, cache_dir):
+        '''
+        :param cache_dir: str, snapshot directory, created if missing.
+        '''
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        # mmaps backing loan books handed out, kept open as long as the cache.
+        self.mappings = []
+
+    def paths(self, file):
+        '''
+        :param file: path to input file.
+        :return: snapshot data path, snapshot meta path.
+        '''
+        key = hashlib.sha256(os.path.abspath(file).encode()).hexdigest()[:32]
+        base = os.path.join(self.cache_dir, f'{key}.{os.path.basename(file)}')
+        return base + '.snapshot', base + '.json'
+
+    def lookup(self, file):
+        '''
+        :param file: path to input file.
+        :return: dict, snapshot meta if snapshot matches current input, None otherwise.
+        '''
+        data_path, meta_path = self.paths(file)
+        if not os.path.exists(data_path) or not os.path.exists(meta_path):
+            return None
+        with open(meta_path, mode='r') as fh:
+            meta = json.load(fh)
+
+        stat = os.stat(file)
+        source = meta['source']
+        if meta['version'] != self.VERSION or source['size'] != stat.st_size:
+            return None
+        if source['mtime_ns'] != stat.st_mtime_ns:
+            # touched, check whether content really changed.
+            if source['sha256'] != hash_file(file):
+                return None
+            source['mtime_ns'] = stat.st_mtime_ns
+            self.write_meta(meta_path, meta)
+        return meta
+
+    @staticmethod
+    def write_meta(meta_path, meta):
+        with open(meta_path + '.tmp', mode='w') as fh:
+            json.dump(meta, fh)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def store(self, file, write_data, extra):
+        '''
+        write snapshot data & meta for file.
+
+        :param file: path to input file.
+        :param write_data: function writing snapshot data into a binary file handle, returns dict of layout info.
+        :param extra: dict, additional meta.
+        '''
+        data_path, meta_path = self.paths(file)
+        stat = os.stat(file)
+        source = {'path': os.path.abspath(file), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                  'sha256': hash_file(file)}
+        with open(data_path + '.tmp', mode='wb') as fh:
+            layout = write_data(fh)
+        os.replace(data_path + '.tmp', data_path)
+        self.write_meta(meta_path, dict(extra, version=self.VERSION, source=source, layout=layout))
+
+    def load_objects(self, file, load):
+        '''
+        :param file: path to input file.
+        :param load: function parsing input file into a picklable object list.
+        :return: object list, from snapshot when valid.
+        '''
+        data_path, _ = self.paths(file)
+        if self.lookup(file) is not None:
+            with open(data_path, mode='rb') as fh:
+                return pickle.load(fh)
+
+        objects = load(file)
+        self.store(file, write_data=lambda fh: pickle.dump(objects, fh, protocol=pickle.HIGHEST_PROTOCOL), extra={})
+        return objects
+
+    def load_facilities(self, file):
+        ''' :return: list of Facility objects from facilities.csv. '''
+        return self.load_objects(file, Facility.load)
+
+    def load_covenants(self, file):
+        ''' :return: list of Covenant objects from covenants.csv. '''
+        return self.load_objects(file, Covenant.load)
+
+    def load_loans(self, file):
+        '''
+        :param file: path to loans.csv
+        :return: LoanBook, memory-mapped from snapshot (read-only rows) when valid.
+        '''
+        meta = self.lookup(file)
+        if meta is None:
+            book = LoanBook.load(file)
+
+            def write_data(fh):
+                layout = {}
+                for name in LoanBook.SHARED_FIELDS:
+                    data = getattr(book, name)
+                    # keep every field 8 bytes aligned.
+                    fh.write(b'\0' * (-fh.tell() % 8))
+                    buffer = memoryview(data).cast('B')
+                    layout[name] = [getattr(data, 'typecode', 'B'), fh.tell(), len(buffer)]
+                    fh.write(buffer)
+                return layout
+
+            self.store(file, write_data=write_data, extra={'states': book.states})
+            meta = self.lookup(file)
+
+        data_path, _ = self.paths(file)
+        with open(data_path, mode='rb') as fh:
+            mapping = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mappings.append(mapping)
+
+        view = memoryview(mapping)
+        buffers = {name: view[offset:offset + size].cast(typecode)
+                   for name, (typecode, offset, size) in meta['layout'].items()}
+        return LoanBook.from_buffers(buffers=buffers, states=meta['states'])
+
+    def invalidate(self, files=None):
+        '''
+        remove snapshots.
+
+        :param files: list of input file paths, None to remove every snapshot in cache_dir.
+        :return: int, number of removed snapshot files.
+        '''
+        if files is None:
+            targets = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                       if name.endswith(('.snapshot', '.json', '.tmp'))]
+        else:
+            targets = [path for file in files for path in self.paths(file) if os.path.exists(path)]
+        for target in targets:
+            os.remove(target)
+        return len(targets)
+
+
+def prompt():
+    '''
+    Prompt to take cache dir, input files dir & action.
+    :return: cache dir path, input dir path (optional), invalidate flag.
+    '''
+    parser = argparse.ArgumentParser(description='Loan Assignment Input Snapshots')
+    required_arguments = parser.add_argument_group('required arguments')
+    required_arguments.add_argument('-c', '--cache_dir', help='Snapshot cache directory')
+    parser.add_argument('-d', '--file_dir', help='Input file directory to build/invalidate snapshots for')
+    parser.add_argument('--invalidate', action='store_true',
+                        help='Remove snapshots of file_dir inputs, or every snapshot without file_dir')
+    args = parser.parse_args(args=None if sys.argv[1:] else ['-h'])
+
+    # minor input validation.
+    if args.cache_dir is None:
+        raise ValueError('Missing cache dir')
+    if args.file_dir is not None and not os.path.exists(args.file_dir):
+        raise ValueError('Invalid dir {}'.format(args.file_dir))
+    if args.file_dir is None and not args.invalidate:
+        raise ValueError('Building snapshots requires input dir')
+
+    return args.cache_dir, args.file_dir, args.invalidate
+
+
+if __name__ == '__main__':
+
+    cache_dir, file_dir, invalidate = prompt()
+    cache = SnapshotCache(cache_dir=cache_dir)
+    inputs = None if file_dir is None else \
+        [os.path.join(file_dir, file) for file in ['facilities.csv', 'covenants.csv', 'loans.csv']]
+
+    if invalidate:
+        print(f'Removed {cache.invalidate(files=inputs)} snapshot files from {cache_dir}')
+    else:
+        cache.load_facilities(inputs[0])
+        cache.load_covenants(inputs[1])
+        cache.load_loans(inputs[2])
+        print(f'Snapshots of {file_dir} ready in {cache_dir}')
@@ -0,0 +1,520 @@
+'''
+Test module for fund.
+Checks loan assignment outputs stay identical to the reference small/large outputs.
+'''
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import checkpoint
+import fund
+import profiler
+import snapshot
+from checkpoint import Checkpoint
+from covenant import Covenant
+from eligibility import Eligibility
+from facility import Facility
+from facility_index import FacilityIndex
+from loan import Loan
+from loan_book import LoanBook
+from optimizer import LocalSearch
+from portfolio import Portfolio
+from scenario import comparison_table, run_scenarios
+from snapshot import SnapshotCache
+from benchmark import PHASES, benchmark, regressions
+from generate import BookGenerator
+from profiler import Profiler
+from fund import assign_columnar, assign_incremental, assign_objects, assign_optimized, assign_streaming, get_files, \
+    process_covenants, verify, write
+
+SAMPLE_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUT_FILES = ['facilities.csv', 'covenants.csv', 'loans.csv', 'banks.csv']
+OUTPUT_FILES = ['assignments.csv', 'yields.csv']
+
+
+def run_fund(tmp_path, dataset, *args):
+    ''' copy dataset inputs to tmp_path, run fund.py over it and return the output dir. '''
+    for file in INPUT_FILES:
+        shutil.copy(os.path.join(SAMPLE_DIR, dataset, file), tmp_path)
+    subprocess.run([sys.executable, os.path.join(SAMPLE_DIR, 'fund.py'), '-d', str(tmp_path), *args],
+                   check=True, stdout=subprocess.DEVNULL)
+    return tmp_path
+
+
+def read(path):
+    with open(path, 'rb') as fh:
+        return fh.read()
+
+
+@pytest.mark.parametrize('dataset', ['small', 'large'])
+def test_outputs_match_reference(tmp_path, dataset):
+    output_dir = run_fund(tmp_path, dataset)
+    for file in OUTPUT_FILES:
+        assert read(os.path.join(output_dir, file)) == read(os.path.join(SAMPLE_DIR, dataset, file))
+
+
+def test_facility_index_find_and_update():
+    facilities = [Facility(id='1', bank_id='1', interest_rate=0.05, amount=100.0),
+                  Facility(id='2', bank_id='1', interest_rate=0.03, amount=50.0),
+                  Facility(id='3', bank_id='2', interest_rate=0.03, amount=500.0)]
+    facility_index = FacilityIndex(facilities)
+
+    # ordered by interest rate then id.
+    assert [facility.id for facility in facility_index] == ['2', '3', '1']
+    assert facility_index.find(40) == 0
+    assert facility_index.find(60) == 1
+    assert facility_index.find(40, start=2) == 2
+    assert facility_index.find(1000) is None
+
+    # exhausted facility drops out of the index.
+    facility_index.facilities[0].amount -= 50
+    facility_index.update(0)
+    assert facility_index.find(1) == 1
+    assert [facility.id for facility in facility_index] == ['3', '1']
+
+
+def test_eligibility_matches_covenant_check():
+    facilities = [Facility(id='1', bank_id='1', interest_rate=0.05, amount=100.0),
+                  Facility(id='2', bank_id='1', interest_rate=0.03, amount=50.0),
+                  Facility(id='3', bank_id='2', interest_rate=0.03, amount=500.0)]
+    covenants = [Covenant(bank_id='1', facility_id='1', maximum_default_likelihood=0.05, banned_state='NY'),
+                 Covenant(bank_id='1', facility_id='1', maximum_default_likelihood=0.03, banned_state='CA'),
+                 Covenant(bank_id='1', facility_id='2', maximum_default_likelihood=0.0, banned_state='CA'),
+                 Covenant(bank_id='2', facility_id='3', maximum_default_likelihood=0.1, banned_state=''),
+                 # bank-level covenant, applies to facilities 1 & 2.
+                 Covenant(bank_id='1', facility_id='', maximum_default_likelihood=0.04, banned_state='TX')]
+    covenant_map = process_covenants(covenants=covenants)
+    eligibility = Eligibility.compile(facilities=facilities, covenant_map=covenant_map)
+
+    for default_likelihood in [0.0, 0.03, 0.04, 0.05, 0.1, 0.2]:
+        for state in ['NY', 'CA', 'TX', '']:
+            mask = eligibility.mask(default_likelihood, state)
+            for position, facility in enumerate(facilities):
+                expected = all(cv.check(default_likelihood, state)
+                               for cv in covenant_map.get((facility.bank_id, ''), []) +
+                               covenant_map.get((facility.bank_id, facility.id), []))
+                assert eligibility.check(position, default_likelihood, state) == expected
+                assert bool(mask >> position & 1) == expected
+
+
+def write_random_dataset(path, seed, facility_count=40, loan_count=5000):
+    ''' write a random facilities/covenants/loans dataset with tight capacities into path. '''
+    rng = random.Random(seed)
+    states = ['CA', 'NY', 'TX', 'VT', 'MT']
+
+    with open(os.path.join(path, 'facilities.csv'), 'w') as fh:
+        fh.write('amount,interest_rate,id,bank_id\n')
+        for id in range(1, facility_count + 1):
+            fh.write(f'{rng.randint(0, 100) * 5000}.0,{rng.choice([0.01, 0.02, 0.05])},{id},{rng.randint(1, 5)}\n')
+
+    with open(os.path.join(path, 'covenants.csv'), 'w') as fh:
+        fh.write('facility_id,max_default_likelihood,bank_id,banned_state\n')
+        for index in range(facility_count):
+            likelihood = rng.choice(['', '0.05', '0.1'])
+            # every 8th covenant is bank-level.
+            facility_id = '' if index % 8 == 7 else rng.randint(1, facility_count)
+            fh.write(f'{facility_id},{likelihood},{rng.randint(1, 5)},{rng.choice(states)}\n')
+
+    with open(os.path.join(path, 'loans.csv'), 'w') as fh:
+        fh.write('interest_rate,amount,id,default_likelihood,state\n')
+        for id in rng.sample(range(1, loan_count * 2), loan_count):
+            fh.write(f'{rng.randint(1, 40) / 100},{rng.choice([0, 500, rng.randint(1, 20000)])},{id},'
+                     f'{rng.randint(0, 15) / 100},{rng.choice(states)}\n')
+
+
+def test_bank_level_covenant_applies_to_every_facility_of_the_bank(tmp_path):
+    with open(tmp_path / 'facilities.csv', 'w') as fh:
+        fh.write('amount,interest_rate,id,bank_id\n1000.0,0.01,1,1\n1000.0,0.02,2,1\n1000.0,0.05,3,2\n')
+    with open(tmp_path / 'covenants.csv', 'w') as fh:
+        fh.write('facility_id,max_default_likelihood,bank_id,banned_state\n,,1,TX\n,0.05,2,\n')
+    with open(tmp_path / 'loans.csv', 'w') as fh:
+        fh.write('interest_rate,amount,id,default_likelihood,state\n'
+                 '0.2,100,1,0.01,TX\n0.2,100,2,0.01,CA\n0.2,100,3,0.1,TX\n')
+    assignments, _ = assign_objects(file_dict=get_files(input_dir=str(tmp_path)))
+    assert assignments == [['1', '3'], ['2', '1'], ['3', '']]
+
+
+def test_columnar_engine_keeps_long_ids_and_states(tmp_path):
+    pytest.importorskip('numpy')
+    write_random_dataset(tmp_path, 0)
+    # zero padded 40 char ids & long state names, wider than the initial string columns.
+    for file in ['loans.csv', 'covenants.csv']:
+        with open(tmp_path / file) as fh:
+            header, *rows = fh.readlines()
+        if file == 'loans.csv':
+            rows = [row.replace(f',{row.split(",")[2]},', f',{int(row.split(",")[2]):040d},') for row in rows]
+        rows = [row.rstrip('\n') + '_STATE_OF_MIND\n' if not row.endswith(',\n') else row for row in rows]
+        with open(tmp_path / file, 'w') as fh:
+            fh.writelines([header] + rows)
+    file_dict = get_files(input_dir=str(tmp_path))
+    assignments, yields = assign_columnar(file_dict=file_dict)
+    assert len(assignments[0][0]) == 40
+    assert (assignments, yields) == assign_objects(file_dict=file_dict)
+
+
+def test_columnar_engine_without_numpy_raises_import_error(monkeypatch):
+    monkeypatch.setattr('columnar.np', None)
+    with pytest.raises(ImportError, match='numpy is required'):
+        assign_columnar(file_dict=get_files(input_dir=os.path.join(SAMPLE_DIR, 'small')))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_columnar_engine_matches_object_engine(tmp_path, seed):
+    pytest.importorskip('numpy')
+    write_random_dataset(tmp_path, seed)
+    file_dict = get_files(input_dir=str(tmp_path))
+    assert assign_columnar(file_dict=file_dict) == assign_objects(file_dict=file_dict)
+
+
+@pytest.mark.parametrize('dataset', ['small', 'large'])
+def test_columnar_outputs_match_reference(tmp_path, dataset):
+    pytest.importorskip('numpy')
+    output_dir = run_fund(tmp_path, dataset, '--engine', 'columnar')
+    for file in OUTPUT_FILES:
+        assert read(os.path.join(output_dir, file)) == read(os.path.join(SAMPLE_DIR, dataset, file))
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('chunk_size', [7, 100, 1 << 20])
+def test_streaming_matches_object_engine(tmp_path, seed, chunk_size):
+    write_random_dataset(tmp_path, seed)
+    file_dict = get_files(input_dir=str(tmp_path))
+    assignments, yields = assign_objects(file_dict=file_dict)
+
+    assert assign_streaming(file_dict=get_files(input_dir=str(tmp_path)), file_dir=str(tmp_path),
+                            chunk_size=chunk_size) == yields
+    with open(os.path.join(tmp_path, 'assignments.csv')) as fh:
+        assert fh.read() == 'loan_id,facility_id\n' + ''.join(f'{",".join(data)}\n' for data in assignments)
+    # no temporary runs left behind.
+    assert sorted(os.listdir(tmp_path)) == sorted(list(file_dict) + ['assignments.csv'])
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_incremental_runs_match_full_recompute(tmp_path, seed):
+    write_random_dataset(tmp_path, seed)
+    file_dict = get_files(input_dir=str(tmp_path))
+    checkpoint_file = str(tmp_path / 'checkpoint.json')
+    with open(file_dict['loans.csv']) as fh:
+        header, *rows = fh.readlines()
+
+    # loans arrive in daily batches, ids are not in order so assignments get merged in.
+    for day, stop in enumerate([0, 1000, 1001, 3000, len(rows)]):
+        with open(file_dict['loans.csv'], 'w') as fh:
+            fh.writelines([header] + rows[:stop])
+        yields = assign_incremental(file_dict=file_dict, file_dir=str(tmp_path), checkpoint_file=checkpoint_file)
+        write(file_dir=str(tmp_path), file_name='yields.csv', header='facility_id,expected_yield', data_list=yields)
+        assert verify(file_dict=file_dict, file_dir=str(tmp_path)) == []
+
+    # changed facilities invalidate the checkpoint, next run recomputes everything.
+    with open(file_dict['facilities.csv'], 'a') as fh:
+        fh.write('100000.0,0.001,1000,1\n')
+    yields = assign_incremental(file_dict=file_dict, file_dir=str(tmp_path), checkpoint_file=checkpoint_file)
+    assert yields == assign_objects(file_dict=file_dict)[1]
+
+    # rewritten loan history is detected as well.
+    with open(file_dict['loans.csv'], 'w') as fh:
+        fh.writelines([header] + rows[1:])
+    yields = assign_incremental(file_dict=file_dict, file_dir=str(tmp_path), checkpoint_file=checkpoint_file)
+    write(file_dir=str(tmp_path), file_name='yields.csv', header='facility_id,expected_yield', data_list=yields)
+    assert verify(file_dict=file_dict, file_dir=str(tmp_path)) == []
+
+
+def test_incremental_run_checks_bounded_windows_and_recovers_unsaved_append(tmp_path, capsys, monkeypatch):
+    write_random_dataset(tmp_path, 0)
+    file_dict = get_files(input_dir=str(tmp_path))
+    checkpoint_file = str(tmp_path / 'checkpoint.json')
+    path = str(tmp_path / 'assignments.csv')
+    with open(file_dict['loans.csv']) as fh:
+        header, *rows = fh.readlines()
+
+    monkeypatch.setattr(Checkpoint, 'WINDOW', 256)
+    hashed = []
+
+    def hash_file(file, start=0, end=None):
+        hashed.append((os.path.basename(file), (os.path.getsize(file) if end is None else end) - start))
+        return snapshot.hash_file(file, start=start, end=end)
+    monkeypatch.setattr(checkpoint, 'hash_file', hash_file)
+
+    def run(stop, verify_outputs=False):
+        hashed.clear()
+        if read(file_dict['loans.csv']) != ''.join([header] + rows[:stop]).encode():
+            with open(file_dict['loans.csv'], 'w') as fh:
+                fh.writelines([header] + rows[:stop])
+        yields = assign_incremental(file_dict=file_dict, file_dir=str(tmp_path), checkpoint_file=checkpoint_file,
+                                    verify=verify_outputs)
+        write(file_dir=str(tmp_path), file_name='yields.csv', header='facility_id,expected_yield', data_list=yields)
+        assert verify(file_dict=file_dict, file_dir=str(tmp_path)) == []
+        return capsys.readouterr().out
+
+    assert 'Full run' in run(2000, verify_outputs=True)
+    # resume hashes bounded windows of loans.csv & assignments.csv only.
+    assert 'Continuing' in run(2100)
+    assert all(size <= 256 for name, size in hashed if name in ('loans.csv', 'assignments.csv'))
+
+    # edit within the window before the checkpoint offset.
+    rows[2099] = rows[2099].replace(',', ',1', 1)
+    assert 'Full run' in run(2200)
+    # edit further back: caught by --verify through the full sha256.
+    rows[5] = rows[5].replace(',', ',1', 1)
+    assert 'Full run' in run(2300, verify_outputs=True)
+    # same size rewrite, nothing appended.
+    rows[6] = rows[6][:-3] + ('NY' if rows[6][-3:-1] != 'NY' else 'CA') + '\n'
+    assert 'Full run' in run(2300)
+
+    # run appended rows but stopped before saving its checkpoint: they get cut off & appended once.
+    with open(path) as fh:
+        saved = fh.read()
+    with open(path, 'a') as fh:
+        fh.write('999999,1\n')
+    assert 'Continuing' in run(2300)
+    with open(path) as fh:
+        assert fh.read() == saved
+    assert 'Continuing' in run(len(rows))
+
+
+@pytest.mark.parametrize('dataset', ['small', 'large'])
+def test_streaming_outputs_match_reference(tmp_path, dataset):
+    output_dir = run_fund(tmp_path, dataset, '--stream')
+    for file in OUTPUT_FILES:
+        assert read(os.path.join(output_dir, file)) == read(os.path.join(SAMPLE_DIR, dataset, file))
+
+
+def test_portfolio_yields_follow_assign_and_unassign():
+    facilities = [Facility(id='1', bank_id='1', interest_rate=0.05, amount=100.0),
+                  Facility(id='2', bank_id='1', interest_rate=0.03, amount=50.0),
+                  Facility(id='3', bank_id='2', interest_rate=0.03, amount=500.0)]
+    loans = [Loan(id=str(id), interest_rate=0.1 + id / 1000, default_likelihood=id / 100, amount=1000 + id, state='CA')
+             for id in range(1, 31)]
+    portfolio = Portfolio()
+
+    for loan in loans:
+        portfolio.assign(facility=facilities[int(loan.id) % 3], loan=loan)
+    assert loans[0].facility_id == '2'
+
+    expected = {facility.id: sum(facility.loan_yield(loan) for loan in loans if loan.facility_id == facility.id)
+                for facility in facilities}
+    for facility in facilities:
+        assert facility.get_yield() == round(expected[facility.id])
+    assert portfolio.get_bank_yield('1') == round(expected['1'] + expected['2'])
+    assert portfolio.get_bank_yield('2') == round(expected['3'])
+    assert portfolio.get_bank_yield('9') == 0
+    assert portfolio.get_yield() == round(sum(expected.values()))
+
+    # unassigning everything takes yields exactly back to zero.
+    for loan in reversed(loans):
+        portfolio.unassign(facility=facilities[int(loan.id) % 3], loan=loan)
+    assert loans[0].facility_id is None
+    assert all(facility.expected_yield.units == 0 for facility in facilities)
+    assert portfolio.total_yield.units == 0
+
+
+def test_loan_book_views_match_loans():
+    loans = Loan.load(file=os.path.join(SAMPLE_DIR, 'large', 'loans.csv'))
+    book = LoanBook.load(file=os.path.join(SAMPLE_DIR, 'large', 'loans.csv'))
+
+    assert len(book) == len(loans)
+    for loan, view in zip(loans, book):
+        assert (view.id, view.interest_rate, view.default_likelihood, view.amount, view.state) == \
+               (loan.id, loan.interest_rate, loan.default_likelihood, loan.amount, loan.state)
+        assert repr(view) == repr(loan)
+    assert book[-1].id == loans[-1].id
+
+    # facility assignment goes through the same attribute.
+    facility = Facility(id='7', bank_id='1', interest_rate=0.01, amount=1.0)
+    facility.assign(book[3])
+    assert book[3].facility_id == '7' and book[4].facility_id is None
+    assert facility.unassign(book[3]) == facility.loan_yield(loans[3])
+    assert book[3].facility_id is None
+
+
+def test_scenarios_share_loans_across_workers():
+    file_dict = get_files(input_dir=os.path.join(SAMPLE_DIR, 'large'))
+    _, yields = assign_objects(file_dict=file_dict)
+    results = run_scenarios(file_dict=file_dict, workers=2,
+                            scenarios=[{'name': 'base'},
+                                       {'name': 'rates_up', 'interest_rate_shift': 0.01},
+                                       {'name': 'base_again', 'amount_scale': 1}])
+
+    base = results[0]
+    assert [(facility_id, str(base['yields'][facility_id])) for facility_id, _ in yields] == yields
+    assert results[2]['yields'] == base['yields']
+    assert results[1]['total'] < base['total']
+
+    header, rows = comparison_table(results)
+    assert header == 'facility_id,base,rates_up,base_again'
+    assert rows[-2][0] == 'total' and rows[-1] == ['assigned_loans'] + [str(base['assigned'])] * 3
+
+    with pytest.raises(ValueError):
+        run_scenarios(file_dict=file_dict, scenarios=[{'name': 'x'}, {'name': 'x'}])
+
+
+def test_snapshot_cache_hits_and_invalidates(tmp_path):
+    for file in INPUT_FILES:
+        shutil.copy(os.path.join(SAMPLE_DIR, 'large', file), tmp_path)
+    file_dict = get_files(input_dir=str(tmp_path))
+    expected = assign_objects(file_dict=file_dict)
+
+    cache = SnapshotCache(cache_dir=str(tmp_path / 'cache'))
+    assert cache.lookup(file_dict['loans.csv']) is None
+    assert assign_objects(file_dict=file_dict, cache=cache) == expected
+    assert cache.lookup(file_dict['loans.csv']) is not None
+
+    # served from snapshots.
+    assert assign_objects(file_dict=file_dict, cache=cache) == expected
+
+    # touched but same content still hits, changed content misses.
+    os.utime(file_dict['loans.csv'], ns=(0, 0))
+    assert cache.lookup(file_dict['loans.csv']) is not None
+    with open(file_dict['loans.csv'], 'a') as fh:
+        fh.write('0.1,100,100000,0.01,CA\n')
+    assert cache.lookup(file_dict['loans.csv']) is None
+    assignments, _ = assign_objects(file_dict=file_dict, cache=cache)
+    assert assignments[-1][0] == '100000'
+
+    assert cache.invalidate(files=[file_dict['facilities.csv']]) == 2
+    assert cache.lookup(file_dict['facilities.csv']) is None
+    assert cache.invalidate() == 4
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_optimized_assignment_keeps_constraints_and_improves_yield(tmp_path, seed):
+    write_random_dataset(tmp_path, seed)
+    file_dict = get_files(input_dir=str(tmp_path))
+    greedy_assignments, _ = assign_objects(file_dict=file_dict)
+    assignments, yields = assign_optimized(file_dict=file_dict, budget=5.0)
+
+    facilities = {facility.id: facility for facility in Facility.load(file=file_dict['facilities.csv'])}
+    covenant_map = process_covenants(covenants=Covenant.load(file=file_dict['covenants.csv']))
+    loans = {loan.id: loan for loan in Loan.load(file=file_dict['loans.csv'])}
+
+    def total(assignments):
+        return sum(facilities[facility_id].loan_yield(loans[loan_id]) for loan_id, facility_id in assignments
+                   if facility_id)
+
+    used = {facility_id: 0 for facility_id in facilities}
+    for (loan_id, facility_id), (_, greedy_facility_id) in zip(assignments, greedy_assignments):
+        # loans funded by greedy stay funded.
+        assert facility_id or not greedy_facility_id
+        if facility_id:
+            facility, loan = facilities[facility_id], loans[loan_id]
+            used[facility_id] += loan.amount
+            assert all(cv.check(loan.default_likelihood, loan.state)
+                       for cv in covenant_map.get((facility.bank_id, ''), []) +
+                       covenant_map.get((facility.bank_id, facility.id), []))
+    assert all(used[facility_id] <= facility.amount for facility_id, facility in facilities.items())
+
+    # yields list facilities with loans or room left, like a plain run over the final state would.
+    listed = {facility_id for facility_id, _ in yields}
+    assert {facility_id for _, facility_id in assignments if facility_id} <= listed
+    assert {facility_id for facility_id, facility in facilities.items() if facility.amount > used[facility_id]} \
+        <= listed
+
+    assert total(assignments) > total(greedy_assignments)
+    for facility_id, expected_yield in yields:
+        assert int(expected_yield) == round(sum(facilities[facility_id].loan_yield(loans[loan_id])
+                                                for loan_id, assigned_id in assignments
+                                                if assigned_id == facility_id))
+
+
+def test_local_search_swap_stops_at_deadline():
+    facilities = [Facility(id='1', bank_id='1', interest_rate=0.01, amount=1000.0),
+                  Facility(id='2', bank_id='1', interest_rate=0.05, amount=5000.0)]
+    loans = [Loan(id='1', interest_rate=0.2, default_likelihood=0.01, amount=600, state='CA'),
+             Loan(id='2', interest_rate=0.2, default_likelihood=0.01, amount=1000, state='CA')]
+    facility_index, eligibility, portfolio = fund.index_facilities(facilities=facilities, covenants=[])
+    assigned = []
+    for loan in loans:
+        facility = fund.find_facility(loan=loan, facility_index=facility_index, eligibility=eligibility)
+        portfolio.assign(facility=facility, loan=loan)
+        assigned.append(facility_index.facilities.index(facility))
+
+    local_search = LocalSearch(loans=loans, assigned=assigned, facility_index=facility_index,
+                               eligibility=eligibility, portfolio=portfolio)
+    # past the deadline, the swap of loan 2 into facility 1 is not taken.
+    local_search.deadline = 0.0
+    assert not local_search.swap(1) and assigned == [0, 1]
+    local_search.deadline = float('inf')
+    assert local_search.swap(1) and assigned == [1, 0]
+
+
+def test_optimized_yields_keep_facilities_filled_up_by_local_search(tmp_path):
+    with open(tmp_path / 'facilities.csv', 'w') as fh:
+        fh.write('amount,interest_rate,id,bank_id\n1000.0,0.01,1,1\n5000.0,0.05,2,1\n')
+    with open(tmp_path / 'covenants.csv', 'w') as fh:
+        fh.write('facility_id,max_default_likelihood,bank_id,banned_state\n')
+    with open(tmp_path / 'loans.csv', 'w') as fh:
+        fh.write('interest_rate,amount,id,default_likelihood,state\n0.2,600,1,0.01,CA\n0.2,1000,2,0.01,CA\n')
+    file_dict = get_files(input_dir=str(tmp_path))
+
+    # swap moves loan 2 into facility 1, using it up exactly.
+    assignments, yields = assign_optimized(file_dict=file_dict, budget=5.0)
+    assert assignments == [['1', '2'], ['2', '1']]
+    assert [facility_id for facility_id, _ in yields] == \
+        sorted({facility_id for _, facility_id in assignments if facility_id}, key=int)
+
+
+def test_generated_book_is_deterministic_and_skewed(tmp_path):
+    generator = BookGenerator(loan_count=20000, facility_count=30, covenant_density=3.0, skew=1.5, seed=7)
+    generator.write(file_dir=str(tmp_path / 'a'))
+    generator.write(file_dir=str(tmp_path / 'b'))
+    for file in INPUT_FILES:
+        assert read(os.path.join(tmp_path, 'a', file)) == read(os.path.join(tmp_path, 'b', file))
+
+    file_dict = get_files(input_dir=str(tmp_path / 'a'))
+    loans = Loan.load(file=file_dict['loans.csv'])
+    assert len(loans) == 20000 and len(Facility.load(file=file_dict['facilities.csv'])) == 30
+    states = sorted((sum(1 for loan in loans if loan.state == state) for state in {loan.state for loan in loans}),
+                    reverse=True)
+    assert states[0] > 5 * states[len(states) // 2]
+    assert sum(1 for loan in loans if loan.default_likelihood <= 0.03) > len(loans) / 2
+
+    # tight capacities leave some loans unassigned, but most get funded.
+    assignments, _ = assign_objects(file_dict=file_dict)
+    assert 0 < sum(1 for _, facility_id in assignments if not facility_id) < len(assignments) / 2
+
+
+def test_benchmark_records_phases_and_flags_regressions():
+    record = benchmark(generator=BookGenerator(loan_count=2000, facility_count=10), repeat=1)
+    assert sorted(record['phases']) == sorted(PHASES)
+    assert all(record['phases'][phase]['seconds'] > 0 for phase in PHASES)
+    assert record['config']['loans'] == 2000 and 0 < record['unassigned'] < 2000
+
+    assert regressions(record, [], max_regression=0.2) == []
+    faster = {**record, 'phases': {phase: {'seconds': 0, 'loans_per_second': values['loans_per_second'] * 2}
+                                   for phase, values in record['phases'].items()}}
+    assert [line.split()[0] for line in regressions(record, [faster], max_regression=0.2)] == PHASES
+    assert regressions(record, [{**faster, 'machine': 'other'}], max_regression=0.2) == []
+
+
+def test_profiler_counts_hot_path_and_unwinds(tmp_path):
+    originals = FacilityIndex.find, FacilityIndex.update, Eligibility.mask, fund.find_facility
+    file_dict = get_files(input_dir=os.path.join(SAMPLE_DIR, 'large'))
+
+    run_profiler = Profiler(dump=str(tmp_path / 'run.prof'))
+    run_profiler.install(namespace=vars(fund))
+    assignments, _ = assign_objects(file_dict=file_dict)
+    run_profiler.uninstall()
+
+    # nothing stays wrapped once the run is over.
+    assert (FacilityIndex.find, FacilityIndex.update, Eligibility.mask, fund.find_facility) == originals
+    assert profiler.active is None and profiler.phase('load') is profiler.NO_PHASE
+
+    counters = run_profiler.counters
+    assert counters['loans'] == len(assignments) == 425
+    assert counters['unassigned'] == sum(1 for _, facility_id in assignments if not facility_id)
+    assert counters['masks'] == counters['loans'] and counters['finds'] >= counters['loans'] - counters['unassigned']
+    assert sorted(run_profiler.seconds) == ['assign', 'covenants', 'load']
+    assert os.path.getsize(tmp_path / 'run.prof') > 0
+
+
+@pytest.mark.parametrize('dataset', ['small', 'large'])
+def test_profiled_outputs_match_reference(tmp_path, dataset):
+    output_dir = run_fund(tmp_path, dataset, '--profile')
+    for file in OUTPUT_FILES:
+        assert read(os.path.join(output_dir, file)) == read(os.path.join(SAMPLE_DIR, dataset, file))
+
@@ -0,0 +1,166 @@
+'''
+Test module for service.
+Runs the assignment service on a local port and drives it with an HTTP client.
+'''
+
+import http.client
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from fund import assign_objects, get_files
+from covenant import Covenant
+from loan import Loan
+from service import AssignmentService, make_server
+
+SAMPLE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def client():
+    service = AssignmentService.load(file_dict=get_files(input_dir=os.path.join(SAMPLE_DIR, 'small')))
+    server = make_server(service=service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def request(method, path, body=None):
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+        connection.request(method, path, body=None if body is None else json.dumps(body))
+        response = connection.getresponse()
+        result = response.status, json.loads(response.read())
+        connection.close()
+        return result
+
+    request.port = server.server_address[1]
+    yield request
+    server.shutdown()
+    server.server_close()
+
+
+def test_service_matches_batch_assignment():
+    file_dict = get_files(input_dir=os.path.join(SAMPLE_DIR, 'large'))
+    assignments, yields = assign_objects(file_dict=file_dict)
+
+    service = AssignmentService.load(file_dict=file_dict)
+    for loan in Loan.load(file=file_dict['loans.csv']):
+        service.assign_loan(loan)
+
+    assert sorted(([loan.id, loan.facility_id or ''] for loan in service.loans.values()),
+                  key=lambda x: int(x[0])) == assignments
+    assert sorted(((facility.id, str(facility.get_yield())) for facility in service.facility_index),
+                  key=lambda x: int(x[0])) == yields
+
+
+def test_assign_and_unassign_loan(client):
+    status, loan = client('POST', '/loan', {'id': '1', 'interest_rate': 0.15, 'amount': 10552,
+                                            'default_likelihood': 0.02, 'state': 'MO'})
+    assert status == 201 and loan['facility_id'] == '1'
+
+    status, facility = client('GET', '/facility/1')
+    assert facility['amount'] == 126122.0 - 10552 and facility['expected_yield'] == 707
+
+    status, banks = client('GET', '/banks')
+    assert banks == {'expected_yield': 707, 'banks': {'1': 0, '2': 707}}
+
+    status, loan = client('DELETE', '/facility/1/loan/1')
+    assert status == 200 and loan['facility_id'] is None
+    status, facility = client('GET', '/facility/1')
+    assert facility['amount'] == 126122.0 and facility['expected_yield'] == 0
+
+    # unassigning twice is rejected.
+    status, _ = client('DELETE', '/facility/1/loan/1')
+    assert status == 400
+
+
+def test_facility_create_update_and_errors(client):
+    status, _ = client('POST', '/facility', {'id': '3', 'bank_id': '1', 'interest_rate': 0.01, 'amount': 100.0})
+    assert status == 201
+
+    # new cheapest facility takes the loan once it has room.
+    status, loan = client('POST', '/loan', {'id': '1', 'interest_rate': 0.15, 'amount': 500,
+                                            'default_likelihood': 0.02, 'state': 'MO'})
+    assert loan['facility_id'] == '1'
+    status, _ = client('PUT', '/facility/3', {'amount': 1000.0})
+    status, loan = client('POST', '/loan', {'id': '2', 'interest_rate': 0.15, 'amount': 500,
+                                            'default_likelihood': 0.02, 'state': 'MO'})
+    assert loan['facility_id'] == '3'
+
+    # interest rate change re-orders facilities.
+    status, _ = client('PUT', '/facility/3', {'interest_rate': 0.5})
+    status, loan = client('POST', '/loan', {'id': '3', 'interest_rate': 0.15, 'amount': 400,
+                                            'default_likelihood': 0.02, 'state': 'MO'})
+    assert loan['facility_id'] == '1'
+
+    assert client('POST', '/loan', {'id': '3', 'interest_rate': 0.15, 'amount': 1,
+                                    'default_likelihood': 0.0, 'state': 'MO'})[0] == 400
+    assert client('POST', '/loan', {'id': '4'})[0] == 400
+    assert client('GET', '/facility/42')[0] == 404
+    assert client('GET', '/nowhere')[0] == 404
+    assert len(client('GET', '/loans')[1]) == 3
+
+
+def test_put_loan_routes_and_used_up_facility_stays_out(client):
+    status, loan = client('POST', '/loan', {'id': '1', 'interest_rate': 0.15, 'amount': 1000,
+                                            'default_likelihood': 0.02, 'state': 'MO'})
+    assert loan['facility_id'] == '1'
+
+    # assign to a given facility, checked against its covenants & remaining amount.
+    status, loan = client('PUT', '/facility/2/loan/1')
+    assert status == 200 and loan['facility_id'] == '2'
+    assert client('GET', '/facility/2')[1]['amount'] == 61104.0 - 1000
+    assert client('GET', '/facility/1')[1]['amount'] == 126122.0
+    status, _ = client('PUT', '/loan/1', {'state': 'MT'})
+    assert status == 200
+    assert client('PUT', '/facility/2/loan/1')[0] == 400
+    status, loan = client('PUT', '/loan/1', {'state': 'MO', 'amount': 200000})
+    assert status == 200 and loan['facility_id'] is None
+    assert client('PUT', '/facility/1/loan/1')[0] == 400
+
+    # update re-assigns to the cheapest eligible facility.
+    status, loan = client('PUT', '/loan/1', {'amount': 126122})
+    assert loan['facility_id'] == '1' and client('GET', '/facility/1')[1]['amount'] == 0
+
+    # re-indexing keeps the used up facility out, zero amount loans included.
+    assert client('POST', '/covenant', {'bank_id': '1', 'banned_state': 'TX'})[0] == 201
+    status, loan = client('POST', '/loan', {'id': '2', 'interest_rate': 0.15, 'amount': 0,
+                                            'default_likelihood': 0.02, 'state': 'MO'})
+    assert loan['facility_id'] == '2'
+
+    assert client('PUT', '/loan/42', {'amount': 1})[0] == 404
+    assert client('PUT', '/loan/1', {'amount': 1e400})[0] == 500
+    assert client('GET', '/loan/1')[0] == 200
+
+
+def test_slow_body_does_not_block_other_requests(client):
+    # headers announce a body that never arrives.
+    slow = socket.create_connection(('127.0.0.1', client.port))
+    slow.sendall(b'POST /loan HTTP/1.1\r\nHost: test\r\nContent-Length: 100\r\n\r\n{')
+    try:
+        result = []
+        thread = threading.Thread(target=lambda: result.append(client('GET', '/loans')), daemon=True)
+        thread.start()
+        thread.join(timeout=5)
+        assert result == [(200, [])]
+    finally:
+        slow.close()
+
+
+def test_zero_amount_facility_keeps_batch_leaf_and_covenant_types_are_checked(tmp_path, client):
+    (tmp_path / 'banks.csv').write_text(open(os.path.join(SAMPLE_DIR, 'small', 'banks.csv')).read())
+    (tmp_path / 'facilities.csv').write_text('amount,interest_rate,id,bank_id\n0.0,0.01,1,1\n100.0,0.02,2,1\n')
+    (tmp_path / 'covenants.csv').write_text('facility_id,max_default_likelihood,bank_id,banned_state\n')
+    (tmp_path / 'loans.csv').write_text('interest_rate,amount,id,default_likelihood,state\n0.1,0,1,0.01,CA\n')
+    file_dict = get_files(input_dir=str(tmp_path))
+
+    # 0 amount facility from facilities.csv takes a 0 amount loan, in batch & service alike, re-indexing included.
+    service = AssignmentService.load(file_dict=file_dict)
+    service.add_covenant(Covenant(bank_id='2', facility_id='', maximum_default_likelihood=0, banned_state='TX'))
+    loan = Loan(id='1', interest_rate=0.1, default_likelihood=0.01, amount=0, state='CA')
+    assert service.assign_loan(loan).id == assign_objects(file_dict=file_dict)[0][0][1] == '1'
+
+    for banned_state in [5, ['CA'], {'state': 'CA'}]:
+        assert client('POST', '/covenant', {'bank_id': '1', 'banned_state': banned_state})[0] == 400
+    assert client('POST', '/covenant', {'bank_id': '1', 'banned_state': 'CA'})[0] == 201
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import argparse
+import contextlib
+import heapq
+import io
+import os
+import random
+import tempfile
+import time
+from functools import partial
+
+from merge import LoserTreeIterator, MergeIterator, read_lines
+
+
+def write_shards(shard_dir, fan_in, line_count, seed=0):
+    '''
+    write fan_in sorted shard files holding line_count random lines in total.
+
+    :return: list of shard file paths.
+    '''
+    rng = random.Random(seed)
+    files = []
+    for index in range(fan_in):
+        lines = sorted(f'{rng.getrandbits(48):012x},{rng.getrandbits(64):016x}'
+                       for _ in range(line_count // fan_in))
+        file = os.path.join(shard_dir, f'shard_{index:05d}.txt')
+        with open(file, 'w') as fh:
+            fh.write('\n'.join(lines) + '\n')
+        files.append(file)
+    return files
+
+
+def drain(iterator):
+    ''' :return: int, number of lines merged by a MergeIterator. '''
+    count = 0
+    try:
+        while True:
+            iterator.next_bytes()
+            count += 1
+    except StopIteration:
+        return count
+
+
+def merge_iterator(iterator_class):
+    def run(files):
+        # keep per file open/first line messages out of the timing.
+        with contextlib.redirect_stdout(io.StringIO()):
+            iterator = iterator_class(files)
+        return drain(iterator)
+    return run
+
+
+def heapq_merge(files):
+    return sum(1 for _ in heapq.merge(*[read_lines(file) for file in files]))
+
+
+ENGINES = [
+    ('heap', merge_iterator(MergeIterator)),
+    ('loser', merge_iterator(LoserTreeIterator)),
+    ('heap mmap', merge_iterator(partial(MergeIterator, reader='mmap'))),
+    ('heapq.merge', heapq_merge),
+]
+
+
+def prompt():
+    '''
+    Prompt to take fan-ins & total line count.
+    :return: list of fan-ins, total lines, repeat count.
+    '''
+    parser = argparse.ArgumentParser(description='Merge Core Benchmark')
+    parser.add_argument('-f', '--fan_in', type=int, nargs='+', default=[2, 10, 100, 1000, 10000],
+                        help='Numbers of input files to merge (default: 2 10 100 1000 10000)')
+    parser.add_argument('-l', '--lines', type=int, default=1000000, help='Total lines per merge (default: 1000000)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Repetitions, fastest kept (default: 3)')
+    args = parser.parse_args()
+
+    # minor input validation.
+    if any(fan_in < 1 or fan_in > args.lines for fan_in in args.fan_in) or args.repeat < 1:
+        raise ValueError('Invalid fan-in {} for {} lines'.format(args.fan_in, args.lines))
+
+    return args.fan_in, args.lines, args.repeat
+
+
+if __name__ == '__main__':
+
+    fan_ins, line_count, repeat = prompt()
+    print(f'{"fan-in":>8}' + ''.join(f'{name:>22}' for name, _ in ENGINES))
+
+    for fan_in in fan_ins:
+        with tempfile.TemporaryDirectory() as shard_dir:
+            files = write_shards(shard_dir, fan_in, line_count)
+            results = []
+            for name, run in ENGINES:
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    count = run(files)
+                    seconds = time.perf_counter() - start
+                    best = seconds if best is None else min(best, seconds)
+                results.append(f'{best:>8.3f}s {count / best / 1e6:>6.2f}M/s')
+        print(f'{fan_in:>8}' + ''.join(f'{result:>22}' for result in results))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import sys
+from bisect import bisect_left, bisect_right
+
+
+def prefix_end(prefix):
+    '''
+    :param prefix: bytes
+    :return: bytes, smallest line above every line starting with prefix, None if there is none.
+    '''
+    prefix = prefix.rstrip(b'\xff')
+    if not prefix:
+        return None
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+
+class ShardIndex:
+    '''
+    ShardIndex class.
+
+    Lookups into sharded merge output (merge.py --shard_size, ShardWriter) through its sparse index:
+    one bisect over the indexed lines finds the index block a line would sit in, one bounded read of that
+    block (at most index_every lines, within a single shard) answers membership. Prefix queries read the
+    blocks between the bisects of the prefix & its end, one read per shard.
+    '''
+
+    def __init__(self, output_file, shards, offsets, lines):
+        '''
+        :param output_file: str, sharded output path.
+        :param shards: list of int, shard number per index entry.
+        :param offsets: list of int, byte offset in its shard per index entry.
+        :param lines: list of bytes, indexed line per index entry (sorted).
+        '''
+        self.output_file = output_file
+        self.shards = shards
+        self.offsets = offsets
+        self.lines = lines
+
+    def shard_file(self, shard):
+        return f'{self.output_file}.{shard:05d}'
+
+    def read(self, first, last) -> list:
+        '''
+        :param first: int, first index entry to read.
+        :param last: int, index entry to stop before, all in the same shard.
+        :return: list of lines (bytes) of index blocks first to last.
+        '''
+        start = self.offsets[first]
+        end = self.offsets[last] if last < len(self.offsets) and self.shards[last] == self.shards[first] else None
+        with open(self.shard_file(self.shards[first]), 'rb') as fh:
+            fh.seek(start)
+            data = fh.read() if end is None else fh.read(end - start)
+        return data.split(b'\n')[:-1]
+
+    def contains(self, line) -> bool:
+        '''
+        :param line: bytes, stripped line.
+        :return: bool, True if line is in the output.
+        '''
+        position = bisect_right(self.lines, line) - 1
+        if position < 0:
+            return False
+        lines = self.read(position, position + 1)
+        found = bisect_left(lines, line)
+        return found < len(lines) and lines[found] == line
+
+    def prefix(self, prefix) -> list:
+        '''
+        :param prefix: bytes
+        :return: list of lines (bytes) starting with prefix, sorted.
+        '''
+        end = prefix_end(prefix)
+        first = max(bisect_right(self.lines, prefix) - 1, 0)
+        last = len(self.lines) if end is None else bisect_left(self.lines, end)
+
+        found = []
+        while first < last:
+            # one read per shard.
+            stop = first
+            while stop < last and self.shards[stop] == self.shards[first]:
+                stop += 1
+            found += [line for line in self.read(first, stop) if line.startswith(prefix)]
+            first = stop
+        return found
+
+    @staticmethod
+    def load(output_file):
+        '''
+        Load ShardIndex of output_file.
+
+        :param output_file: str, sharded output path (output_file.index is read).
+        :return: ShardIndex
+        '''
+        shards, offsets, lines = [], [], []
+        with open(output_file + '.index', 'rb') as fh:
+            for entry in fh:
+                shard, offset, line = entry.rstrip(b'\n').split(b'\t', 2)
+                shards.append(int(shard))
+                offsets.append(int(offset))
+                lines.append(line)
+        return ShardIndex(output_file, shards, offsets, lines)
+
+
+def prompt():
+    '''
+    Prompt to take sharded output path & queries.
+    :return: sharded output path, list of lines to look up, list of prefixes to list.
+    '''
+    parser = argparse.ArgumentParser(description='Sharded Merge Output Lookup')
+    required_arguments = parser.add_argument_group('required arguments')
+    required_arguments.add_argument('-o', '--output_file', help='Full path of the sharded output (merge.py -o)')
+    parser.add_argument('-q', '--query', nargs='+', default=[], help='Lines to check membership of')
+    parser.add_argument('-p', '--prefix', nargs='+', default=[], help='Prefixes to list lines of')
+    args = parser.parse_args(args=None if sys.argv[1:] else ['-h'])
+
+    # minor input validation.
+    if args.output_file is None or not os.path.exists(args.output_file + '.index'):
+        raise ValueError('Invalid sharded output {}'.format(args.output_file))
+
+    return args.output_file, args.query, args.prefix
+
+
+if __name__ == '__main__':
+
+    output_file, queries, prefixes = prompt()
+    shard_index = ShardIndex.load(output_file)
+    for query in queries:
+        print(f'{query}: {"found" if shard_index.contains(query.strip().encode()) else "not found"}')
+    for prefix in prefixes:
+        for line in shard_index.prefix(prefix.encode()):
+            print(line.decode())
@@ -1,108 +1,1180 @@
 import argparse
+import bz2
+import gzip
+import lzma
 import os
+import queue
 import heapq
+import mmap
+import shutil
 import sys
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# compression modules by leading magic bytes of input files.
+COMPRESSIONS = {
+    b'\x1f\x8b': gzip,
+    b'BZh': bz2,
+    b'\xfd7zXZ\x00': lzma,
+}
+
+# compression modules by output file suffix.
+SUFFIXES = {
+    '.gz': gzip,
+    '.bz2': bz2,
+    '.xz': lzma,
+}
+
+
+def compressed(file):
+    ''' :return: compression module (gzip, bz2, lzma) the file is compressed with, None for plain files. '''
+    with open(file, 'rb') as fh:
+        magic = fh.read(6)
+    return next((module for prefix, module in COMPRESSIONS.items() if magic.startswith(prefix)), None)
+
+
+def open_input(file):
+    ''' :return: binary file handle over the (decompressed) file content. '''
+    module = compressed(file)
+    return open(file, 'rb') if module is None else module.open(file, 'rb')
+
+
+def open_output(file):
+    ''' :return: binary file handle writing file, compressed by its suffix (.gz, .bz2, .xz). '''
+    module = SUFFIXES.get(os.path.splitext(file)[1])
+    return open(file, 'wb') if module is None else module.open(file, 'wb')
+
+
+DONE = None
+
+
+def read_ahead(lines, depth=4, block_lines=1024):
+    '''
+    Read-ahead prefetch: a background thread pulls lines of a reader into a queue of at most depth blocks
+    (block_lines lines each), so input reads & decompression (both release the GIL) overlap the merge loop.
+    The thread waits while the queue is full, an error of the reader is raised to the consumer after the lines
+    before it, closing the generator stops the thread & closes the reader.
+
+    :param lines: generator of lines, e.g. read_lines.
+    :param depth: int, max blocks queued ahead.
+    :param block_lines: int, lines per block.
+    :return: generator of the same lines.
+    '''
+    blocks = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        # give up once the consumer is gone, instead of blocking forever on a full queue.
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fill():
+        try:
+            block = []
+            for line in lines:
+                block.append(line)
+                if len(block) >= block_lines:
+                    if not put(block):
+                        return
+                    block = []
+            if put(block):
+                put(DONE)
+        except Exception as e:
+            put(e)
+        finally:
+            lines.close()
+
+    thread = threading.Thread(target=fill, daemon=True)
+    thread.start()
+    try:
+        while True:
+            block = blocks.get()
+            if block is DONE:
+                return
+            if isinstance(block, Exception):
+                raise block
+            yield from block
+    finally:
+        stop.set()
+        thread.join()
+
+
+def read_lines(file, block_size=1 << 20, start=0, end=None):
+    '''
+    Block-buffered line reader: reads the file in large binary blocks & splits lines out of the buffer.
+    Lines are stripped of surrounding (ASCII) whitespace, blank lines are skipped.
+
+    :param file: path to input file.
+    :param block_size: int, bytes read per block.
+    :param start: int, byte offset to start reading at, a line start.
+    :param end: int, byte offset to stop reading at, a line start (None for file end).
+    :return: generator of non empty stripped lines as bytes.
+    '''
+    with open_input(file) as fh:
+        fh.seek(start)
+        remaining = float('inf') if end is None else end - start
+        tail = b''
+        while remaining > 0:
+            block = fh.read(min(block_size, remaining))
+            remaining -= len(block)
+            if not block:
+                break
+            lines = (tail + block).split(b'\n')
+            # last piece may be cut mid line, carry it over to next block.
+            tail = lines.pop()
+            for line in lines:
+                line = line.strip()
+                if line:
+                    yield line
+        tail = tail.strip()
+        if tail:
+            yield tail
+
+
+def map_lines(file, block_size=1 << 20, start=0, end=None):
+    '''
+    Memory-mapped line reader: same lines as read_lines, split straight out of the page cache mapping
+    block by block (cut at the last line ending of each block), no read calls nor carried over tails.
+    Compressed files can't be mapped & go through read_lines.
+
+    :param file: path to input file.
+    :param block_size: int, bytes of mapping split at once.
+    :param start: int, byte offset to start reading at, a line start.
+    :param end: int, byte offset to stop reading at, a line start (None for file end).
+    :return: generator of non empty stripped lines as bytes.
+    '''
+    if compressed(file) is not None:
+        yield from read_lines(file, block_size=block_size, start=start, end=end)
+        return
+
+    with open(file, 'rb') as fh:
+        end = os.fstat(fh.fileno()).st_size if end is None else end
+        # empty files can't be mapped.
+        if end <= start:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while start < end:
+                stop = min(start + block_size, end)
+                if stop < end:
+                    cut = mm.rfind(b'\n', start, stop)
+                    # line longer than the block: extend block to its line ending.
+                    stop = cut + 1 if cut >= 0 else (mm.find(b'\n', stop, end) + 1 or end)
+                for line in mm[start:stop].split(b'\n'):
+                    line = line.strip()
+                    if line:
+                        yield line
+                start = stop
+
+
+READERS = {
+    'read': read_lines,
+    'mmap': map_lines,
+}
+
+
+def line_start(fh, offset) -> int:
+    '''
+    :param fh: binary file handle.
+    :param offset: int, byte offset.
+    :return: int, offset of the first line starting at or after offset, file handle positioned there.
+    '''
+    fh.seek(max(offset - 1, 0))
+    if offset > 0:
+        # rest of the line offset falls in (up to its line ending).
+        fh.readline()
+    return fh.tell()
+
+
+def first_line(fh, offset):
+    '''
+    :return: bytes, first non empty stripped line starting at or after offset, None past the last one.
+    '''
+    line_start(fh, offset)
+    for line in fh:
+        line = line.strip()
+        if line:
+            return line
+    return None
+
+
+def seek_key(fh, key, size, after=False) -> int:
+    '''
+    Binary search a sorted file by byte offset, resyncing on line endings.
+
+    :param fh: binary file handle.
+    :param key: bytes, stripped line to search.
+    :param size: int, file size.
+    :param after: bool, skip lines equal to key too.
+    :return: int, start offset of the line after the last line < key (<= key with after),
+             file size if all lines are.
+    '''
+    low, high = 0, size
+    while low < high:
+        middle = (low + high) // 2
+        line = first_line(fh, middle)
+        if line is None or line > key or (line == key and not after):
+            high = middle
+        else:
+            low = middle + 1
+    return line_start(fh, low)
 
 
 class MergeIterator:
     '''
-    MergeIterator: takes file lists, constructs file handle mapping and merge sorts the lines until exhausted.
+    MergeIterator: takes file lists, constructs block-buffered readers and merge sorts the lines until exhausted.
+    Lines are compared as raw bytes (same order as comparing decoded utf-8 text).
     '''
-    def __init__(self, files):
+    def __init__(self, files, block_size=1 << 20, ranges=None, reader='read', prefetch=0):
+        '''
+        :param files: list of sorted input file paths.
+        :param block_size: int, bytes read from each input at once.
+        :param ranges: list of (start, end) byte offsets per file to merge, None for whole files.
+        :param reader: str, READERS name, how inputs are read.
+        :param prefetch: int, line blocks read ahead per input by a thread, 0 for none.
+        '''
         self.files = files
-        self.file_handles = {}
-        self.heap = []
-        self.last_line = ''
+        self.readers = {}
+        self.last_line = b''
         self.last_read = {}
 
         for i, file in enumerate(self.files):
             print(f'Iterator opening file[{i}]: {file}')
-            self.file_handles[i] = open(file, 'r')
-            self.last_read[i] = ''
-
-        # initialize heap.
-        for i, fh in self.file_handles.items():
-            while True:
-                line = fh.readline().strip()
-                if not line:
-                    continue
-                print(f'Adding first line of file[i]: {line}')
-                self.heap.append((line, i))
-                break
+            start, end = (0, None) if ranges is None else ranges[i]
+            self.readers[i] = READERS[reader](file, block_size=block_size, start=start, end=end)
+            # compressed inputs always get inflated by a background thread.
+            if prefetch or compressed(file) is not None:
+                self.readers[i] = read_ahead(self.readers[i], depth=prefetch or 2)
+            self.last_read[i] = b''
 
+        # first line of each file, files without any non empty line are done right away.
+        heads = []
+        for i, reader in self.readers.items():
+            line = next(reader, None)
+            if line is not None:
+                print(f'Adding first line of file[{i}]: {line.decode()}')
+                heads.append((line, i))
+        self.build(heads)
+
+    def build(self, heads):
+        '''
+        :param heads: list of (first line, file index) of non empty files.
+        '''
         # create initial heap from n input files.
+        self.heap = heads
         heapq.heapify(self.heap)
 
     def __iter__(self):
         return self
 
-    def next(self) -> str:
+    def next_bytes(self) -> bytes:
         if not self.heap:
             raise StopIteration('End of Iterator reached!')
 
-        # fetch next line & file index from heap.
-        line, i = heapq.heappop(self.heap)
+        # fetch next line & file index from heap top.
+        line, i = self.heap[0]
 
         # check if we received unsorted input file excluding whitespace.
         if self.last_read[i] > line:
-            raise ValueError(f'Input File not sorted! index:{i} [{self.last_read[i]}] followed by [{line}]')
+            heapq.heappop(self.heap)
+            raise ValueError(f'Input File not sorted! index:{i} [{self.last_read[i].decode()}] '
+                             f'followed by [{line.decode()}]')
+        # save the last read line for next comparison.
+        self.last_read[i] = line
 
-        # get appropriate file handle.
-        fh = self.file_handles[i]
-        # keep fetching next until we get non empty line or
-        while True:
-            # check whether end of file reached.
-            before = fh.tell()
-            next_line = fh.readline().strip()
-            after = fh.tell()
-
-            # reached the file end?
-            if before == after:
-                self.file_handles[i].close()
-                break
-            elif next_line:
-                # save the last read line for next comparison.
-                self.last_read[i] = line
-                # push next line to heap.
-                heapq.heappush(self.heap, (next_line, i))
-                break
-            # we read empty line, read again.
-            elif not next_line:
-                continue
+        next_line = next(self.readers[i], None)
+        if next_line is None:
+            # reached the file end, reader closed the file.
+            heapq.heappop(self.heap)
+        else:
+            # replace top with next line of same file, single sift.
+            heapq.heapreplace(self.heap, (next_line, i))
+
+        # set last line
+        self.last_line = line
+        return line
+
+    def next(self) -> str:
+        return self.next_bytes().decode()
+
+    def close(self):
+        ''' close every input still open. '''
+        for reader in self.readers.values():
+            reader.close()
+
+
+class Exhausted:
+    ''' key of an exhausted input, sorts after every line. '''
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+
+EXHAUSTED = Exhausted()
+
+
+class LoserTreeIterator(MergeIterator):
+    '''
+    LoserTreeIterator: MergeIterator with a tournament (loser) tree instead of a heap.
+    Each internal node keeps the loser of the match played there, the overall winner sits on top.
+    Advancing the winner's file replays only its leaf to root path: lgN comparisons per line
+    (heap pop & push take up to 2lgN) and no (line, index) tuple per line.
+    Ties go to the lower file index, so lines come out in exactly the same order as from the heap.
+    '''
+
+    def build(self, heads):
+        '''
+        :param heads: list of (first line, file index) of non empty files.
+        '''
+        self.size = 1
+        while self.size < len(self.files):
+            self.size <<= 1
+
+        # current line per file (leaf), EXHAUSTED for done files & padding leaves.
+        self.keys = [EXHAUSTED] * self.size
+        for line, i in heads:
+            self.keys[i] = line
+
+        # play the initial tournament bottom up, tree[node] keeps the loser, winners move up.
+        winners = [0] * self.size + list(range(self.size))
+        self.tree = [0] * self.size
+        for node in range(self.size - 1, 0, -1):
+            left, right = winners[2 * node], winners[2 * node + 1]
+            if self.keys[right] < self.keys[left]:
+                winners[node], self.tree[node] = right, left
+            else:
+                winners[node], self.tree[node] = left, right
+        self.winner = winners[1] if self.size > 1 else 0
+
+    def next_bytes(self) -> bytes:
+        keys = self.keys
+        i = self.winner
+        line = keys[i]
+        if line is EXHAUSTED:
+            raise StopIteration('End of Iterator reached!')
+
+        # check if we received unsorted input file excluding whitespace.
+        last_read = self.last_read
+        unsorted = last_read[i] > line
+        if unsorted:
+            # drop the file like the heap does.
+            next_key = EXHAUSTED
+        else:
+            # save the last read line for next comparison.
+            last_read[i] = line
+            # next line of the same file, reader closes the file at its end.
+            next_key = next(self.readers[i], EXHAUSTED)
+        keys[i] = next_key
+
+        # replay matches from leaf i up to the root, lower index wins ties like (line, index) heap entries.
+        tree = self.tree
+        winner, key = i, next_key
+        node = (i + self.size) >> 1
+        while node:
+            loser = tree[node]
+            loser_key = keys[loser]
+            if loser_key < key or (loser < winner and loser_key == key):
+                tree[node] = winner
+                winner, key = loser, loser_key
+            node >>= 1
+        self.winner = winner
+
+        if unsorted:
+            raise ValueError(f'Input File not sorted! index:{i} [{last_read[i].decode()}] '
+                             f'followed by [{line.decode()}]')
 
         # set last line
         self.last_line = line
         return line
 
 
-def write(output_file, merge_iterator) -> None:
+class Descending:
+    ''' key wrapper reversing the order of any comparable value. '''
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __gt__(self, other):
+        return other.value > self.value
+
+    def __eq__(self, other):
+        return isinstance(other, Descending) and self.value == other.value
+
+
+class LineKey:
+    '''
+    LineKey: sort key of a delimited (CSV/TSV) line, a tuple of the selected columns.
+    Plain delimiter split, quoted fields holding the delimiter aren't supported.
+    '''
+
+    def __init__(self, columns, delimiter=b',', numeric=False, descending=False):
+        '''
+        :param columns: list of int, 0 based column indexes, in key order.
+        :param delimiter: bytes, column delimiter.
+        :param numeric: bool, compare columns as numbers instead of bytes.
+        :param descending: bool, inputs are sorted in descending key order.
+        '''
+        self.columns = columns
+        self.delimiter = delimiter
+        self.numeric = numeric
+        self.descending = descending
+
+    def __call__(self, line):
+        '''
+        :param line: bytes, stripped line.
+        :return: comparable key of the line.
+        '''
+        fields = line.split(self.delimiter)
+        try:
+            if self.numeric:
+                # numbers sort descending negated, no wrapper needed.
+                sign = -1 if self.descending else 1
+                return tuple(sign * float(fields[column]) for column in self.columns)
+            key = tuple(fields[column].strip() for column in self.columns)
+        except (IndexError, ValueError):
+            raise ValueError(f'Invalid key columns {self.columns} in line [{line.decode()}]')
+        return Descending(key) if self.descending else key
+
+
+class KeyMergeIterator(MergeIterator):
+    '''
+    KeyMergeIterator: MergeIterator over the key of each line (LineKey) instead of the whole line.
+    A line's key is parsed once when the line is read & kept next to it in the heap entry (key, file index, line),
+    comparisons never parse again. Sortedness is checked on keys & lines with the key of the line returned
+    before are skipped, so only the first line of every key comes out (lowest file index first).
+    '''
+
+    def __init__(self, files, block_size=1 << 20, ranges=None, reader='read', prefetch=0, key=None):
+        '''
+        :param key: LineKey, key of a line.
+        '''
+        self.key = key
+        self.last_keys = {}
+        self.last_key = None
+        super().__init__(files, block_size=block_size, ranges=ranges, reader=reader, prefetch=prefetch)
+
+    def build(self, heads):
+        '''
+        :param heads: list of (first line, file index) of non empty files.
+        '''
+        self.heap = [(self.key(line), i, line) for line, i in heads]
+        heapq.heapify(self.heap)
+
+    def next_bytes(self) -> bytes:
+        heap = self.heap
+        while heap:
+            key, i, line = heap[0]
+
+            # check if we received unsorted input file by key.
+            last_key = self.last_keys.get(i)
+            if last_key is not None and last_key > key:
+                heapq.heappop(heap)
+                raise ValueError(f'Input File not sorted! index:{i} [{self.last_read[i].decode()}] '
+                                 f'followed by [{line.decode()}]')
+            self.last_keys[i] = key
+            self.last_read[i] = line
+
+            next_line = next(self.readers[i], None)
+            if next_line is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (self.key(next_line), i, next_line))
+
+            # skip duplicate keys.
+            if key == self.last_key:
+                continue
+            self.last_key = key
+            self.last_line = line
+            return line
+
+        raise StopIteration('End of Iterator reached!')
+
+
+MERGE_ENGINES = {
+    'heap': MergeIterator,
+    'loser': LoserTreeIterator,
+}
+
+
+def make_iterator(files, engine='heap', key=None, **options):
+    '''
+    :param files: list of sorted input file paths.
+    :param engine: str, MERGE_ENGINES name, key merges always run on the heap.
+    :param key: LineKey, merge by key of lines, None for whole lines.
+    :param options: MergeIterator keyword arguments (block_size, ranges, reader, prefetch).
+    :return: merge iterator.
+    '''
+    if key is not None:
+        return KeyMergeIterator(files, key=key, **options)
+    return MERGE_ENGINES[engine](files, **options)
+
+
+def write_batch(of, batch) -> None:
+    ''' write list of lines (bytes, no line ending) as one chunk. '''
+    if batch:
+        of.write(b'\n'.join(batch))
+        of.write(b'\n')
+
+
+def copy_lines(of, merge_iterator, batch_size=4096, flush=write_batch) -> None:
+    '''
+    Copy lines of merge iterator into binary file handle, skipping duplicates,
+    until the iterator raises (StopIteration once exhausted).
+
+    :param of: binary file handle.
+    :param merge_iterator: merge sort iterator
+    :param batch_size: int, number of lines handed to the file per write call.
+    :param flush: function (of, list of lines) writing a batch, write_batch by default.
+    '''
+    last_written = b''
+    batch = []
+    try:
+        while True:
+            line = merge_iterator.next_bytes()
+            # skip duplicate lines
+            if last_written == line:
+                continue
+            last_written = line
+            batch.append(line)
+            if len(batch) >= batch_size:
+                flush(of, batch)
+                batch.clear()
+    finally:
+        # lines merged before an error still make it to the output.
+        flush(of, batch)
+
+
+def write(output_file, merge_iterator, batch_size=4096) -> None:
     '''
     Generates full output path with items from merge iterator.
     @Note: Skip the duplicate outputs by itself.
 
     :param output_file: full output path to write merged output to.
     :param merge_iterator: merge sort iterator
+    :param batch_size: int, number of lines handed to the file per write call.
     :return: generates merged output file.
     '''
-    last_written = ''
-
     try:
         # overwrite previous file if exists.
-        with open(output_file, 'w') as of:
-            while True:
-                line = merge_iterator.next()
-                # skip duplicate lines
-                if last_written == line:
-                    continue
-                last_written = line
-                of.write(line+'\n')
+        with open_output(output_file) as of:
+            copy_lines(of, merge_iterator, batch_size=batch_size)
 
     except Exception as e:
         print(e)
+    finally:
+        merge_iterator.close()
+
+    print(f'Generated {output_file}')
+
+
+class ShardWriter:
+    '''
+    ShardWriter: output rolled into shard files (output_file.00000, output_file.00001, ...) plus a sparse index
+    (output_file.index) holding shard number, byte offset & line of every index_every-th line, tab separated.
+    Shards get cut at the first index point past shard_size, so every shard starts with an indexed line and
+    an index entry & the next one bound one read within a single shard (see lookup.py).
+    '''
+
+    def __init__(self, output_file, shard_size=1 << 30, index_every=1024):
+        '''
+        :param output_file: full output path, shard & index files get its name plus suffix.
+        :param shard_size: int, bytes per shard (cut at the next index point).
+        :param index_every: int, lines per index entry.
+        '''
+        self.output_file = output_file
+        self.shard_size = shard_size
+        self.index_every = index_every
+        self.shards = []
+        self.fh = None
+        self.offset = 0
+        # lines written since the last indexed one.
+        self.count = 0
+
+        # shards of an earlier, longer output.
+        directory, name = os.path.split(output_file)
+        for file in os.listdir(directory or '.'):
+            suffix = file[len(name) + 1:]
+            if file.startswith(name + '.') and len(suffix) == 5 and suffix.isdigit():
+                os.remove(os.path.join(directory, file))
+        self.index = open(output_file + '.index', 'wb')
+
+    def roll(self):
+        ''' close current shard & open the next one. '''
+        if self.fh is not None:
+            self.fh.close()
+        self.shards.append(f'{self.output_file}.{len(self.shards):05d}')
+        self.fh = open(self.shards[-1], 'wb')
+        self.offset = 0
+
+    def write_lines(self, lines):
+        '''
+        :param lines: list of lines (bytes, no line ending).
+        '''
+        start = 0
+        while start < len(lines):
+            if self.count == 0:
+                if self.fh is None or self.offset >= self.shard_size:
+                    self.roll()
+                self.index.write(b'%d\t%d\t%s\n' % (len(self.shards) - 1, self.offset, lines[start]))
+            # lines up to the next index point, written at once.
+            piece = lines[start:start + self.index_every - self.count]
+            data = b'\n'.join(piece) + b'\n'
+            self.fh.write(data)
+            self.offset += len(data)
+            self.count = (self.count + len(piece)) % self.index_every
+            start += len(piece)
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+        self.index.close()
+
+
+def write_shards(output_file, merge_iterator, shard_size=1 << 30, index_every=1024, batch_size=4096) -> None:
+    '''
+    Same as write, into size bounded shards with a sparse index (ShardWriter) instead of one output file.
+
+    :param output_file: full output path, shard & index files get its name plus suffix.
+    :param merge_iterator: merge sort iterator
+    :param shard_size: int, bytes per shard (cut at the next index point).
+    :param index_every: int, lines per index entry.
+    :param batch_size: int, number of lines handed to the writer at once.
+    '''
+    writer = ShardWriter(output_file, shard_size=shard_size, index_every=index_every)
+    try:
+        copy_lines(writer, merge_iterator, batch_size=batch_size, flush=ShardWriter.write_lines)
+    except Exception as e:
+        print(e)
+    finally:
+        writer.close()
+        merge_iterator.close()
+
+    print(f'Generated {len(writer.shards)} shards & index {output_file}.index')
+
+
+def merge_group(files, run_file, engine='heap', block_size=1 << 20, reader='read', prefetch=0, key=None) -> str:
+    '''
+    Merge a group of files into an intermediate run, de-duplicated like the final output.
+    Raises if any file of the group is not sorted.
+
+    :param files: list of sorted input file paths.
+    :param run_file: path of the run to write.
+    :param engine: str, MERGE_ENGINES name.
+    :param block_size: int, bytes read from each input at once.
+    :param reader: str, READERS name.
+    :param prefetch: int, line blocks read ahead per input by a thread, 0 for none.
+    :param key: LineKey, merge by key of lines, None for whole lines.
+    :return: run file path.
+    '''
+    merge_iterator = make_iterator(files, engine=engine, key=key, block_size=block_size, reader=reader,
+                                   prefetch=prefetch)
+    try:
+        with open(run_file, 'wb') as of:
+            copy_lines(of, merge_iterator)
+    except StopIteration:
+        pass
+    finally:
+        merge_iterator.close()
+    return run_file
+
+
+def plan_pass(runs, max_fan_in, ordered=False) -> tuple:
+    '''
+    Pick groups of runs to merge in the next pass: just enough groups for the following passes to end in a
+    single final merge of at most max_fan_in runs, smallest runs first so the fewest bytes get rewritten.
+    Like the optimal merge pattern, the first group only takes (runs - max_fan_in) % (max_fan_in - 1) + 1 runs,
+    so every later group & the final merge are full. Ordered passes (key merges, lowest file index wins a key)
+    group neighbouring runs in input order instead.
+
+    :param runs: list of run (or input) file paths, more than max_fan_in.
+    :param max_fan_in: int, max files merged at once (>= 2).
+    :param ordered: bool, keep input order: merged groups followed by kept runs are still in input order.
+    :return: list of groups (lists of paths) to merge, list of paths carried over untouched.
+    '''
+    candidates = list(runs) if ordered else sorted(runs, key=os.path.getsize)
+    # a group of 1 merges nothing, the count is already reachable with full groups.
+    first = (len(candidates) - max_fan_in) % (max_fan_in - 1) + 1
+    groups = [candidates[:first]] if first > 1 else []
+    start = first if first > 1 else 0
+    # every full group takes max_fan_in - 1 runs off the count, more than fit into this pass wait for the next.
+    full = min((len(candidates) - max_fan_in - (first - 1)) // (max_fan_in - 1),
+               (len(candidates) - start) // max_fan_in)
+    for _ in range(full):
+        groups.append(candidates[start:start + max_fan_in])
+        start += max_fan_in
+    return groups, candidates[start:]
+
+
+def merge_files(files, output_file, engine='heap', block_size=1 << 20, max_fan_in=None, workers=1,
+                temp_dir=None, reader='read', prefetch=0, key=None, shard_size=0, index_every=1024) -> None:
+    '''
+    Merge files into output_file, hierarchically once there are more files than max_fan_in:
+    groups get merged into temporary runs (in parallel with workers > 1), pass after pass,
+    until one final merge of at most max_fan_in runs & files (range-partitioned with workers > 1).
+
+    :param files: list of sorted input file paths.
+    :param output_file: full output path to write merged output to.
+    :param engine: str, MERGE_ENGINES name.
+    :param block_size: int, bytes read from each input at once.
+    :param max_fan_in: int, max files open & merged at once, None for no limit.
+    :param workers: int, processes merging groups of a pass or key ranges of the final merge at once.
+    :param temp_dir: str, directory for intermediate runs & parts (default: output file directory).
+    :param reader: str, READERS name, how inputs are read.
+    :param prefetch: int, line blocks read ahead per input by a thread, 0 for none.
+    :param key: LineKey, merge by key of lines, None for whole lines.
+    :param shard_size: int, bytes per output shard (write_shards), 0 for a single output file.
+    :param index_every: int, lines per shard index entry.
+    '''
+    if max_fan_in is None or len(files) <= max_fan_in:
+        merge_output(files, output_file, engine=engine, block_size=block_size, workers=workers, temp_dir=temp_dir,
+                     reader=reader, prefetch=prefetch, key=key, shard_size=shard_size, index_every=index_every)
+        return
+
+    with tempfile.TemporaryDirectory(dir=temp_dir or os.path.dirname(output_file)) as run_dir:
+        runs, temporary, pass_count = list(files), set(), 0
+        try:
+            with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+                while len(runs) > max_fan_in:
+                    pass_count += 1
+                    groups, kept = plan_pass(runs, max_fan_in, ordered=key is not None)
+                    run_files = [os.path.join(run_dir, f'run-{pass_count}-{index}') for index in range(len(groups))]
+                    print(f'Pass {pass_count}: merging {sum(len(group) for group in groups)} files '
+                          f'into {len(groups)} runs')
+                    arguments = (groups, run_files, [engine] * len(groups), [block_size] * len(groups),
+                                 [reader] * len(groups), [prefetch] * len(groups), [key] * len(groups))
+                    merged = list(executor.map(merge_group, *arguments) if executor else map(merge_group, *arguments))
+
+                    # runs of earlier passes are merged into new ones by now.
+                    for group in groups:
+                        for run in group:
+                            if run in temporary:
+                                os.remove(run)
+                    temporary.update(merged)
+                    runs = merged + kept
+        except Exception as e:
+            # no partial output when an intermediate pass failed.
+            print(e)
+            print(f'Failed {output_file}')
+            return
+
+        merge_output(runs, output_file, engine=engine, block_size=block_size, workers=workers, temp_dir=temp_dir,
+                     reader=reader, prefetch=prefetch, key=key, shard_size=shard_size, index_every=index_every)
+
+
+def range_offsets(file, low=None, high=None) -> tuple:
+    '''
+    :param file: sorted, uncompressed input file path.
+    :param low: bytes, lowest line wanted, None for the file start.
+    :param high: bytes, highest line wanted, None for the file end.
+    :return: (start, end) byte offsets of the lines low <= line <= high.
+    '''
+    size = os.path.getsize(file)
+    with open(file, 'rb') as fh:
+        start = 0 if low is None else seek_key(fh, low, size)
+        end = size if high is None else seek_key(fh, high, size, after=True)
+    return start, max(start, end)
+
+
+def extract(files, output_file, low=None, high=None, engine='heap', block_size=1 << 20, reader='read',
+            prefetch=0) -> None:
+    '''
+    Range extraction: every input gets binary searched to its first line >= low & its last line <= high,
+    and only those byte ranges are merged into output_file. Inputs without lines in the range aren't opened
+    for the merge at all. Costs O(N log size) seeks plus the output, instead of reading all inputs.
+
+    :param files: list of sorted, uncompressed input file paths.
+    :param output_file: full output path to write merged output to.
+    :param low: bytes, lowest line wanted, None for no lower bound.
+    :param high: bytes, highest line wanted, None for no upper bound.
+    :param engine: str, MERGE_ENGINES name.
+    :param block_size: int, bytes read from each input at once.
+    :param reader: str, READERS name, how inputs are read.
+    :param prefetch: int, line blocks read ahead per input by a thread, 0 for none.
+    '''
+    for file in files:
+        if compressed(file) is not None:
+            raise ValueError('Invalid compressed input {} for range extraction'.format(file))
+
+    ranges = {file: range_offsets(file, low=low, high=high) for file in files}
+    files = [file for file in files if ranges[file][0] < ranges[file][1]]
+    print(f'Extracting {sum(end - start for start, end in ranges.values())} bytes of {len(files)} files')
+    write(output_file, make_iterator(files, engine=engine, block_size=block_size,
+                                     ranges=[ranges[file] for file in files], reader=reader, prefetch=prefetch))
+
+
+def sample_splitters(files, partitions, samples=64) -> list:
+    '''
+    Sample lines at evenly spaced offsets of every file, about samples per partition in total spread by file size,
+    and pick the quantiles splitting them into partitions key ranges.
+
+    :param files: list of sorted input file paths.
+    :param partitions: int, number of key ranges wanted.
+    :param samples: int, sampled lines per partition.
+    :return: sorted list of distinct splitter lines (bytes), at most partitions - 1.
+    '''
+    sizes = [os.path.getsize(file) for file in files]
+    total = sum(sizes) or 1
+    keys = []
+    for file, size in zip(files, sizes):
+        count = 1 + samples * partitions * size // total
+        with open(file, 'rb') as fh:
+            for index in range(count):
+                line = first_line(fh, size * index // count)
+                if line is not None:
+                    keys.append(line)
+    keys.sort()
+    return sorted({keys[len(keys) * part // partitions] for part in range(1, partitions)}) if keys else []
+
+
+def merge_range(files, ranges, part_file, engine='heap', block_size=1 << 20, reader='read', prefetch=0) -> tuple:
+    '''
+    Merge one key range of every file into a part file, de-duplicated like the final output.
+    Raises if any file is not sorted within the range.
+
+    :param files: list of sorted input file paths.
+    :param ranges: list of (start, end) byte offsets per file.
+    :param part_file: path of the part to write.
+    :param engine: str, MERGE_ENGINES name.
+    :param block_size: int, bytes read from each input at once.
+    :param reader: str, READERS name.
+    :param prefetch: int, line blocks read ahead per input by a thread, 0 for none.
+    :return: list of first & list of last line read from each file in the range (b'' for none).
+    '''
+    firsts = []
+    for file, (start, end) in zip(files, ranges):
+        lines = read_lines(file, block_size=4096, start=start, end=end)
+        firsts.append(next(lines, b''))
+        lines.close()
+
+    merge_iterator = make_iterator(files, engine=engine, block_size=block_size, ranges=ranges, reader=reader,
+                                           prefetch=prefetch)
+    try:
+        with open_output(part_file) as of:
+            copy_lines(of, merge_iterator)
+    except StopIteration:
+        pass
+    finally:
+        merge_iterator.close()
+    return firsts, [merge_iterator.last_read[i] for i in range(len(files))]
+
+
+def merge_ranges(files, output_file, engine='heap', block_size=1 << 20, workers=2, temp_dir=None,
+                 reader='read', prefetch=0) -> None:
+    '''
+    Range-partitioned parallel merge: splitter lines sampled from all inputs cut the key space in workers ranges,
+    every file gets bisected to the byte offset of each splitter, and each range is merged by its own process
+    into a part file. Parts are concatenated in order into output_file.
+    Lines equal to a splitter all land in the range above it, so no duplicate crosses a part boundary.
+    Unsorted input (inside a range or across a boundary) falls back to the sequential write, which reports it
+    & keeps what it merged before, exactly as without workers.
+
+    :param files: list of sorted input file paths.
+    :param output_file: full output path to write merged output to.
+    :param engine: str, MERGE_ENGINES name.
+    :param block_size: int, bytes read from each input at once.
+    :param workers: int, processes (& key ranges).
+    :param temp_dir: str, directory for part files (default: output file directory).
+    :param reader: str, READERS name.
+    :param prefetch: int, line blocks read ahead per input by a thread, 0 for none.
+    '''
+    splitters = sample_splitters(files, workers)
+    offsets = []
+    for file in files:
+        size = os.path.getsize(file)
+        with open(file, 'rb') as fh:
+            offsets.append([0] + [seek_key(fh, key, size) for key in splitters] + [size])
+    partitions = len(splitters) + 1
+    ranges = [[(offset[part], offset[part + 1]) for offset in offsets] for part in range(partitions)]
+
+    with tempfile.TemporaryDirectory(dir=temp_dir or os.path.dirname(output_file)) as part_dir:
+        # parts get compressed like the output by their workers, compressed streams concatenate.
+        part_files = [os.path.join(part_dir, f'part-{part}' + os.path.splitext(output_file)[1])
+                      for part in range(partitions)]
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parts = list(executor.map(merge_range, [files] * partitions, ranges, part_files,
+                                          [engine] * partitions, [block_size] * partitions, [reader] * partitions,
+                                          [prefetch] * partitions))
+            # last line of a file in one range against its first line in the next non empty one.
+            last_read = [b''] * len(files)
+            for firsts, lasts in parts:
+                for i, (first, last) in enumerate(zip(firsts, lasts)):
+                    if first and last_read[i] > first:
+                        raise ValueError(f'Input File not sorted! index:{i}')
+                    last_read[i] = last or last_read[i]
+        except ValueError:
+            print('Unsorted input found, merging sequentially')
+            write(output_file, make_iterator(files, engine=engine, block_size=block_size, reader=reader,
+                                             prefetch=prefetch))
+            return
+
+        with open(output_file, 'wb') as of:
+            for part_file in part_files:
+                with open(part_file, 'rb') as pf:
+                    shutil.copyfileobj(pf, of, 1 << 20)
+                os.remove(part_file)
 
     print(f'Generated {output_file}')
 
 
+def merge_output(files, output_file, engine='heap', block_size=1 << 20, workers=1, temp_dir=None,
+                 reader='read', prefetch=0, key=None, shard_size=0, index_every=1024) -> None:
+    '''
+    Single merge of files into output_file, range-partitioned across processes with workers > 1,
+    into shards with a sparse index with shard_size.
+    '''
+    if shard_size:
+        write_shards(output_file, make_iterator(files, engine=engine, key=key, block_size=block_size, reader=reader,
+                                                prefetch=prefetch), shard_size=shard_size, index_every=index_every)
+    # compressed inputs & runs can't be bisected by byte offset, ranges split whole lines not keys.
+    elif workers > 1 and key is None and all(compressed(file) is None for file in files):
+        merge_ranges(files, output_file, engine=engine, block_size=block_size, workers=workers, temp_dir=temp_dir,
+                     reader=reader, prefetch=prefetch)
+    else:
+        write(output_file, make_iterator(files, engine=engine, key=key, block_size=block_size, reader=reader,
+                                         prefetch=prefetch))
+
+
+def sort_lines(lines, run_file, compress=False, key=None) -> str:
+    '''
+    Sort (& de-duplicate) lines into a sorted run.
+
+    :param lines: iterable of stripped lines (bytes), in input order.
+    :param run_file: path of the run to write.
+    :param compress: bool, gzip the run (fast level).
+    :param key: LineKey, sort by key of lines (one line kept per key), None for whole lines.
+    :return: run file path.
+    '''
+    # exact duplicates dropped in input order, so the first line per key stays the first one read.
+    lines = list(dict.fromkeys(lines))
+    if key is None:
+        lines.sort()
+    else:
+        # keys parsed once, stable sort keeps input order among equal keys.
+        keys = [key(line) for line in lines]
+        order = sorted(range(len(lines)), key=keys.__getitem__)
+        lines = [lines[index] for position, index in enumerate(order)
+                 if position == 0 or keys[order[position - 1]] != keys[index]]
+    with gzip.open(run_file, 'wb', compresslevel=1) if compress else open(run_file, 'wb') as of:
+        write_batch(of, lines)
+    return run_file
+
+
+def sort_chunk(file, start, end, run_file, compress=False, key=None) -> str:
+    '''
+    Sort (& de-duplicate) the lines of a byte range of file into a sorted run.
+
+    :param file: input file path.
+    :param start: int, byte offset of the range, a line start.
+    :param end: int, byte offset of the range end, a line start.
+    :param run_file: path of the run to write.
+    :param compress: bool, gzip the run (fast level).
+    :param key: LineKey, sort by key of lines (one line kept per key), None for whole lines.
+    :return: run file path.
+    '''
+    return sort_lines(read_lines(file, start=start, end=end), run_file, compress=compress, key=key)
+
+
+def stream_chunks(file, chunk_size):
+    '''
+    Cut the decompressed stream of a compressed file into line chunks, read sequentially.
+
+    :param file: compressed input file path.
+    :param chunk_size: int, max bytes of lines per chunk (a single longer line makes its own chunk).
+    :return: generator of lists of stripped lines (bytes), in input order.
+    '''
+    chunk, size = [], 0
+    for line in read_lines(file):
+        if chunk and size + len(line) + 1 > chunk_size:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+    if chunk:
+        yield chunk
+
+
+def plan_chunks(files, chunk_size) -> list:
+    '''
+    :param files: list of input file paths.
+    :param chunk_size: int, bytes per chunk.
+    :return: list of (file, start, end) byte ranges of about chunk_size, cut at line starts.
+             Compressed files can't be cut by byte offset & make one chunk each (end None), see stream_chunks.
+    '''
+    chunks = []
+    for file in files:
+        if compressed(file) is not None:
+            chunks.append((file, 0, None))
+            continue
+        size = os.path.getsize(file)
+        with open(file, 'rb') as fh:
+            offsets = sorted({line_start(fh, offset) for offset in range(0, size, chunk_size)} | {size})
+        chunks += [(file, start, end) for start, end in zip(offsets, offsets[1:])]
+    return chunks
+
+
+def sort_runs(files, run_dir, memory=256 << 20, workers=1, compress=False, key=None) -> list:
+    '''
+    External sort, first phase: cut unsorted inputs into chunks fitting the memory budget & sort each into a run,
+    chunks of different workers at once. Runs are sorted like the merge expects (stripped lines as bytes).
+    Compressed inputs are decompressed sequentially & cut into chunks on the fly, at most workers of them
+    in flight at once.
+
+    :param files: list of input file paths, in any order.
+    :param run_dir: directory to write runs into.
+    :param memory: int, approximate memory budget in bytes shared by all workers.
+    :param workers: int, processes sorting chunks at once.
+    :param compress: bool, gzip the runs.
+    :param key: LineKey, sort by key of lines, None for whole lines.
+    :return: list of run file paths, in input order.
+    '''
+    # lines held as a list & a dict of bytes take about 4 times the raw chunk size.
+    chunk_size = max(1 << 12, memory // workers // 4)
+    print(f'Sorting chunks of up to {chunk_size} bytes into runs')
+
+    runs = []
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+
+        def submit(function, *arguments):
+            run_file = os.path.join(run_dir, f'sorted-{len(runs)}' + ('.gz' if compress else ''))
+            arguments += (run_file, compress, key)
+            runs.append(executor.submit(function, *arguments) if executor else function(*arguments))
+
+        for file in files:
+            if compressed(file) is None:
+                for _, start, end in plan_chunks([file], chunk_size):
+                    submit(sort_chunk, file, start, end)
+                continue
+            for lines in stream_chunks(file, chunk_size):
+                # decompressed chunks wait in memory until sorted, keep at most workers of them pending.
+                pending = [run for run in runs if isinstance(run, Future) and not run.done()]
+                if len(pending) >= workers:
+                    wait(pending, return_when=FIRST_COMPLETED)
+                submit(sort_lines, lines)
+
+        runs = [run.result() if isinstance(run, Future) else run for run in runs]
+    print(f'Sorted {len(runs)} runs')
+    return runs
+
+
+def validate_chunk(file, start, end, key=None, block_size=1 << 20) -> tuple:
+    '''
+    Check sortedness of a byte range of file. Blocks already in order are confirmed with one sorted() pass,
+    only blocks out of order get walked line by line.
+
+    :param file: input file path.
+    :param start: int, byte offset of the range, a line start.
+    :param end: int, byte offset of the range end, a line start (None for file end).
+    :param key: LineKey, check order of line keys, None for whole lines.
+    :param block_size: int, bytes read at once.
+    :return: number of lines in the range,
+             list of (line number, previous line, line) out of order (line numbers 1 based within the range),
+             (line number, line) of first & of last non empty line, None for none.
+    '''
+    count, violations, first, last = 0, [], None, None
+    last_value = None
+    with open_input(file) as fh:
+        fh.seek(start)
+        remaining = float('inf') if end is None else end - start
+        tail = b''
+        while True:
+            block = fh.read(min(block_size, remaining)) if remaining > 0 else b''
+            remaining -= len(block)
+            text = tail + block
+            lines = text.split(b'\n') if text else []
+            if block:
+                # last piece may be cut mid line, carry it over to next block.
+                tail = lines.pop()
+
+            # lines need stripping only if the block holds whitespace besides line endings.
+            stripped = [line.strip() for line in lines] if any(space in text for space in b' \t\r\x0b\x0c') else lines
+            non_empty = list(filter(None, stripped))
+            if non_empty:
+                values = non_empty if key is None else [key(line) for line in non_empty]
+                if values != sorted(values) or (last_value is not None and last_value > values[0]):
+                    previous = last[1] if last is not None else None
+                    for index, line in enumerate(stripped):
+                        if not line:
+                            continue
+                        value = line if key is None else key(line)
+                        if last_value is not None and last_value > value:
+                            violations.append((count + index + 1, previous, line))
+                        previous, last_value = line, value
+                if first is None:
+                    first = (count + stripped.index(non_empty[0]) + 1, non_empty[0])
+                last = (count + len(stripped) - stripped[::-1].index(non_empty[-1]), non_empty[-1])
+                last_value = values[-1]
+            count += len(lines)
+            if not block:
+                return count, violations, first, last
+
+
+def validate(files, key=None, workers=1, chunk_size=64 << 20) -> dict:
+    '''
+    Check sortedness of every input before merging: files are cut into chunks checked by workers processes at once,
+    the last line of each chunk is checked against the first line of the next one.
+
+    :param files: list of input file paths.
+    :param key: LineKey, check order of line keys, None for whole lines.
+    :param workers: int, processes checking chunks at once.
+    :param chunk_size: int, bytes per chunk (compressed files make one chunk).
+    :return: dict, file path -> list of (line number, previous line, line) out of order, for unsorted files only.
+    '''
+    chunks = plan_chunks(files, chunk_size)
+    arguments = ([file for file, _, _ in chunks], [start for _, start, _ in chunks], [end for _, _, end in chunks],
+                 [key] * len(chunks))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(validate_chunk, *arguments))
+    else:
+        results = list(map(validate_chunk, *arguments))
+
+    problems = {}
+    # lines & last non empty line of the chunks of each file so far.
+    counts, lasts = {}, {}
+    for (file, _, _), (count, violations, first, last) in zip(chunks, results):
+        base = counts.get(file, 0)
+        previous = lasts.get(file)
+        if first is not None and previous is not None and (
+                (previous if key is None else key(previous)) > (first[1] if key is None else key(first[1]))):
+            problems.setdefault(file, []).append((base + first[0], previous, first[1]))
+        for number, previous_line, line in violations:
+            problems.setdefault(file, []).append((base + number, previous_line, line))
+        if last is not None:
+            lasts[file] = last[1]
+        counts[file] = base + count
+    return problems
+
+
+def default_fan_in() -> int:
+    '''
+    :return: int, max files merged at once, open file limit minus some room for output, runs & std streams.
+    '''
+    if resource is None:
+        return 500
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    return 500 if soft == resource.RLIM_INFINITY else max(2, soft - 32)
+
+
 def get_files(input_dir) -> list:
     '''
     Basic input file list gatherer.
@@ -113,13 +1185,49 @@ def get_files(input_dir) -> list:
 def prompt():
     '''
     Prompt to take input files dir & output file path(both required).
-    :return: input dir path, output file path
+    :return: input dir path, output file path, read block size, merge engine name, max fan-in, worker count,
+             temp dir, sort flag, sort memory budget in bytes, run compression flag, reader name, prefetch depth,
+             LineKey (None without -k), lower & upper line bound (bytes, None without --from/--to), validate flag,
+             shard size in bytes (0 for one output file), lines per shard index entry
     '''
 
     parser = argparse.ArgumentParser(description='Merge Sort Program')
     required_arguments = parser.add_argument_group('required arguments')
     required_arguments.add_argument('-i', '--input_dir', help='Input file directory')
-    required_arguments.add_argument('-o', '--output_file', help='Full path to output file')
+    required_arguments.add_argument('-o', '--output_file', help='Full path to output file, .gz/.bz2/.xz get compressed')
+    parser.add_argument('-b', '--block_size', type=int, default=1 << 20,
+                        help='Bytes read from each input at once (default: 1MiB)')
+    parser.add_argument('-m', '--merge', choices=sorted(MERGE_ENGINES), default='heap',
+                        help='Merge core, loser tree suits thousands of inputs (default: heap)')
+    parser.add_argument('-r', '--reader', choices=sorted(READERS), default='read',
+                        help='Input reader, mmap maps inputs instead of reading them (default: read)')
+    parser.add_argument('-p', '--prefetch', type=int, default=0,
+                        help='Blocks of lines read ahead per input by a background thread, 0 for none '
+                             '(default: 0, compressed inputs: 2)')
+    parser.add_argument('-f', '--max_fan_in', type=int, default=default_fan_in(),
+                        help='Max files merged at once, more inputs get merged in passes of intermediate runs, '
+                             'an unsorted input found in an intermediate pass leaves no partial output '
+                             '(default: open file limit - 32)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Processes merging intermediate runs or key ranges at once (default: 1)')
+    parser.add_argument('--temp_dir', help='Directory for intermediate runs & parts (default: output file directory)')
+    parser.add_argument('-s', '--sort', action='store_true',
+                        help='Inputs are not sorted: sort them into runs first (external sort)')
+    parser.add_argument('--memory', type=int, default=256, help='Memory budget of --sort in MB (default: 256)')
+    parser.add_argument('--compress_runs', action='store_true', help='Gzip the sorted runs of --sort')
+    parser.add_argument('-k', '--key', help='Merge by key columns (1 based, e.g. 2 or 3,1) instead of whole lines')
+    parser.add_argument('-t', '--delimiter', default=',', help='Column delimiter of -k, \\t for TSV (default: ,)')
+    parser.add_argument('-n', '--numeric', action='store_true', help='Compare -k columns as numbers')
+    parser.add_argument('--descending', action='store_true', help='Inputs are sorted by -k in descending order')
+    parser.add_argument('--from', dest='low', help='Extract lines >= this line only (binary search, no full read)')
+    parser.add_argument('--to', dest='high', help='Extract lines <= this line only (binary search, no full read)')
+    parser.add_argument('--validate', action='store_true',
+                        help='Check every input is sorted (with -w workers) before writing anything')
+    parser.add_argument('--shard_size', type=int, default=0,
+                        help='Roll output into shards of about this many MB with a sparse index, 0 for one file '
+                             '(default: 0)')
+    parser.add_argument('--index_every', type=int, default=1024,
+                        help='Lines per shard index entry, bounds a lookup read (default: 1024)')
     args = parser.parse_args(args=None if sys.argv[1:] else ['-h'])
     input_dir, output_file = args.input_dir, args.output_file
 
@@ -128,17 +1236,75 @@ def prompt():
         raise ValueError('Invalid input dir {}'.format(input_dir))
     if not os.path.exists(os.path.dirname(output_file)):
         raise ValueError('Invalid output dir {}'.format(os.path.dirname(output_file)))
+    if args.block_size < 1:
+        raise ValueError('Invalid block size {}'.format(args.block_size))
+    if args.max_fan_in < 2 or args.workers < 1:
+        raise ValueError('Invalid max fan-in {} or workers {}'.format(args.max_fan_in, args.workers))
+    if args.temp_dir is not None and not os.path.isdir(args.temp_dir):
+        raise ValueError('Invalid temp dir {}'.format(args.temp_dir))
+    key = None
+    if args.key is not None:
+        try:
+            columns = [int(column) - 1 for column in args.key.split(',')]
+        except ValueError:
+            raise ValueError('Invalid key columns {}'.format(args.key))
+        if not columns or min(columns) < 0:
+            raise ValueError('Invalid key columns {}'.format(args.key))
+        delimiter = '\t' if args.delimiter == '\\t' else args.delimiter
+        key = LineKey(columns, delimiter=delimiter.encode(), numeric=args.numeric, descending=args.descending)
+    low = None if args.low is None else args.low.strip().encode()
+    high = None if args.high is None else args.high.strip().encode()
+    if low is not None or high is not None:
+        if key is not None or args.sort or args.shard_size:
+            raise ValueError('Invalid range extraction with -k, -s or --shard_size')
+        if low is not None and high is not None and low > high:
+            raise ValueError('Invalid range {} to {}'.format(args.low, args.high))
+    if args.shard_size < 0 or args.index_every < 1:
+        raise ValueError('Invalid shard size {} or index every {}'.format(args.shard_size, args.index_every))
+    if args.shard_size and os.path.splitext(output_file)[1] in SUFFIXES:
+        raise ValueError('Invalid compressed output {} for shards'.format(output_file))
+    if args.validate and args.sort:
+        raise ValueError('Invalid --validate with -s')
+    if args.prefetch < 0:
+        raise ValueError('Invalid prefetch depth {}'.format(args.prefetch))
+    if args.memory < 1:
+        raise ValueError('Invalid memory budget {}'.format(args.memory))
 
-    return input_dir, output_file
+    return (input_dir, output_file, args.block_size, args.merge, args.max_fan_in, args.workers, args.temp_dir,
+            args.sort, args.memory << 20, args.compress_runs, args.reader, args.prefetch, key, low, high,
+            args.validate, args.shard_size << 20, args.index_every)
 
 
 if __name__ == '__main__':
-    input_dir, output_file = prompt()
+    (input_dir, output_file, block_size, merge, max_fan_in, workers, temp_dir,
+     sort, memory, compress_runs, reader, prefetch, key, low, high, check, shard_size, index_every) = prompt()
     print(f'Read input_dir {input_dir}, output_file {output_file}')
     # Gather files.
     files = get_files(input_dir)
     print(f'Processing {files}')
-    # make Merge Iterator.
-    mi = MergeIterator(files)
-    # write merged file.
-    write(output_file, mi)
+    if check:
+        # report every unsorted input before any output.
+        problems = validate(files, key=key, workers=workers)
+        for file, violations in problems.items():
+            print(f'Input File not sorted! {file}: {len(violations)} lines out of order')
+            for number, previous, line in violations[:10]:
+                print(f'  line {number}: [{previous.decode()}] followed by [{line.decode()}]')
+        if problems:
+            sys.exit(f'{len(problems)} unsorted input files, no output written')
+        print(f'Validated {len(files)} input files')
+    if low is not None or high is not None:
+        # merge only the lines between the bounds.
+        extract(files, output_file, low=low, high=high, engine=merge, block_size=block_size, reader=reader,
+                prefetch=prefetch)
+    elif sort:
+        # sort unsorted inputs into runs, then merge the runs.
+        with tempfile.TemporaryDirectory(dir=temp_dir or os.path.dirname(output_file)) as run_dir:
+            runs = sort_runs(files, run_dir, memory=memory, workers=workers, compress=compress_runs, key=key)
+            merge_files(runs, output_file, engine=merge, block_size=block_size, max_fan_in=max_fan_in,
+                        workers=workers, temp_dir=temp_dir, reader=reader, prefetch=prefetch, key=key,
+                        shard_size=shard_size, index_every=index_every)
+    else:
+        # merge, in passes when inputs exceed max fan-in, & write merged file.
+        merge_files(files, output_file, engine=merge, block_size=block_size, max_fan_in=max_fan_in,
+                    workers=workers, temp_dir=temp_dir, reader=reader, prefetch=prefetch, key=key,
+                    shard_size=shard_size, index_every=index_every)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import sys
+
+from merge import MergeIterator, merge_group, write
+
+
+class SegmentStore:
+    '''
+    SegmentStore class.
+
+    LSM-style incremental merge: the merged master file is kept as leveled, sorted & de-duplicated segment files
+    plus a manifest, so new delta files don't rewrite the whole history:
+        - level i holds at most one segment, allowed to grow up to base_size * ratio^i bytes.
+        - new sorted delta files get merged into level 0 only.
+        - compaction: a level past its size limit is merged into the next level, cascading upwards,
+          so each line is rewritten about once per level instead of once per delta.
+        - the manifest is replaced atomically once new segments are written, replaced segments are removed after,
+          segment files missing from the manifest (left by an interrupted run) are removed on load.
+    Lines are whole stripped lines like merge.py, the logical stream is the merged, de-duplicated union of levels.
+    '''
+
+    VERSION = 1
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, store_dir, base_size=64 << 20, ratio=10, levels=None, next_id=0):
+        '''
+        :param store_dir: str, directory of segments & manifest.
+        :param base_size: int, size limit of level 0 in bytes.
+        :param ratio: int, size ratio between a level & the one below it.
+        :param levels: list, segment file name per level (None for empty levels).
+        :param next_id: int, id of the next segment file.
+        '''
+        self.store_dir = store_dir
+        self.base_size = base_size
+        self.ratio = ratio
+        self.levels = levels if levels is not None else []
+        self.next_id = next_id
+
+    def path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def segments(self) -> list:
+        ''' :return: list of segment file paths, level 0 first. '''
+        return [self.path(name) for name in self.levels if name is not None]
+
+    def limit(self, level) -> int:
+        ''' :return: int, size limit of level in bytes. '''
+        return self.base_size * self.ratio ** level
+
+    def merge_into(self, files, level) -> str:
+        '''
+        Merge files with the segment of level into a new segment (not yet in the manifest).
+
+        :param files: list of sorted file paths.
+        :param level: int, level whose segment joins the merge.
+        :return: str, new segment file name.
+        '''
+        if level < len(self.levels) and self.levels[level] is not None:
+            files = files + [self.path(self.levels[level])]
+        name = f'segment-{self.next_id:06d}.txt'
+        self.next_id += 1
+        try:
+            merge_group(files, self.path(name))
+        except Exception:
+            # e.g. unsorted delta, store stays as it was.
+            if os.path.exists(self.path(name)):
+                os.remove(self.path(name))
+            raise
+        return name
+
+    def replace(self, changes):
+        '''
+        Point levels to new segments, save manifest & remove replaced segments.
+
+        :param changes: dict, level -> new segment file name (None to empty the level).
+        '''
+        replaced = []
+        for level, name in changes.items():
+            while len(self.levels) <= level:
+                self.levels.append(None)
+            replaced.append(self.levels[level])
+            self.levels[level] = name
+        self.save()
+        for name in replaced:
+            if name is not None:
+                os.remove(self.path(name))
+
+    def add(self, deltas):
+        '''
+        Merge sorted delta files into level 0, then compact.
+
+        :param deltas: list of sorted delta file paths, left untouched.
+        '''
+        self.replace({0: self.merge_into(list(deltas), 0)})
+        self.compact()
+
+    def compact(self):
+        ''' merge every level past its size limit into the next one, lowest level first. '''
+        level = 0
+        # levels grow while compacting the top one.
+        while level < len(self.levels):
+            name = self.levels[level]
+            if name is not None and os.path.getsize(self.path(name)) > self.limit(level):
+                print(f'Compacting level {level} into level {level + 1}')
+                self.replace({level + 1: self.merge_into([self.path(name)], level + 1), level: None})
+            level += 1
+
+    def merge_iterator(self):
+        ''' :return: MergeIterator over all segments. '''
+        return MergeIterator(self.segments())
+
+    def lines(self):
+        '''
+        Reader API: the logical merged stream.
+
+        :return: generator of sorted, de-duplicated lines (bytes) across all levels.
+        '''
+        merge_iterator = self.merge_iterator()
+        last = None
+        try:
+            while True:
+                line = merge_iterator.next_bytes()
+                if line != last:
+                    last = line
+                    yield line
+        except StopIteration:
+            return
+        finally:
+            merge_iterator.close()
+
+    def write(self, output_file):
+        '''
+        :param output_file: full output path to write the logical merged stream to.
+        '''
+        write(output_file, self.merge_iterator())
+
+    def save(self):
+        ''' write manifest, replaced atomically. '''
+        file = self.path(self.MANIFEST)
+        with open(file + '.tmp', mode='w') as fh:
+            json.dump({'version': self.VERSION, 'base_size': self.base_size, 'ratio': self.ratio,
+                       'next_id': self.next_id, 'levels': self.levels}, fh, indent=1)
+        os.replace(file + '.tmp', file)
+
+    @staticmethod
+    def load(store_dir, base_size=64 << 20, ratio=10):
+        '''
+        Load SegmentStore from store_dir, a new empty one if it has no manifest yet.
+
+        :param store_dir: str, directory of segments & manifest, created if missing.
+        :param base_size: int, size limit of level 0 of a new store.
+        :param ratio: int, size ratio between levels of a new store.
+        :return: SegmentStore
+        '''
+        os.makedirs(store_dir, exist_ok=True)
+        file = os.path.join(store_dir, SegmentStore.MANIFEST)
+        if not os.path.exists(file):
+            return SegmentStore(store_dir, base_size=base_size, ratio=ratio)
+
+        with open(file, mode='r') as fh:
+            data = json.load(fh)
+        if data.get('version') != SegmentStore.VERSION:
+            raise ValueError('Invalid manifest version {} in {}'.format(data.get('version'), file))
+        store = SegmentStore(store_dir, base_size=data['base_size'], ratio=data['ratio'], levels=data['levels'],
+                             next_id=data['next_id'])
+
+        # segments an interrupted run wrote but never got into the manifest.
+        for name in os.listdir(store_dir):
+            if name.startswith('segment-') and name not in store.levels:
+                os.remove(store.path(name))
+        return store
+
+
+def prompt():
+    '''
+    Prompt to take store dir & what to do with it.
+    :return: store dir path, delta file paths, output file path, size limit of level 0 in bytes, level size ratio.
+    '''
+    parser = argparse.ArgumentParser(description='Leveled Segment Store')
+    required_arguments = parser.add_argument_group('required arguments')
+    required_arguments.add_argument('-d', '--store_dir', help='Segment store directory')
+    parser.add_argument('-a', '--add', nargs='+', default=[], help='Sorted delta files to merge into the store')
+    parser.add_argument('-o', '--output_file', help='Full path to write the merged store to')
+    parser.add_argument('--base_size', type=int, default=64, help='Size limit of level 0 in MB (default: 64)')
+    parser.add_argument('--ratio', type=int, default=10, help='Size ratio between levels (default: 10)')
+    args = parser.parse_args(args=None if sys.argv[1:] else ['-h'])
+
+    # minor input validation.
+    if args.store_dir is None:
+        raise ValueError('Missing store dir')
+    for file in args.add:
+        if not os.path.isfile(file):
+            raise ValueError('Invalid delta file {}'.format(file))
+    if args.output_file is not None and not os.path.exists(os.path.dirname(args.output_file)):
+        raise ValueError('Invalid output dir {}'.format(os.path.dirname(args.output_file)))
+    if args.base_size < 1 or args.ratio < 2:
+        raise ValueError('Invalid base size {} or ratio {}'.format(args.base_size, args.ratio))
+
+    return args.store_dir, args.add, args.output_file, args.base_size << 20, args.ratio
+
+
+if __name__ == '__main__':
+
+    store_dir, deltas, output_file, base_size, ratio = prompt()
+    store = SegmentStore.load(store_dir, base_size=base_size, ratio=ratio)
+    if deltas:
+        store.add(deltas)
+    for level, name in enumerate(store.levels):
+        if name is not None:
+            print(f'Level {level}: {name} {os.path.getsize(store.path(name))} bytes')
+    if output_file is not None:
+        store.write(output_file)
@@ -0,0 +1,541 @@
+'''
+Test module for merge.
+Checks merged output equals sorted, de-duplicated lines of every input.
+'''
+
+import bz2
+import gzip
+import lzma
+import os
+import random
+import threading
+
+import pytest
+
+import merge
+from lookup import ShardIndex
+from segments import SegmentStore
+
+from merge import (MERGE_ENGINES, READERS, KeyMergeIterator, LineKey, MergeIterator, extract, map_lines,
+                   open_input, read_ahead, merge_files, merge_ranges, plan_pass, read_lines, seek_key,
+                   sort_runs, validate, write, write_shards)
+
+
+def write_inputs(path, seed, file_count=5, line_count=2000):
+    '''
+    write sorted input files with blank lines, padding & cross file duplicates into path.
+
+    :return: list of input file paths, expected merged lines.
+    '''
+    rng = random.Random(seed)
+    files, lines = [], []
+    for index in range(file_count):
+        file_lines = sorted(''.join(rng.choice('abcde') for _ in range(rng.randint(1, 6)))
+                            for _ in range(rng.randint(0, line_count)))
+        file = os.path.join(path, f'input_{index}.txt')
+        with open(file, 'w') as fh:
+            for line in file_lines:
+                fh.write(rng.choice(['', ' ', '\t']) + line + rng.choice(['\n', '\r\n', '\n\n', ' \n']))
+        files.append(file)
+        lines += file_lines
+    return files, sorted(set(lines))
+
+
+def read(path):
+    with open(path, 'r') as fh:
+        return fh.read().splitlines()
+
+
+@pytest.mark.parametrize('engine', sorted(MERGE_ENGINES))
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('block_size', [1, 7, 1 << 20])
+@pytest.mark.parametrize('reader', sorted(READERS))
+def test_merge_matches_sorted_unique_lines(tmp_path, engine, seed, block_size, reader):
+    files, expected = write_inputs(str(tmp_path), seed)
+    write(str(tmp_path / 'out.txt'), MERGE_ENGINES[engine](files, block_size=block_size, reader=reader),
+          batch_size=100)
+    assert read(tmp_path / 'out.txt') == expected
+
+
+@pytest.mark.parametrize('reader', sorted(READERS))
+def test_read_lines_strips_and_skips_blank_lines(tmp_path, reader):
+    file = tmp_path / 'in.txt'
+    file.write_bytes(b'\n  a \r\n\n\t\nb\nc')
+    assert list(READERS[reader](str(file), block_size=2)) == [b'a', b'b', b'c']
+    (tmp_path / 'empty.txt').write_bytes(b'')
+    assert list(READERS[reader](str(tmp_path / 'empty.txt'))) == []
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 10, 1 << 20])
+def test_map_lines_matches_read_lines_in_ranges(tmp_path, block_size):
+    file = tmp_path / 'in.txt'
+    file.write_bytes(b'a\n' + b'x' * 50 + b'\n\n b\r\nc\n' + b'y' * 20)
+    for start, end in [(0, None), (0, 2), (2, 53), (53, 60), (60, None)]:
+        assert (list(map_lines(str(file), block_size=block_size, start=start, end=end))
+                == list(read_lines(str(file), block_size=block_size, start=start, end=end)))
+
+
+@pytest.mark.parametrize('engine', sorted(MERGE_ENGINES))
+def test_empty_inputs_are_skipped(tmp_path, engine):
+    (tmp_path / 'empty.txt').write_text('')
+    (tmp_path / 'blank.txt').write_text('\n  \n')
+    (tmp_path / 'data.txt').write_text('a\nb\n')
+    files = [str(tmp_path / name) for name in ['empty.txt', 'blank.txt', 'data.txt']]
+    write(str(tmp_path / 'out.txt'), MERGE_ENGINES[engine](files))
+    assert read(tmp_path / 'out.txt') == ['a', 'b']
+
+
+@pytest.mark.parametrize('engine', sorted(MERGE_ENGINES))
+def test_unsorted_input_stops_merge(tmp_path, capsys, engine):
+    (tmp_path / 'a.txt').write_text('a\nc\nb\n')
+    (tmp_path / 'b.txt').write_text('a\nd\n')
+    iterator = MERGE_ENGINES[engine]([str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt')])
+    assert [iterator.next(), iterator.next(), iterator.next()] == ['a', 'a', 'c']
+    with pytest.raises(ValueError, match=r'index:0 \[c\] followed by \[b\]'):
+        iterator.next()
+
+    # write reports the error & keeps lines merged before it.
+    write(str(tmp_path / 'out.txt'), MERGE_ENGINES[engine]([str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt')]))
+    assert 'Input File not sorted!' in capsys.readouterr().out
+    assert read(tmp_path / 'out.txt') == ['a', 'c']
+
+
+@pytest.mark.parametrize('file_count', [1, 3, 64, 200])
+def test_loser_tree_yields_heap_order(tmp_path, file_count):
+    rng = random.Random(file_count)
+    files = []
+    for index in range(file_count):
+        file = tmp_path / f'{index}.txt'
+        # few distinct lines, so ties across files are common.
+        file.write_text('\n'.join(sorted(rng.choice('abcdef') for _ in range(rng.randint(0, 50)))))
+        files.append(str(file))
+
+    def drain(iterator):
+        lines = []
+        try:
+            while True:
+                lines.append((iterator.next_bytes(), dict(iterator.last_read)))
+        except StopIteration:
+            return lines
+    assert drain(MERGE_ENGINES['loser'](files)) == drain(MergeIterator(files))
+
+
+@pytest.mark.parametrize('file_count, max_fan_in', [(12, 2), (12, 3), (10, 3), (30, 4), (5, 5)])
+def test_plan_pass_fits_final_merge(tmp_path, file_count, max_fan_in):
+    runs = []
+    for index in range(file_count):
+        run = tmp_path / f'{index}.txt'
+        run.write_text('a\n' * index)
+        runs.append(str(run))
+    passes = 0
+    while len(runs) > max_fan_in:
+        groups, kept = plan_pass(runs, max_fan_in)
+        assert all(2 <= len(group) <= max_fan_in for group in groups)
+        assert sorted(sum(groups, []) + kept) == sorted(runs)
+        passes += 1
+        runs = kept
+        for index, group in enumerate(groups):
+            run = tmp_path / f'run-{passes}-{index}'
+            run.write_text(''.join(open(file).read() for file in group))
+            runs.append(str(run))
+    assert passes <= file_count
+
+
+@pytest.mark.parametrize('file_count, max_fan_in, first', [(5, 4, 2), (7, 4, None), (8, 4, 2), (9, 4, 3), (10, 3, 2), (30, 4, 3)])
+def test_plan_pass_first_group_takes_fewest_smallest_runs(tmp_path, file_count, max_fan_in, first):
+    runs = []
+    for index in reversed(range(file_count)):
+        run = tmp_path / f'{index}.txt'
+        run.write_text('a\n' * (index + 1))
+        runs.append(str(run))
+    groups, kept = plan_pass(runs, max_fan_in)
+    # optimal merge pattern: first group just big enough, the rest full.
+    by_size = sorted(runs, key=os.path.getsize)
+    if first is not None:
+        assert groups[0] == by_size[:first]
+    assert all(len(group) == max_fan_in for group in groups[1 if first else 0:])
+    # runs left after the pass still need full groups only, down to exactly max_fan_in.
+    assert (len(kept) + len(groups) - max_fan_in) % (max_fan_in - 1) == 0
+
+
+@pytest.mark.parametrize('engine', sorted(MERGE_ENGINES))
+@pytest.mark.parametrize('max_fan_in, workers', [(2, 1), (3, 1), (4, 2), (100, 1)])
+def test_hierarchical_merge_matches_single_pass(tmp_path, engine, max_fan_in, workers):
+    (tmp_path / 'in').mkdir()
+    files, expected = write_inputs(str(tmp_path / 'in'), seed=max_fan_in, file_count=11, line_count=300)
+    merge_files(files, str(tmp_path / 'out.txt'), engine=engine, block_size=64, max_fan_in=max_fan_in,
+                workers=workers)
+    assert read(tmp_path / 'out.txt') == expected
+    # intermediate runs are cleaned up, inputs are kept.
+    assert sorted(os.listdir(tmp_path)) == ['in', 'out.txt']
+    assert len(os.listdir(tmp_path / 'in')) == 11
+
+
+def test_hierarchical_merge_unsorted_input_writes_nothing(tmp_path, capsys):
+    files = []
+    for index in range(5):
+        # smallest file, so it gets merged in an intermediate pass.
+        (tmp_path / f'{index}.txt').write_text('a\nc\nb\n' if index == 3 else f'{index}\n' * 10)
+        files.append(str(tmp_path / f'{index}.txt'))
+    merge_files(files, str(tmp_path / 'out.txt'), max_fan_in=2)
+    assert 'Input File not sorted!' in capsys.readouterr().out
+    assert not (tmp_path / 'out.txt').exists()
+    assert sorted(os.listdir(tmp_path)) == [f'{index}.txt' for index in range(5)]
+
+
+def test_seek_key_finds_first_line_not_below_key(tmp_path):
+    file = tmp_path / 'in.txt'
+    file.write_bytes(b'\n a\nb\n\n  \nb\nd \r\nf\n\n')
+    data = file.read_bytes()
+    with open(file, 'rb') as fh:
+        for key, rest in [(b'', b'a b b d f'), (b'a', b'a b b d f'), (b'b', b'b b d f'), (b'c', b'd f'),
+                          (b'f', b'f'), (b'g', b'')]:
+            offset = seek_key(fh, key, len(data))
+            assert b' '.join(line.strip() for line in data[offset:].split(b'\n') if line.strip()) == rest
+
+
+@pytest.mark.parametrize('engine', sorted(MERGE_ENGINES))
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('workers', [2, 5])
+def test_range_partitioned_merge_matches_sequential(tmp_path, engine, seed, workers):
+    files, expected = write_inputs(str(tmp_path), seed)
+    merge_ranges(files, str(tmp_path / 'out.txt'), engine=engine, block_size=64, workers=workers)
+    assert read(tmp_path / 'out.txt') == expected
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(file) for file in files] + ['out.txt'])
+
+
+@pytest.mark.parametrize('lines', [['a', 'c', 'b'], ['b', 'c'] * 500])
+def test_range_partitioned_merge_unsorted_input_like_sequential(tmp_path, capsys, lines):
+    (tmp_path / 'a.txt').write_text('\n'.join(lines))
+    (tmp_path / 'b.txt').write_text('\n'.join(sorted(lines)))
+    files = [str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt')]
+    write(str(tmp_path / 'sequential.txt'), MergeIterator(files))
+    sequential = capsys.readouterr().out
+    merge_ranges(files, str(tmp_path / 'out.txt'), workers=3)
+    assert read(tmp_path / 'out.txt') == read(tmp_path / 'sequential.txt')
+    error = [line for line in sequential.splitlines() if 'not sorted' in line]
+    assert error and error[0] in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('workers, compress', [(1, False), (3, True)])
+def test_sort_runs_merge_unsorted_inputs(tmp_path, workers, compress):
+    (tmp_path / 'in').mkdir()
+    (tmp_path / 'runs').mkdir()
+    files, expected = write_inputs(str(tmp_path / 'in'), seed=workers)
+    for file in files:
+        # unsort inputs, blank lines & padding stay.
+        with open(file) as fh:
+            lines = fh.readlines()
+        random.Random(file).shuffle(lines)
+        with open(file, 'w') as fh:
+            fh.writelines(lines)
+
+    runs = sort_runs(files, str(tmp_path / 'runs'), memory=1 << 10, workers=workers, compress=compress)
+    assert len(runs) > len(files)
+    assert all(run.endswith('.gz') == compress for run in runs)
+    merge_files(runs, str(tmp_path / 'out.txt'), max_fan_in=4, workers=workers)
+    assert read(tmp_path / 'out.txt') == expected
+
+
+@pytest.mark.parametrize('module, suffix', [(gzip, '.gz'), (bz2, '.bz2')])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_sort_runs_cuts_compressed_input_by_memory(tmp_path, module, suffix, workers):
+    (tmp_path / 'runs').mkdir()
+    rng = random.Random(2)
+    lines = [f'{rng.randint(0, 5000):05d}' for _ in range(20000)]
+    file = str(tmp_path / ('a.txt' + suffix))
+    with module.open(file, 'wt') as fh:
+        fh.write('\n'.join(lines))
+
+    memory = 64 << 10
+    runs = sort_runs([file], str(tmp_path / 'runs'), memory=memory, workers=workers)
+    # every run sorted from a chunk of at most memory / workers / 4 bytes.
+    assert len(runs) > 1
+    assert all(os.path.getsize(run) <= memory // workers // 4 for run in runs)
+    merge_files(runs, str(tmp_path / 'out.txt'))
+    assert read(tmp_path / 'out.txt') == sorted(set(lines))
+
+
+def test_read_ahead_yields_lines_and_applies_backpressure():
+    pulled = []
+
+    def lines():
+        for index in range(10000):
+            pulled.append(index)
+            yield index
+
+    ahead = read_ahead(lines(), depth=2, block_lines=10)
+    assert [next(ahead) for _ in range(5)] == list(range(5))
+    # reader waits once depth blocks are queued (plus the block being handed over & the one being filled).
+    threading.Event().wait(0.2)
+    assert len(pulled) <= 10 * 5
+    assert list(ahead) == list(range(5, 10000))
+
+
+def test_read_ahead_raises_reader_error_and_stops_on_close():
+    def failing():
+        yield b'a'
+        yield b'b'
+        raise OSError('disk gone')
+
+    ahead = read_ahead(failing(), depth=1, block_lines=1)
+    assert [next(ahead), next(ahead)] == [b'a', b'b']
+    with pytest.raises(OSError, match='disk gone'):
+        next(ahead)
+
+    closed = threading.Event()
+
+    def endless():
+        try:
+            while True:
+                yield b'x'
+        finally:
+            closed.set()
+
+    threads = threading.active_count()
+    ahead = read_ahead(endless(), depth=2, block_lines=4)
+    next(ahead)
+    ahead.close()
+    assert closed.is_set() and threading.active_count() == threads
+
+
+@pytest.mark.parametrize('suffix, module', [('.gz', gzip), ('.bz2', bz2), ('.xz', lzma)])
+@pytest.mark.parametrize('workers', [1, 3])
+def test_compressed_inputs_and_output(tmp_path, suffix, module, workers):
+    (tmp_path / 'in').mkdir()
+    files, expected = write_inputs(str(tmp_path / 'in'), seed=len(suffix))
+    for file in files[:3]:
+        # compression is detected by content, not name.
+        with open(file, 'rb') as fh:
+            data = fh.read()
+        with module.open(file, 'wb') as fh:
+            fh.write(data)
+
+    output_file = str(tmp_path / f'out.txt{suffix}')
+    merge_files(files, output_file, workers=workers, prefetch=workers - 1)
+    with module.open(output_file, 'rb') as fh:
+        assert fh.read().decode().splitlines() == expected
+
+    # range-partitioned merge of plain inputs concatenates compressed parts.
+    merge_files(files[3:], output_file, workers=workers)
+    with open_input(output_file) as fh:
+        assert fh.read().decode().splitlines() == sorted({line.strip() for file in files[3:] for line in read(file)}
+                                                         - {''})
+
+
+def write_keyed_inputs(path, key, file_count=4, line_count=300, seed=0):
+    '''
+    write CSV files sorted by key, each line unique, keys shared across files.
+
+    :return: list of input file paths, every line.
+    '''
+    rng = random.Random(seed)
+    files, lines = [], []
+    for index in range(file_count):
+        file_lines = [f'{rng.choice("xyz")}{index},{rng.randint(-50, 50)},{rng.choice("abc")},{line}'
+                      for line in range(rng.randint(0, line_count))]
+        file_lines.sort(key=lambda line: key(line.encode()))
+        file = os.path.join(path, f'input_{index}.csv')
+        with open(file, 'w') as fh:
+            fh.write('\n'.join(file_lines))
+        files.append(file)
+        lines += file_lines
+    return files, lines
+
+
+@pytest.mark.parametrize('columns, numeric', [([1], True), ([2, 1], False), ([2], False)])
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('max_fan_in', [None, 2, 3])
+def test_key_merge_keeps_first_line_per_key(tmp_path, columns, numeric, descending, max_fan_in):
+    key = LineKey(columns, numeric=numeric, descending=descending)
+    files, lines = write_keyed_inputs(str(tmp_path), key)
+    merge_files(files, str(tmp_path / 'out.txt'), max_fan_in=max_fan_in, key=key)
+    output = read(tmp_path / 'out.txt')
+
+    keys = [key(line.encode()) for line in output]
+    assert all(keys[index] < keys[index + 1] for index in range(len(keys) - 1))
+    assert len(keys) == len({tuple(line.split(',')[column] for column in columns) for line in lines})
+    # first line of a key is the one of the lowest file index, intermediate passes included.
+    first = {}
+    for line in lines:
+        first.setdefault(tuple(line.split(',')[column] for column in columns), line)
+    assert output == [first[tuple(line.split(',')[column] for column in columns)] for line in output]
+
+
+def test_key_merge_parses_each_line_once_and_checks_key_order(tmp_path):
+    calls = []
+
+    class CountingKey(LineKey):
+        def __call__(self, line):
+            calls.append(line)
+            return super().__call__(line)
+
+    (tmp_path / 'a.csv').write_text('x,1\na,2\nb,10\n')
+    (tmp_path / 'b.csv').write_text('c,3\nd,4\n')
+    iterator = KeyMergeIterator([str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')], key=CountingKey([1], numeric=True))
+    assert [iterator.next() for _ in range(5)] == ['x,1', 'a,2', 'c,3', 'd,4', 'b,10']
+    assert len(calls) == 5
+
+    (tmp_path / 'c.csv').write_text('a,2\nb,1\n')
+    iterator = KeyMergeIterator([str(tmp_path / 'c.csv')], key=LineKey([1], numeric=True))
+    assert iterator.next() == 'a,2'
+    with pytest.raises(ValueError, match=r'index:0 \[a,2\] followed by \[b,1\]'):
+        iterator.next()
+
+
+def test_sort_runs_by_key(tmp_path):
+    key = LineKey([1], delimiter=b'\t', numeric=True, descending=True)
+    (tmp_path / 'in').mkdir()
+    (tmp_path / 'runs').mkdir()
+    rng = random.Random(0)
+    lines = [f'{rng.choice("ab")}\t{rng.randint(0, 200)}' for _ in range(1000)]
+    (tmp_path / 'in' / 'a.tsv').write_text('\n'.join(lines))
+    runs = sort_runs([str(tmp_path / 'in' / 'a.tsv')], str(tmp_path / 'runs'), memory=1 << 10, key=key)
+    merge_files(runs, str(tmp_path / 'out.txt'), key=key)
+    assert [int(line.split('\t')[1]) for line in read(tmp_path / 'out.txt')] == sorted(
+        {int(line.split('\t')[1]) for line in lines}, reverse=True)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_sort_runs_by_key_keeps_first_line_per_key(tmp_path, workers):
+    key = LineKey([1], numeric=True)
+    (tmp_path / 'in').mkdir()
+    (tmp_path / 'runs').mkdir()
+    rng = random.Random(1)
+    lines = [f'{rng.choice("abcdefgh")}{index % 7},{rng.randint(0, 40)}' for index in range(2000)]
+    (tmp_path / 'in' / 'a.csv').write_text('\n'.join(lines))
+    runs = sort_runs([str(tmp_path / 'in' / 'a.csv')], str(tmp_path / 'runs'), memory=16 << 10, workers=workers,
+                     key=key)
+    assert len(runs) > 1
+    merge_files(runs, str(tmp_path / 'out.txt'), max_fan_in=2, key=key)
+
+    # same output whatever the hash seed: the first line read per key.
+    first = {}
+    for line in lines:
+        first.setdefault(int(line.split(',')[1]), line)
+    assert read(tmp_path / 'out.txt') == [first[number] for number in sorted(first)]
+
+
+@pytest.mark.parametrize('low, high', [('b', 'cc'), (None, 'b'), ('d', None), ('bbb', 'bbb'), ('f', 'g'), ('', 'a')])
+@pytest.mark.parametrize('seed', range(3))
+def test_extract_range_matches_filtered_merge(tmp_path, low, high, seed):
+    files, expected = write_inputs(str(tmp_path), seed)
+    extract(files, str(tmp_path / 'out.txt'), low=None if low is None else low.encode(),
+            high=None if high is None else high.encode(), block_size=16)
+    assert read(tmp_path / 'out.txt') == [line for line in expected
+                                          if (low is None or line >= low) and (high is None or line <= high)]
+
+
+def test_extract_reads_only_the_range(tmp_path, monkeypatch):
+    file = tmp_path / 'in.txt'
+    file.write_text(''.join(f'{index:06d}\n' for index in range(100000)))
+    reads = []
+    original = merge.read_lines
+
+    def counting(file, block_size=1 << 20, start=0, end=None):
+        reads.append(end - start)
+        return original(file, block_size=block_size, start=start, end=end)
+    monkeypatch.setitem(merge.READERS, 'read', counting)
+
+    extract([str(file)], str(tmp_path / 'out.txt'), low=b'050000', high=b'050009')
+    assert read(tmp_path / 'out.txt') == [f'{index:06d}' for index in range(50000, 50010)]
+    assert reads == [70]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 16, 1 << 20])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_validate_reports_every_unsorted_line(tmp_path, chunk_size, workers):
+    (tmp_path / 'sorted.txt').write_text('a\nb\n\nb\nc\n')
+    (tmp_path / 'unsorted.txt').write_text('b\n\n  a \nc\n\nd\n\tc\r\ne\na')
+    with gzip.open(tmp_path / 'unsorted.gz', 'wb') as fh:
+        fh.write(b'x\ny\nx\n')
+    files = [str(tmp_path / name) for name in ['sorted.txt', 'unsorted.txt', 'unsorted.gz']]
+    assert validate(files, workers=workers, chunk_size=chunk_size) == {
+        files[1]: [(3, b'b', b'a'), (7, b'd', b'c'), (9, b'e', b'a')],
+        files[2]: [(3, b'y', b'x')],
+    }
+
+
+def test_validate_by_key(tmp_path):
+    (tmp_path / 'a.tsv').write_text('x\t3\ny\t2\nz\t10\nw\t1\n')
+    key = LineKey([1], delimiter=b'\t', numeric=True, descending=True)
+    assert validate([str(tmp_path / 'a.tsv')], key=key, chunk_size=4) == {
+        str(tmp_path / 'a.tsv'): [(3, b'y\t2', b'z\t10')]}
+
+
+def test_segment_store_levels_and_reader(tmp_path):
+    (tmp_path / 'store').mkdir()
+    store = SegmentStore.load(str(tmp_path / 'store'), base_size=64, ratio=2)
+    expected = set()
+    for index in range(12):
+        files, lines = write_inputs(str(tmp_path), seed=index, file_count=2, line_count=20)
+        store.add(files)
+        expected.update(lines)
+
+        reloaded = SegmentStore.load(str(tmp_path / 'store'))
+        assert [line.decode() for line in reloaded.lines()] == sorted(expected)
+        # every level within its size limit but the top one, no stray segments.
+        assert all(os.path.getsize(reloaded.path(name)) <= reloaded.limit(level)
+                   for level, name in enumerate(reloaded.levels[:-1]) if name is not None)
+        assert sorted(name for name in os.listdir(tmp_path / 'store') if name.startswith('segment-')) == sorted(
+            name for name in reloaded.levels if name is not None)
+    assert len(store.levels) > 2
+
+    store.write(str(tmp_path / 'out.txt'))
+    assert read(tmp_path / 'out.txt') == sorted(expected)
+
+
+def test_segment_store_keeps_state_on_unsorted_delta(tmp_path):
+    store = SegmentStore.load(str(tmp_path / 'store'))
+    (tmp_path / 'a.txt').write_text('a\nc\n')
+    (tmp_path / 'b.txt').write_text('c\nb\n')
+    store.add([str(tmp_path / 'a.txt')])
+    (tmp_path / 'store' / 'segment-999999.txt').write_text('left over')
+    with pytest.raises(ValueError, match='not sorted'):
+        store.add([str(tmp_path / 'b.txt')])
+
+    store = SegmentStore.load(str(tmp_path / 'store'))
+    assert list(store.lines()) == [b'a', b'c']
+    assert sorted(os.listdir(tmp_path / 'store')) == ['manifest.json', 'segment-000000.txt']
+
+
+@pytest.mark.parametrize('shard_size, index_every', [(1, 1), (50, 3), (200, 16), (1 << 20, 1024)])
+def test_shards_and_lookup(tmp_path, shard_size, index_every):
+    (tmp_path / 'in').mkdir()
+    files, expected = write_inputs(str(tmp_path / 'in'), seed=index_every, line_count=300)
+    output_file = str(tmp_path / 'out.txt')
+    # shards of an earlier, longer output get removed.
+    (tmp_path / 'out.txt.99999').write_text('stale')
+    write_shards(output_file, MergeIterator(files), shard_size=shard_size, index_every=index_every, batch_size=7)
+
+    shards = sorted(name for name in os.listdir(tmp_path) if name.startswith('out.txt.') and name[-1].isdigit())
+    assert sum((read(tmp_path / name) for name in shards), []) == expected
+    # shards get cut at the first index point past shard_size, lines take up to 7 bytes.
+    assert all(os.path.getsize(tmp_path / name) < shard_size + 7 * index_every for name in shards)
+
+    shard_index = ShardIndex.load(output_file)
+    assert len(shard_index.lines) == -(-len(expected) // index_every)
+    for line in expected[::7] + ['', 'a', 'abcdee', 'zz', 'eeeeeee']:
+        assert shard_index.contains(line.encode()) == (line in expected)
+    for prefix in ['', 'a', 'ab', 'eee', 'cab', 'f']:
+        assert shard_index.prefix(prefix.encode()) == [line.encode() for line in expected if line.startswith(prefix)]
+
+
+def test_lookup_reads_one_bounded_block(tmp_path, monkeypatch):
+    file = tmp_path / 'in.txt'
+    file.write_text(''.join(f'{index:06d}\n' for index in range(100000)))
+    output_file = str(tmp_path / 'out.txt')
+    write_shards(output_file, MergeIterator([str(file)]), shard_size=100000, index_every=100)
+
+    shard_index = ShardIndex.load(output_file)
+    reads = []
+    original = ShardIndex.read
+
+    def counting(self, first, last):
+        lines = original(self, first, last)
+        reads.append(len(lines))
+        return lines
+    monkeypatch.setattr(ShardIndex, 'read', counting)
+    assert shard_index.contains(b'054321') and not shard_index.contains(b'0543210')
+    assert reads == [100, 100]
+    assert shard_index.prefix(b'0543') == [f'0543{index:02d}'.encode() for index in range(100)]